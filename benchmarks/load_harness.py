@@ -0,0 +1,401 @@
+"""
+Load-testing harness for the web app's step endpoints.
+
+Drives the real ``generate-step``/``left-step``/``right-step``/``save-step`` flow of the
+Django app for N simulated users, each with its own session, against the offline fake
+LLM (``core/fake_llm.py``) with a configurable latency. Reports throughput, latency
+percentiles per endpoint, database and session writes, and errors::
+
+    python benchmarks/load_harness.py --users 20 --runs 3 --latency 0.5
+
+By default a synthetic three-step pipeline and a throwaway SQLite database are created
+in a temporary directory. Use ``--pipeline-dir`` to run against a real ``inputs/`` and
+``prompts/`` tree instead.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+WEB_APP_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "../src/job_docs_automation/web_app")
+)
+
+JOB_DESCRIPTION = """
+Acme Analytics is hiring a Senior Data Engineer to build and maintain batch and
+streaming data pipelines. Requirements: 5+ years of Python, SQL, Airflow, Spark,
+experience with cloud data warehouses and a collaborative mindset.
+""".strip()
+
+SAMPLE_PIPELINE = {
+    "inputs": {
+        "experience": "Five years building data pipelines in Python, Spark and Airflow.",
+        "education": "MSc in Computer Science.",
+    },
+    "prompts": [
+        (
+            "find_company",
+            "Job description:\n<job_description>",
+            {"company": "Name of the company", "summary": "What the company does"},
+        ),
+        (
+            "analyze_job",
+            "Company: <find_company.company>\n\nJob description:\n<job_description>",
+            {"requirements": "Key requirements of the role"},
+        ),
+        (
+            "write_cover_letter",
+            "Experience:\n<experience>\n\nEducation:\n<education>\n\n"
+            "Company: <find_company.summary>\nRequirements: <analyze_job.requirements>",
+            {"cover_letter": "The cover letter"},
+        ),
+    ],
+}
+
+
+def write_sample_pipeline(base_dir: str) -> None:
+    """
+    Writes a small pipeline in the ``inputs/`` and ``prompts/`` layout read by ``read_files``.
+
+    Parameters
+    ----------
+    base_dir : str
+        The directory to write the pipeline to.
+    """
+    os.makedirs(os.path.join(base_dir, "inputs"), exist_ok=True)
+    os.makedirs(os.path.join(base_dir, "outputs"), exist_ok=True)
+    inputs: Dict[str, str] = SAMPLE_PIPELINE["inputs"]  # type: ignore[assignment]
+    with open(os.path.join(base_dir, "inputs", "inputs.txt"), "w", encoding="utf-8") as file:
+        file.write("\n".join(inputs))
+    for name, value in inputs.items():
+        with open(os.path.join(base_dir, "inputs", f"{name}.txt"), "w", encoding="utf-8") as file:
+            file.write(value)
+    names = []
+    for name, prompt_input, fields in SAMPLE_PIPELINE["prompts"]:  # type: ignore[misc]
+        names.append(name)
+        prompt_dir = os.path.join(base_dir, "prompts", name)
+        os.makedirs(prompt_dir, exist_ok=True)
+        schema = {
+            "type": "object",
+            "properties": {
+                "reason": {"type": "string", "description": "Reasoning before the answer"},
+                **{
+                    field: {"type": "string", "description": description}
+                    for field, description in fields.items()
+                },
+            },
+            "required": ["reason", *fields],
+            "additionalProperties": False,
+        }
+        with open(os.path.join(prompt_dir, "prompt.txt"), "w", encoding="utf-8") as file:
+            file.write(f"You are an assistant that performs the {name} step.")
+        with open(os.path.join(prompt_dir, "input.txt"), "w", encoding="utf-8") as file:
+            file.write(prompt_input)
+        with open(os.path.join(prompt_dir, "schema.json"), "w", encoding="utf-8") as file:
+            json.dump(schema, file)
+    with open(os.path.join(base_dir, "inputs", "prompts_2.txt"), "w", encoding="utf-8") as file:
+        file.write("\n".join(names))
+
+
+def setup_django(
+    work_dir: str, db_path: str, latency: float, session_engine: Optional[str] = None
+) -> None:
+    """
+    Configures the environment and Django to run the web app against the fake LLM.
+
+    Parameters
+    ----------
+    work_dir : str
+        The working directory holding ``inputs/``, ``prompts/`` and ``outputs/``.
+    db_path : str
+        The path of the throwaway SQLite database.
+    latency : float
+        The mean latency of a fake LLM call in seconds.
+    session_engine : Optional[str], optional
+        Overrides ``SESSION_ENGINE``, by default None.
+    """
+    os.chdir(work_dir)
+    os.environ["JDA_FAKE_LLM"] = "1"
+    os.environ["JDA_FAKE_LLM_LATENCY"] = str(latency)
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "web_app.settings")
+    sys.path.insert(0, WEB_APP_DIR)
+
+    import django
+    from django.conf import settings
+
+    # Never touch the development database
+    settings.DATABASES["default"]["NAME"] = db_path
+    settings.ALLOWED_HOSTS = ["*"]
+    if session_engine:
+        settings.SESSION_ENGINE = session_engine
+    django.setup()
+
+    from django.core.management import call_command
+
+    call_command("migrate", run_syncdb=True, verbosity=0)
+
+
+class Stats:
+    """
+    Thread-safe collector of request latencies, errors and database writes.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.db_writes = 0
+        self.session_writes = 0
+        self.queries = 0
+        self.runs = 0
+
+    def record(self, endpoint: str, seconds: float, ok: bool) -> None:
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def count_query(self, sql: str) -> None:
+        statement = sql.lstrip().split(" ", 1)[0].upper()
+        with self.lock:
+            self.queries += 1
+            if statement in ("INSERT", "UPDATE", "DELETE", "REPLACE"):
+                self.db_writes += 1
+                if "django_session" in sql:
+                    self.session_writes += 1
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    # Nearest-rank percentile
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def simulate_user(user_idx: int, runs: int, retry_rate: float, stats: Stats, seed: int) -> None:
+    """
+    Runs the full step flow ``runs`` times with its own session.
+
+    Parameters
+    ----------
+    user_idx : int
+        The index of the simulated user.
+    runs : int
+        The number of generation runs to perform.
+    retry_rate : float
+        The probability of retrying a step and browsing its options with left/right.
+    stats : Stats
+        The collector for the results.
+    seed : int
+        The seed of the user's random generator.
+    """
+    from django.db import connection
+    from django.test import Client
+
+    rng = random.Random(seed + user_idx)
+    client = Client()
+
+    def wrapper(execute, sql, params, many, context):
+        stats.count_query(sql)
+        return execute(sql, params, many, context)
+
+    def call(endpoint: str, body: Optional[Dict[str, Any]] = None, method: str = "post") -> Any:
+        start = time.perf_counter()
+        try:
+            if method == "get":
+                response = client.get(endpoint)
+            else:
+                response = client.post(
+                    endpoint, json.dumps(body or {}), content_type="application/json"
+                )
+            ok = response.status_code < 400
+        except Exception:  # noqa: BLE001 - every failure counts as an error
+            response, ok = None, False
+        stats.record(endpoint, time.perf_counter() - start, ok)
+        if not ok or response is None or response.get("Content-Type") != "application/json":
+            return None
+        return response.json()
+
+    with connection.execute_wrapper(wrapper):
+        for _ in range(runs):
+            call("/", method="get")
+            data = call("/generate-step/", {"job_description": JOB_DESCRIPTION})
+            while data is not None:
+                if rng.random() < retry_rate:
+                    data = call("/generate-step/", {"retry": True})
+                    if data is not None and data["option_count"] > 1:
+                        call("/left-step/")
+                        call("/right-step/")
+                if data is None or data["next_step"] is None:
+                    break
+                data = call("/generate-step/")
+            if data is not None:
+                call("/save-step/")
+                with stats.lock:
+                    stats.runs += 1
+    connection.close()
+
+
+def _write_behind_counters() -> Tuple[int, int]:
+    from django.conf import settings
+
+    if settings.SESSION_ENGINE != "apps.jda.session_backend":
+        return 0, 0
+    from apps.jda.session_backend import BUFFER
+
+    BUFFER.flush()
+    return BUFFER.flushes, BUFFER.rows_written
+
+
+def run_load_test(
+    users: int, runs: int, retry_rate: float = 0.3, seed: int = 0
+) -> Dict[str, Any]:
+    """
+    Runs the simulated users concurrently and summarizes the results.
+
+    Django must already be configured, see :func:`setup_django`.
+
+    Parameters
+    ----------
+    users : int
+        The number of concurrent simulated users.
+    runs : int
+        The number of generation runs per user.
+    retry_rate : float, optional
+        The probability of retrying a step, by default 0.3.
+    seed : int, optional
+        The seed for the simulated choices, by default 0.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The report with throughput, latency percentiles, writes and errors.
+    """
+    from django.test import Client
+
+    # The first request imports the URLconf and the views, keep it out of the numbers
+    Client().get("/")
+
+    flushes_before, rows_before = _write_behind_counters()
+    stats = Stats()
+    threads = [
+        threading.Thread(target=simulate_user, args=(idx, runs, retry_rate, stats, seed))
+        for idx in range(users)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    # Sessions persisted in batches by the write-behind session engine
+    flushes, rows = _write_behind_counters()
+    stats.db_writes += flushes - flushes_before
+    stats.session_writes += rows - rows_before
+
+    all_latencies = [value for values in stats.latencies.values() for value in values]
+    requests = len(all_latencies)
+    return {
+        "users": users,
+        "runs_per_user": runs,
+        "elapsed_s": elapsed,
+        "requests": requests,
+        "completed_runs": stats.runs,
+        "throughput_rps": requests / elapsed if elapsed else 0.0,
+        "runs_per_s": stats.runs / elapsed if elapsed else 0.0,
+        "errors": sum(stats.errors.values()),
+        "session_engine": _session_engine(),
+        "db_queries": stats.queries,
+        "db_writes": stats.db_writes,
+        "session_writes": stats.session_writes,
+        "latency_ms": {
+            endpoint: {
+                "count": len(values),
+                "errors": stats.errors.get(endpoint, 0),
+                "p50": percentile(values, 50) * 1000,
+                "p95": percentile(values, 95) * 1000,
+                "p99": percentile(values, 99) * 1000,
+            }
+            for endpoint, values in sorted(stats.latencies.items())
+            + [("all", all_latencies)]
+        },
+    }
+
+
+def _session_engine() -> str:
+    from django.conf import settings
+
+    return settings.SESSION_ENGINE
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [
+        f"users={report['users']} runs/user={report['runs_per_user']} "
+        f"elapsed={report['elapsed_s']:.2f}s session engine={report['session_engine']}",
+        f"requests={report['requests']} throughput={report['throughput_rps']:.1f} req/s "
+        f"completed runs={report['completed_runs']} ({report['runs_per_s']:.2f} runs/s)",
+        f"errors={report['errors']} db queries={report['db_queries']} "
+        f"db writes={report['db_writes']} session writes={report['session_writes']}",
+        "",
+        f"{'endpoint':<20}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}",
+    ]
+    for endpoint, row in report["latency_ms"].items():
+        lines.append(
+            f"{endpoint:<20}{row['count']:>8}{row['errors']:>8}"
+            f"{row['p50']:>10.1f}{row['p95']:>10.1f}{row['p99']:>10.1f}"
+        )
+    return "\n".join(lines)
+
+
+def parse_args(args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load test the step endpoints with a fake LLM")
+    parser.add_argument("--users", type=int, default=10, help="concurrent simulated users")
+    parser.add_argument("--runs", type=int, default=1, help="generation runs per user")
+    parser.add_argument(
+        "--latency", type=float, default=0.2, help="mean fake LLM latency in seconds"
+    )
+    parser.add_argument(
+        "--retry-rate", type=float, default=0.3, help="probability of retrying a step"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="seed for the simulated choices")
+    parser.add_argument(
+        "--pipeline-dir",
+        help="directory with inputs/ and prompts/ (default: a synthetic pipeline)",
+    )
+    parser.add_argument(
+        "--session-engine",
+        help="override SESSION_ENGINE, e.g. apps.jda.session_backend",
+    )
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args(args)
+
+
+def main(args: List[str]) -> None:
+    parsed = parse_args(args)
+    with tempfile.TemporaryDirectory(prefix="jda-load-") as tmp_dir:
+        work_dir = parsed.pipeline_dir or tmp_dir
+        if not parsed.pipeline_dir:
+            write_sample_pipeline(tmp_dir)
+        os.makedirs(os.path.join(work_dir, "outputs"), exist_ok=True)
+        setup_django(
+            work_dir,
+            os.path.join(tmp_dir, "load_test.sqlite3"),
+            parsed.latency,
+            parsed.session_engine,
+        )
+        report = run_load_test(parsed.users, parsed.runs, parsed.retry_rate, parsed.seed)
+    print(json.dumps(report, indent=2) if parsed.json else format_report(report))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,77 @@
+"""
+Measures the provider prompt-cache hit rate of the message layout.
+
+Sends the same profile with a series of job descriptions through the offline client,
+which simulates the provider's prefix cache, once with the blocks in template order and
+once with the prefix-stable layout, and reports prompt and cached tokens::
+
+    python benchmarks/prompt_cache_bench.py --jobs 20
+"""
+
+import argparse
+import os
+import sys
+from typing import Dict, List
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src/job_docs_automation/core"))
+
+os.environ["JDA_FAKE_LLM"] = "1"
+os.environ.setdefault("JDA_FAKE_LLM_LATENCY", "0")
+
+from backend import Prompt, generate_text  # noqa: E402
+
+SCHEMA = {
+    "type": "object",
+    "properties": {"cover_letter": {"type": "string"}},
+    "required": ["cover_letter"],
+    "additionalProperties": False,
+}
+
+INSTRUCTIONS = "Write a one-page cover letter for the job, based only on the candidate's profile."
+
+# The interleaved template of the original prompts: the posting comes before the profile
+PROMPT_INPUT = (
+    "Job description:\n<job_description>\n\nExperience:\n<experience>\n\n"
+    "Education:\n<education>\n\nCompany: <find_company.company>"
+)
+
+EXPERIENCE = "\n".join(
+    f"- {role} at company {idx}: built data pipelines, dashboards and APIs for {idx * 3} teams"
+    for idx, role in enumerate(["Data Engineer", "Backend Developer", "Analyst"] * 20)
+)
+EDUCATION = "- MSc Computer Science\n- BSc Mathematics\n- AWS Certified Data Analytics"
+
+
+def run(layout: str, jobs: int) -> Dict[str, int]:
+    prompt = Prompt(f"write_cover_letter_{layout}", INSTRUCTIONS, PROMPT_INPUT, SCHEMA)
+    # No volatile keys keeps the template order, as before the prefix-stable layout
+    volatile = ["job_description", "find_company"] if layout == "stable" else []
+    totals = {"prompt_tokens": 0, "cached_tokens": 0}
+    for idx in range(jobs):
+        replacements = {
+            "job_description": f"Posting {idx}: data engineer with Spark, Airflow and SQL. " * 5,
+            "experience": EXPERIENCE,
+            "education": EDUCATION,
+            "find_company": {"company": f"Company {idx}"},
+        }
+        usage: Dict[str, int] = {}
+        generate_text("fake", prompt, replacements, volatile=volatile, usage=usage)
+        for key in totals:
+            totals[key] += usage[key]
+    return totals
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=20, help="job descriptions per layout")
+    args = parser.parse_args(argv)
+
+    print(f"{'layout':<14}{'prompt':>10}{'cached':>10}{'cached %':>10}")
+    for layout in ("interleaved", "stable"):
+        totals = run(layout, args.jobs)
+        share = 100 * totals["cached_tokens"] / totals["prompt_tokens"]
+        print(f"{layout:<14}{totals['prompt_tokens']:>10}{totals['cached_tokens']:>10}{share:>9.1f}%")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
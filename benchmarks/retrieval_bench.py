@@ -0,0 +1,122 @@
+"""
+Measures the prompt tokens saved by ``<field|relevant>`` placeholders.
+
+Renders the same prompt input once with whole profile fields (``<experience>``) and once
+with BM25-selected chunks (``<experience|relevant>``) for a set of job descriptions, and
+reports tokens per run, tokens saved and the retrieval time::
+
+    python benchmarks/retrieval_bench.py --top-k 5
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import List
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src/job_docs_automation/core"))
+
+from backend import replace_placeholders  # noqa: E402
+from retrieval import estimate_tokens  # noqa: E402
+
+EXPERIENCE = """
+Senior Data Engineer, Northwind (2021-2024):
+- Designed batch and streaming pipelines with Airflow, Spark and Kafka processing 2 TB per day
+- Migrated the data warehouse from on-premise PostgreSQL to Snowflake, cutting costs by 30%
+- Built dbt models and data quality checks used by 40 analysts
+- Mentored four junior engineers and ran the data platform guild
+
+Data Engineer, Contoso (2018-2021):
+- Developed Python ETL services on AWS Lambda, Glue and Redshift
+- Implemented CDC ingestion from MySQL with Debezium into S3 data lake
+- Reduced nightly job runtime from six hours to 40 minutes by partitioning tables
+- Created Terraform modules for the analytics infrastructure
+
+Backend Developer, Fabrikam (2016-2018):
+- Built REST APIs with Django and Django REST framework serving 5 million requests a day
+- Wrote React dashboards for the sales team
+- Maintained CI pipelines with Jenkins and Docker
+
+Research Assistant, University Lab (2014-2016):
+- Trained computer vision models with TensorFlow for medical imaging
+- Published two papers on semi-supervised segmentation
+- Taught the introductory machine learning course labs
+
+Freelance (2012-2014):
+- Built WordPress sites and e-commerce shops for local businesses
+- Photographed weddings and events
+- Organised a local Python meetup with 200 members
+""".strip()
+
+EDUCATION = """
+- MSc Computer Science, Technical University, thesis on distributed stream processing
+- BSc Mathematics, minor in Statistics
+- AWS Certified Data Analytics Specialty
+- Databricks Certified Spark Developer
+- Google Professional Machine Learning Engineer
+- Scrum Master certification
+- Spanish (native), English (C2), German (B1)
+""".strip()
+
+JOB_DESCRIPTIONS = [
+    "Data Engineer to build Airflow and Spark pipelines on AWS with Snowflake and dbt. "
+    "Experience with Kafka streaming and data quality frameworks is a plus.",
+    "Machine Learning Engineer for computer vision in healthcare. TensorFlow or PyTorch, "
+    "model training at scale, publications are a plus.",
+    "Full-stack developer with Django REST framework and React, Docker and CI/CD.",
+    "Analytics engineer: dbt, Snowflake, SQL modelling, mentoring analysts on best practices.",
+]
+
+FULL_INPUT = "Experience:\n<experience>\n\nEducation:\n<education>\n\nJob:\n<job_description>"
+RELEVANT_INPUT = (
+    "Experience:\n<experience|relevant:{k}>\n\nEducation:\n<education|relevant:{k}>"
+    "\n\nJob:\n<job_description>"
+)
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--top-k", type=int, default=5, help="chunks kept per field")
+    parser.add_argument(
+        "--prompts-per-run",
+        type=int,
+        default=3,
+        help="prompts per run that include the profile fields",
+    )
+    args = parser.parse_args(argv)
+
+    relevant_input = RELEVANT_INPUT.format(k=args.top_k)
+    print(f"{'job':<5}{'full':>8}{'relevant':>10}{'saved':>8}{'saved %':>9}{'cold ms':>9}{'warm ms':>9}")
+    total_full = total_relevant = 0
+    for idx, job_description in enumerate(JOB_DESCRIPTIONS):
+        replacements = {
+            "experience": EXPERIENCE,
+            "education": EDUCATION,
+            "job_description": job_description,
+        }
+        full = estimate_tokens(replace_placeholders(FULL_INPUT, replacements))
+        # Edit the profile so the first render tokenizes the new chunks (a profile change)
+        replacements["experience"] = EXPERIENCE + f"\n- Side project {idx}"
+        start = time.perf_counter()
+        rendered = replace_placeholders(relevant_input, replacements)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        replace_placeholders(relevant_input, replacements)
+        warm = time.perf_counter() - start
+        reduced = estimate_tokens(rendered)
+        total_full += full
+        total_relevant += reduced
+        print(
+            f"{idx:<5}{full:>8}{reduced:>10}{full - reduced:>8}"
+            f"{100 * (full - reduced) / full:>8.1f}%{cold * 1000:>9.2f}{warm * 1000:>9.2f}"
+        )
+    runs = len(JOB_DESCRIPTIONS)
+    saved_per_run = (total_full - total_relevant) * args.prompts_per_run / runs
+    print(
+        f"\nTokens saved per run ({args.prompts_per_run} prompts with profile fields): "
+        f"{saved_per_run:.0f} ({100 * (total_full - total_relevant) / total_full:.1f}%)"
+    )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
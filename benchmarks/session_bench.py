@@ -0,0 +1,63 @@
+"""
+Compares step-request latency of the session engines under concurrent load.
+
+Runs :mod:`load_harness` once per session engine, each in its own process, and prints
+the latency percentiles of ``/generate-step/`` and of all requests side by side::
+
+    python benchmarks/session_bench.py --users 50 --runs 2 --latency 0.2
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+HARNESS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "load_harness.py")
+
+ENGINES = {
+    "database": "django.contrib.sessions.backends.db",
+    "write-behind": "apps.jda.session_backend",
+}
+
+
+def run_harness(engine: str, args: argparse.Namespace) -> Dict[str, Any]:
+    command = [
+        sys.executable,
+        HARNESS,
+        "--json",
+        f"--users={args.users}",
+        f"--runs={args.runs}",
+        f"--latency={args.latency}",
+        f"--session-engine={engine}",
+    ]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=50, help="concurrent simulated users")
+    parser.add_argument("--runs", type=int, default=2, help="generation runs per user")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake LLM latency (s)")
+    args = parser.parse_args(argv)
+
+    print(f"{args.users} users, {args.runs} runs each, fake LLM latency {args.latency}s\n")
+    header = (
+        f"{'engine':<14}{'req/s':>8}{'errors':>8}{'writes':>8}"
+        f"{'step p50':>10}{'step p95':>10}{'step p99':>10}{'all p99':>10}"
+    )
+    print(header)
+    for label, engine in ENGINES.items():
+        report = run_harness(engine, args)
+        step = report["latency_ms"]["/generate-step/"]
+        print(
+            f"{label:<14}{report['throughput_rps']:>8.1f}{report['errors']:>8}"
+            f"{report['db_writes']:>8}{step['p50']:>10.1f}{step['p95']:>10.1f}"
+            f"{step['p99']:>10.1f}{report['latency_ms']['all']['p99']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,104 @@
+"""
+Measures the startup cost of the core modules, the Django app and the command line.
+
+Every target runs in a fresh interpreter, several times, and the best wall-clock time is
+reported together with the slowest imports from ``python -X importtime``::
+
+    python benchmarks/startup_bench.py --repeat 5 --top 10
+
+The exit code is 1 when a target imports ``openai``, ``docx`` or ``tiktoken`` while
+booting, or boots slower than ``--budget-ms``, so CI catches startup regressions.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CORE_DIR = os.path.join(ROOT, "src/job_docs_automation/core")
+WEB_APP_DIR = os.path.join(ROOT, "src/job_docs_automation/web_app")
+
+# Code run by each target, the Django one boots the app and imports the views like a worker
+TARGETS: Dict[str, Tuple[str, str]] = {
+    "core": (CORE_DIR, "import backend"),
+    "cli": (ROOT, "from job_docs_automation.skeleton import main; main(['--version'])"),
+    "django": (
+        WEB_APP_DIR,
+        "import os, django; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'web_app.settings');"
+        " django.setup(); import web_app.urls",
+    ),
+}
+
+# Modules that must never be imported while booting
+HEAVY_MODULES = ("openai", "docx", "tiktoken")
+
+
+def run(directory: str, code: str, importtime: bool = False) -> Tuple[float, str]:
+    """
+    Runs code in a fresh interpreter.
+
+    Returns
+    -------
+    Tuple[float, str]
+        The wall-clock time in seconds and the standard error output.
+    """
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([directory, os.path.join(ROOT, "src")])}
+    start = time.perf_counter()
+    result = subprocess.run(
+        command, cwd=directory, env=env, capture_output=True, text=True, check=True
+    )
+    return time.perf_counter() - start, result.stderr
+
+
+def slowest_imports(stderr: str, top: int) -> List[Tuple[int, str]]:
+    """
+    Parses ``-X importtime`` output into the modules with the highest cumulative time.
+
+    Returns
+    -------
+    List[Tuple[int, str]]
+        The cumulative microseconds and the name of each module, slowest first.
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # Only top-level imports, nested ones are part of their parent's cumulative time
+        if name.startswith(" ") and not name.startswith("  "):
+            entries.append((int(cumulative), name.strip()))
+    return sorted(entries, reverse=True)[:top]
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="cold boots per target")
+    parser.add_argument("--top", type=int, default=8, help="slowest imports shown per target")
+    parser.add_argument("--budget-ms", type=float, default=0, help="fail above this boot time")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for target, (directory, code) in TARGETS.items():
+        best = min(run(directory, code)[0] for _ in range(args.repeat))
+        _, stderr = run(directory, code, importtime=True)
+        imported = {line.rsplit("|", 1)[-1].strip() for line in stderr.splitlines()}
+        heavy = [module for module in HEAVY_MODULES if module in imported]
+        print(f"{target}: {best * 1000:.0f} ms cold boot (best of {args.repeat})")
+        for cumulative, name in slowest_imports(stderr, args.top):
+            print(f"  {cumulative / 1000:>8.1f} ms  {name}")
+        if heavy:
+            print(f"  eagerly imported: {', '.join(heavy)}")
+            failed = True
+        if args.budget_ms and best * 1000 > args.budget_ms:
+            print(f"  over the {args.budget_ms:.0f} ms budget")
+            failed = True
+        print()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,6 @@
+"""Runs the ``jda`` command line interface with ``python -m job_docs_automation``."""
+
+from job_docs_automation.skeleton import run
+
+if __name__ == "__main__":
+    run()
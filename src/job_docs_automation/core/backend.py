@@ -3,12 +3,24 @@
 import json
 import os
 import re
-from typing import Any, Dict, List, Match, Optional, Tuple, Union
+from typing import Any, Dict, Iterable, List, Match, Optional, Set, Tuple
 
-from docx import Document
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
-from docx.shared import Pt
-from openai import OpenAI, api_key
+from cancellation import Cancelled, CancelToken
+from clients import get_client
+from decoding import DROP_FIELDS, ResponseDecoder, canonical_json
+from metrics import record_cache, record_cancellation, record_usage, track
+from retrieval import parse_filter, relevant
+from scheduler import current_work, estimate_tokens, get_limiter, get_scheduler
+from step_cache import DEFAULT_TTL, SHARED_INPUTS, SharedStepCache, shared_cache_key
+from strict_schema import normalize_schemas, warn_fixes
+from tracing import set_attributes, span
+
+MODEL = "gpt-4o"
+
+# <key>, <key.subkey.index> or <key|filter>, e.g. <experience|relevant> or <experience|relevant:3>
+PLACEHOLDER = re.compile(r"<(\w+(?:\.\w+)*)(?:\|(\w+(?::\d+)?))?>")
+# The text that ranks the chunks kept by the "relevant" filter
+RETRIEVAL_QUERY_KEY = "job_description"
 
 
 class Prompt:
@@ -16,14 +28,73 @@ class Prompt:
     prompt: str
     prompt_input: str
     output_schema: Dict[str, Any]
-
-    def __init__(self, name: str, prompt: str, prompt_input: str, output_schema: Dict[str, Any]):
+    user_independent: bool
+    cache_ttl: int
+    model: str
+    depends_on: List[str]
+    decoder: ResponseDecoder
+
+    def __init__(
+        self,
+        name: str,
+        prompt: str,
+        prompt_input: str,
+        output_schema: Dict[str, Any],
+        user_independent: bool = False,
+        cache_ttl: int = DEFAULT_TTL,
+        drop_fields: Iterable[str] = DROP_FIELDS,
+        model: str = MODEL,
+        depends_on: Iterable[str] = (),
+    ):
         self.name = name
         self.prompt = prompt
         self.prompt_input = prompt_input
         self.output_schema = output_schema
+        # The output only depends on the job posting, so it can be shared across users
+        self.user_independent = user_independent
+        self.cache_ttl = cache_ttl
+        self.model = model
+        # Steps that must run first, on top of the ones referenced by the placeholders
+        self.depends_on = list(depends_on)
+        # Compiled once, drops fields such as "reason" while parsing the responses
+        self.decoder = ResponseDecoder(output_schema, drop_fields)
+
+    def placeholders(self) -> List[str]:
+        """
+        Lists the top-level keys referenced by the placeholders of the input.
 
-    def replace_input(self, replacements: Dict[str, Any], max_iterations: int) -> Optional[str]:
+        Returns
+        -------
+        List[str]
+            The keys in order of first appearance, e.g. ``find_company`` for ``<find_company.name>``.
+        """
+        keys = [
+            match.group(1).split(".")[0]
+            for match in PLACEHOLDER.finditer(self.prompt_input)
+        ]
+        return list(dict.fromkeys(keys))
+
+    def dependencies(self, step_names: Iterable[str]) -> List[str]:
+        """
+        Lists the steps whose outputs this prompt needs.
+
+        Parameters
+        ----------
+        step_names : Iterable[str]
+            The names of all the prompts of the pipeline.
+
+        Returns
+        -------
+        List[str]
+            The explicit dependencies and the steps referenced by the placeholders.
+        """
+        names = set(step_names)
+        keys = self.depends_on + self.placeholders()
+        return [key for key in dict.fromkeys(keys) if key in names and key != self.name]
+
+    def replace_input(
+        self, replacements: Dict[str, Any], max_iterations: int
+    ) -> Optional[str]:
         """
         Replace placeholders in the input with the corresponding values from the replacements dictionary.
 
@@ -39,17 +110,121 @@ class Prompt:
         Optional[str]
             The input with placeholders replaced. If the process exceeds the maximum number of iterations, returns None.
         """
-        processed_input = self.prompt_input
-        loop_count = 0
+        with span("render_prompt", **{"jda.prompt": self.name}):
+            return render_template(self.prompt_input, replacements, max_iterations)
+
+    def split_input(self, volatile_keys: Iterable[str]) -> Tuple[str, str]:
+        """
+        Splits the input into its stable and its volatile blocks.
+
+        Blocks are separated by blank lines. A block is volatile if one of its placeholders
+        references a volatile key or uses a filter, since filters rank the value against the
+        job description. All other blocks are identical across job postings.
+
+        Parameters
+        ----------
+        volatile_keys : Iterable[str]
+            The inputs and steps whose values change with every job posting.
+
+        Returns
+        -------
+        Tuple[str, str]
+            The stable and the volatile blocks, each in their original order.
+        """
+        volatile = set(volatile_keys)
+        stable_blocks: List[str] = []
+        volatile_blocks: List[str] = []
+        for block in re.split(r"\n\s*\n", self.prompt_input.strip()):
+            is_volatile = any(
+                match.group(2) or match.group(1).split(".")[0] in volatile
+                for match in PLACEHOLDER.finditer(block)
+            )
+            (volatile_blocks if is_volatile else stable_blocks).append(block)
+        return "\n\n".join(stable_blocks), "\n\n".join(volatile_blocks)
+
+    def render_parts(
+        self,
+        replacements: Dict[str, Any],
+        max_iterations: int,
+        volatile_keys: Iterable[str],
+    ) -> Optional[Tuple[str, str]]:
+        """
+        Renders the stable and the volatile blocks of the input separately.
+
+        Parameters
+        ----------
+        replacements : Dict[str, Any]
+            A dictionary mapping keys to their replacement values.
+        max_iterations : int
+            The maximum number of iterations to replace placeholders.
+        volatile_keys : Iterable[str]
+            The inputs and steps whose values change with every job posting.
+
+        Returns
+        -------
+        Optional[Tuple[str, str]]
+            The rendered stable and volatile parts, or None if either exceeds the maximum
+            number of iterations.
+        """
+        with span("render_prompt", **{"jda.prompt": self.name}):
+            parts = [
+                render_template(template, replacements, max_iterations)
+                for template in self.split_input(volatile_keys)
+            ]
+        if None in parts:
+            return None
+        return parts[0], parts[1]  # type: ignore[return-value]
+
 
-        while re.search(r"<(\w+)>", processed_input):
-            processed_input = replace_placeholders(processed_input, replacements)
-            loop_count += 1
+def render_template(
+    template: str, replacements: Dict[str, Any], max_iterations: int
+) -> Optional[str]:
+    """
+    Replaces placeholders until none is left, since values may contain placeholders too.
 
-            if loop_count >= max_iterations:
-                return None
+    Parameters
+    ----------
+    template : str
+        The text containing placeholders.
+    replacements : Dict[str, Any]
+        A dictionary mapping keys to their replacement values.
+    max_iterations : int
+        The maximum number of iterations to replace placeholders.
 
-        return processed_input
+    Returns
+    -------
+    Optional[str]
+        The rendered text, or None if the process exceeds the maximum number of iterations.
+    """
+    loop_count = 0
+    while PLACEHOLDER.search(template):
+        template = replace_placeholders(template, replacements)
+        loop_count += 1
+
+        if loop_count >= max_iterations:
+            return None
+
+    return template
+
+
+def volatile_keys(prompts: List[Prompt]) -> Set[str]:
+    """
+    Lists the keys whose values change with every job posting.
+
+    These are the posting-level inputs and the outputs of all steps, which are sampled
+    again for every run. Profile inputs and static text are not volatile.
+
+    Parameters
+    ----------
+    prompts : List[Prompt]
+        The prompts of the pipeline.
+
+    Returns
+    -------
+    Set[str]
+        The volatile keys.
+    """
+    return set(SHARED_INPUTS) | {prompt.name for prompt in prompts}
 
 
 # Define function to read content from a file
@@ -107,27 +282,96 @@ def read_files(
     -------
     Tuple[Dict[str, str], List[Prompt]]
         A tuple containing a dictionary of inputs, and a list of prompts.
+
+    Raises
+    ------
+    StrictSchemaError
+        If a schema cannot be used in strict mode, see ``strict_schema.normalize_schema``.
     """
     # Read input and prompt names from files
     input_names = read_file(os.path.join("inputs", input_filenames)).strip().split("\n")
-    prompt_names = read_file(os.path.join("inputs", prompt_filenames)).strip().split("\n")
+    prompt_names = (
+        read_file(os.path.join("inputs", prompt_filenames)).strip().split("\n")
+    )
     # Load inputs dynamically
-    inputs = {name: read_file(os.path.join("inputs", f"{name}.txt")) for name in input_names}
+    inputs = {
+        name: read_file(os.path.join("inputs", f"{name}.txt")) for name in input_names
+    }
 
-    # Load prompts dynamically
+    # Load prompts dynamically, with all schemas normalized for strict mode at once
+    schemas, fixes = normalize_schemas(
+        {
+            name: read_json_schema(os.path.join("prompts", name, "schema.json"))
+            for name in prompt_names
+        }
+    )
+    warn_fixes(fixes)
     prompts = [
         Prompt(
             name,
             read_file(os.path.join("prompts", name, "prompt.txt")),
             read_file(os.path.join("prompts", name, "input.txt")),
-            read_json_schema(os.path.join("prompts", name, "schema.json")),
+            schemas[name],
+            **read_prompt_config(os.path.join("prompts", name, "config.json")),
         )
         for name in prompt_names
     ]
+    check_user_independent(prompts)
 
     return inputs, prompts
 
 
+def read_prompt_config(file_path: str) -> Dict[str, Any]:
+    """
+    Reads the optional per-prompt settings, e.g. ``{"user_independent": true, "cache_ttl": 86400}``
+    or ``{"drop_fields": ["reason", "notes"]}``.
+
+    Parameters
+    ----------
+    file_path : str
+        The path to the config.json file of the prompt.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The keyword arguments for :class:`Prompt`, empty if the file does not exist.
+    """
+    if not os.path.exists(file_path):
+        return {}
+    config = read_json_schema(file_path)
+    return {
+        key: config[key]
+        for key in ("user_independent", "cache_ttl", "drop_fields")
+        if key in config
+    }
+
+
+def check_user_independent(prompts: List[Prompt]) -> None:
+    """
+    Checks that user-independent prompts only use posting-level data.
+
+    Parameters
+    ----------
+    prompts : List[Prompt]
+        The prompts in execution order.
+
+    Raises
+    ------
+    ValueError
+        If a user-independent prompt references an input or a step that depends on the user.
+    """
+    shared = set(SHARED_INPUTS)
+    for prompt in prompts:
+        if not prompt.user_independent:
+            continue
+        user_specific = [key for key in prompt.placeholders() if key not in shared]
+        if user_specific:
+            raise ValueError(
+                f"Prompt '{prompt.name}' is marked user_independent but uses {user_specific}"
+            )
+        shared.add(prompt.name)
+
+
 # Define function to replace placeholders in prompts
 def replace_placeholders(text: str, replacements: Dict[str, Any]) -> str:
     """
@@ -139,6 +383,8 @@ def replace_placeholders(text: str, replacements: Dict[str, Any]) -> str:
     ----------
     text : str
         The input text containing placeholders in the format <key> or <key.subkey.index>.
+        A ``|relevant`` or ``|relevant:k`` suffix keeps only the k chunks of the value most
+        relevant to the job description, e.g. <experience|relevant>.
     replacements : Dict[str, Any]
         A dictionary mapping keys to their replacement values.
 
@@ -198,28 +444,26 @@ def replace_placeholders(text: str, replacements: Dict[str, Any]) -> str:
         """
         key_path = match.group(1).split(".")
         parsed_path = [int(part) if part.isdigit() else part for part in key_path]
-        return str(get_nested_value(replacements, parsed_path))
+        value = str(get_nested_value(replacements, parsed_path))
+        if match.group(2):
+            filter_name, k = parse_filter(match.group(2))
+            if filter_name != "relevant":
+                raise ValueError(f"Unknown placeholder filter '{filter_name}'")
+            value = relevant(value, str(replacements.get(RETRIEVAL_QUERY_KEY, "")), k)
+        return value
 
-    return re.sub(r"<(\w+(?:\.\w+)*)>", replace_match, text)
+    with track("replace_placeholders"):
+        return PLACEHOLDER.sub(replace_match, text)
 
-def remove_key_recursively(input_dict: Union[str, Dict[str, Any], List[Union[str, Dict[str, Any]]]], key_to_remove: str) -> None:
-    """
-    Removes a specific key recursively from a dictionary.
 
-    Parameters
-    ----------
-    info_dict : Union[str, Dict[str, Any], List[Union[str, Dict[str, Any]]]]
-    """
-    if isinstance(input_dict, dict):
-        if key_to_remove in input_dict:
-            del input_dict[key_to_remove]
-        for key, value in input_dict.items():
-            remove_key_recursively(value, key_to_remove)
-    elif isinstance(input_dict, list):
-        for item in input_dict:
-            remove_key_recursively(item, key_to_remove)
-
-def execute_step(step: int, prompts: List[Prompt], replacements: Dict[str, Any]) -> Optional[str]:
+def execute_step(
+    step: int,
+    prompts: List[Prompt],
+    replacements: Dict[str, Any],
+    shared_cache: Optional[SharedStepCache] = None,
+    usage: Optional[Dict[str, int]] = None,
+    cancel: Optional[CancelToken] = None,
+) -> Optional[str]:
     """
     Executes a step in the process of generating a motivation letter.
 
@@ -231,34 +475,100 @@ def execute_step(step: int, prompts: List[Prompt], replacements: Dict[str, Any])
         A list of prompts to be processed sequentially.
     replacements : Dict[str, Any]
         A dictionary containing replacement values for placeholders in the prompts.
+    shared_cache : Optional[SharedStepCache], optional
+        The cache shared across users for the outputs of user-independent prompts, by default None.
+    usage : Optional[Dict[str, int]], optional
+        A dictionary filled with the token usage of the call, by default None.
+        It stays empty when the output is served from the shared cache.
+    cancel : Optional[CancelToken], optional
+        The token cancelling the step, e.g. when the user navigates away, by default None.
 
     Returns
     -------
     Optional[str]
-        The output text for the step, or None if the call fails.
+        The output of the step as compact JSON, or None if the call fails.
+        The decoded output is stored in ``replacements`` under the name of the prompt.
+
+    Raises
+    ------
+    Cancelled
+        If the token is cancelled before the output is complete, ``replacements`` is
+        left unchanged.
     """
     if step < len(prompts):
         api_key = os.getenv("OPENAI_API_KEY")
         if api_key is None:
             return None
-        output = generate_text(
-            api_key=api_key,
-            prompt=prompts[step],
-            replacements=replacements,
-            max_loops=5,
-        )
-        replacements[prompts[step].name] = json.loads(output)
-        remove_key_recursively(replacements[prompts[step].name], "reason")
-        return str(replacements[prompts[step].name])
+        name = prompts[step].name
+        with track("execute_step", prompt=name), span(
+            "execute_step", **{"jda.prompt": name}
+        ):
+            cache_key = None
+            if shared_cache is not None and prompts[step].user_independent:
+                rendered_input = prompts[step].replace_input(replacements, 5)
+                if rendered_input is not None:
+                    cache_key = shared_cache_key(
+                        name,
+                        prompts[step].prompt,
+                        prompts[step].output_schema,
+                        prompts[step].model,
+                        rendered_input,
+                    )
+                    cached = shared_cache.get(cache_key)
+                    record_cache("shared_step", cached is not None)
+                    if cached is not None:
+                        set_attributes(**{"jda.shared_cache_hit": True})
+                        replacements[name] = cached
+                        return canonical_json(cached)
+            output = generate_text(
+                api_key=api_key,
+                prompt=prompts[step],
+                replacements=replacements,
+                max_loops=5,
+                volatile=volatile_keys(prompts),
+                usage=usage,
+                cancel=cancel,
+            )
+            with span(
+                "decode_response",
+                **{"jda.prompt": name, "jda.response_chars": len(output)},
+            ):
+                replacements[name] = prompts[step].decoder.decode(output)
+            if cache_key is not None:
+                shared_cache.set(  # type: ignore[union-attr]
+                    cache_key, name, replacements[name], prompts[step].cache_ttl
+                )
+            return canonical_json(replacements[name])
     return None
 
 
+def cached_tokens(usage: Any) -> int:
+    """
+    Returns the prompt tokens served from the provider's prompt cache.
+
+    Parameters
+    ----------
+    usage : Any
+        The ``usage`` attribute of a response.
+
+    Returns
+    -------
+    int
+        The cached tokens, 0 if the provider does not report them.
+    """
+    details = getattr(usage, "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", 0) or 0
+
+
 # Define function to generate text using OpenAI API
 def generate_text(
     api_key: str,
     prompt: Prompt,
     replacements: Dict[str, Any],
     max_loops: int = 5,
+    volatile: Optional[Iterable[str]] = None,
+    usage: Optional[Dict[str, int]] = None,
+    cancel: Optional[CancelToken] = None,
 ) -> str:
     """
     Generates text using OpenAI API with placeholders dynamically replaced at runtime.
@@ -273,45 +583,266 @@ def generate_text(
         A dictionary containing replacement values for placeholders in the prompt.
     max_loops : int, optional
         The maximum number of loops to replace placeholders, by default 5.
+    volatile : Optional[Iterable[str]], optional
+        The keys whose values change with every job posting, by default the posting-level
+        inputs and the step outputs found in the replacements.
+    usage : Optional[Dict[str, int]], optional
+        A dictionary filled with the prompt, completion and cached token counts, by default None.
+    cancel : Optional[CancelToken], optional
+        The token cancelling the call, by default None. With a token the response is
+        streamed, see ``stream_completion``.
 
     Returns
     -------
     str
         The generated text from the OpenAI API.
+
+    Raises
+    ------
+    ValueError
+        If the placeholders of the input are not resolved within ``max_loops`` iterations.
+    Cancelled
+        If the token is cancelled before the response is complete.
     """
 
-    client = OpenAI(
-        api_key=api_key,  # This is the default and can be omitted
-    )
+    client = get_client(api_key)
+    if volatile is None:
+        volatile = set(SHARED_INPUTS) | {
+            key for key, value in replacements.items() if not isinstance(value, str)
+        }
+    parts = prompt.render_parts(replacements, max_loops, volatile)
+    if parts is None:
+        raise ValueError(
+            f"Placeholders of prompt '{prompt.name}' are not resolved in {max_loops} loops"
+        )
+    # The provider caches prompt prefixes, so the developer prompt and the blocks shared by
+    # all runs of a user come first and the job-specific blocks last
     messages = []
     if prompt.prompt:
-        messages.append({"role": "developer", "content": [{"type": "text", "text": prompt.prompt}]})
+        messages.append(
+            {"role": "developer", "content": [{"type": "text", "text": prompt.prompt}]}
+        )
     messages.append(
         {
             "role": "user",
-            "content": [{"type": "text", "text": prompt.replace_input(replacements, max_loops)}],
+            "content": [{"type": "text", "text": part} for part in parts if part],
         }
     )
-    response = client.chat.completions.create(
-        messages=messages,
-        model="gpt-4o",
-        response_format={
+    model = prompt.model
+    request = {
+        "messages": messages,
+        "model": model,
+        "response_format": {
             "type": "json_schema",
             "json_schema": {
                 "name": "output",
                 "strict": True,
                 "schema": prompt.output_schema,
             },
-        },  # type: ignore
-    )
+        },
+    }
+    tokens = estimate_tokens(prompt.prompt, *parts)
+    # Waits for a slot of the user and priority class of the call, see scheduler.work
+    with get_scheduler().slot(tokens, cancel) as queue_wait:
+        # Waits for the requests and tokens per minute of the key, see JDA_RATE_LIMIT_RPM/TPM
+        rate_limit_wait = get_limiter().acquire(tokens)
+        with track("generate_text", prompt=prompt.name), span(
+            "llm_call",
+            **{
+                "jda.prompt": prompt.name,
+                "gen_ai.request.model": model,
+                "jda.rate_limit_wait_s": rate_limit_wait,
+                "jda.priority": current_work()[1],
+                "jda.queue_wait_s": queue_wait,
+            },
+        ):
+            if cancel is None:
+                response = client.chat.completions.create(**request)
+                response_model = getattr(response, "model", None)
+                response_usage = getattr(response, "usage", None)
+                response_text = response.choices[0].message.content or ""
+            else:
+                response_text, response_model, response_usage = stream_completion(
+                    client, request, cancel, prompt.name
+                )
+            if response_usage is not None:
+                set_attributes(
+                    **{
+                        "gen_ai.response.model": response_model,
+                        "gen_ai.usage.input_tokens": response_usage.prompt_tokens,
+                        "gen_ai.usage.output_tokens": response_usage.completion_tokens,
+                        "jda.usage.cached_tokens": cached_tokens(response_usage),
+                    }
+                )
+    record_usage(prompt.name, model, response_usage)
+    if usage is not None and response_usage is not None:
+        usage.update(
+            prompt_tokens=response_usage.prompt_tokens,
+            completion_tokens=response_usage.completion_tokens,
+            cached_tokens=cached_tokens(response_usage),
+        )
+
+    return response_text
+
+
+def stream_completion(
+    client: Any, request: Dict[str, Any], cancel: CancelToken, prompt_name: str
+) -> Tuple[str, Optional[str], Any]:
+    """
+    Streams a completion so that cancelling the token stops it.
+
+    Cancelling closes the response stream, so the provider stops generating and the
+    worker is released at once instead of when the discarded response is complete.
 
-    response_text = (
-        response.choices[0].message.content
-        if response.choices[0].message.content is not None
-        else ""
+    Parameters
+    ----------
+    client : Any
+        The OpenAI client.
+    request : Dict[str, Any]
+        The keyword arguments of ``chat.completions.create``.
+    cancel : CancelToken
+        The token of the step.
+    prompt_name : str
+        The name of the prompt, for the metrics.
+
+    Returns
+    -------
+    Tuple[str, Optional[str], Any]
+        The text, the model and the usage of the response.
+
+    Raises
+    ------
+    Cancelled
+        If the token is cancelled before or during the call.
+    """
+    if cancel.cancelled:
+        record_cancellation(prompt_name, cancel.reason or "aborted")
+        raise Cancelled(cancel.reason or "aborted")
+    stream = client.chat.completions.create(
+        **request, stream=True, stream_options={"include_usage": True}
     )
+    close = getattr(stream, "close", lambda: None)
+    cancel.add_callback(close)
+    parts: List[str] = []
+    model, usage = None, None
+    try:
+        for chunk in stream:
+            # Also notices an expired lease, which has no callback
+            if cancel.cancelled:
+                break
+            model = getattr(chunk, "model", None) or model
+            for choice in chunk.choices:
+                parts.append(choice.delta.content or "")
+            usage = getattr(chunk, "usage", None) or usage
+    except Exception:
+        # Closing the stream from another thread makes the read fail
+        if not cancel.cancelled:
+            raise
+    finally:
+        cancel.remove_callback(close)
+        close()
+    if cancel.cancelled:
+        record_cancellation(prompt_name, cancel.reason or "aborted")
+        raise Cancelled(cancel.reason or "aborted")
+    return "".join(parts), model, usage
+
+
+# Formats render_document can write, with their file extensions
+DOCUMENT_FORMATS = {"docx": "docx", "text": "txt", "json": "json"}
+
+
+def document_text(output: Any, field: Optional[str] = None) -> str:
+    """
+    Extracts the text of a document from the output of the step that writes it.
 
-    return response_text
+    Parameters
+    ----------
+    output : Any
+        The decoded output, e.g. ``{"cover_letter": "..."}``.
+    field : Optional[str], optional
+        The field holding the text, by default all string fields separated by blank lines.
+
+    Returns
+    -------
+    str
+        The text of the document.
+    """
+    if isinstance(output, dict):
+        if field is not None:
+            return str(output[field])
+        return "\n\n".join(value for value in output.values() if isinstance(value, str))
+    return output if isinstance(output, str) else str(output)
+
+
+def render_document(
+    output: Any,
+    output_path: str,
+    output_format: str = "docx",
+    field: Optional[str] = None,
+) -> str:
+    """
+    Renders the output of a step as a document.
+
+    Parameters
+    ----------
+    output : Any
+        The decoded output of the step, or the text of the document.
+    output_path : str
+        The path of the document, the extension is added if it is missing.
+    output_format : str, optional
+        ``docx`` (Garamond, size 11), ``text`` or ``json`` (the whole output), by default ``docx``.
+    field : Optional[str], optional
+        The field of the output holding the text, by default all string fields.
+
+    Returns
+    -------
+    str
+        The path of the document.
+
+    Raises
+    ------
+    ValueError
+        If the format is not supported.
+    """
+    if output_format not in DOCUMENT_FORMATS:
+        raise ValueError(f"Unsupported document format '{output_format}'")
+    extension = "." + DOCUMENT_FORMATS[output_format]
+    if not output_path.endswith(extension):
+        output_path += extension
+    with track("render_document"), span(
+        "render_document",
+        **{"jda.output_file": output_path, "jda.format": output_format},
+    ):
+        if output_format == "json":
+            with open(output_path, "w", encoding="utf-8") as file:
+                json.dump(output, file, ensure_ascii=False, indent=2)
+            return output_path
+        content = document_text(output, field)
+        if output_format == "text":
+            with open(output_path, "w", encoding="utf-8") as file:
+                file.write(content)
+            return output_path
+
+        from docx import Document
+        from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+        from docx.shared import Pt
+
+        doc = Document()
+
+        # Set the default style to Garamond, size 11
+        style = doc.styles["Normal"]
+        font = style.font
+        font.name = "Garamond"
+        font.size = Pt(11)
+
+        # Add content to the document
+        for paragraph in content.split("\n\n"):
+            p = doc.add_paragraph(paragraph)
+            p.alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
+
+        # Save the document
+        doc.save(output_path)
+        return output_path
 
 
 # Define function to save the letter as a formatted .docx file
@@ -324,56 +855,90 @@ def save_to_docx(content: str, output_file: str) -> None:
     content : str
         The content to be saved to the document.
     output_file : str
-        The path to the output .docx file.
+        The path to the output .docx file, relative to ``outputs/``.
     """
-    doc = Document()
-
-    # Set the default style to Garamond, size 11
-    style = doc.styles["Normal"]
-    font = style.font
-    font.name = "Garamond"
-    font.size = Pt(11)
-
-    # Add content to the document
-    for paragraph in content.split("\n\n"):
-        p = doc.add_paragraph(paragraph)
-        p.alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
-
-    # Save the document
-    doc.save(os.path.join("outputs", output_file))
+    render_document(content, os.path.join("outputs", output_file), "docx")
 
 
 # Main function
-def main() -> None:
+def main(resume: bool = False, run_id: str = "motivation_letter") -> None:
     """
     Main function to generate a motivation letter based on inputs and save it to a .docx file.
+
+    Every completed step is checkpointed, so a run that crashed can be resumed.
+
+    Parameters
+    ----------
+    resume : bool, optional
+        Whether to skip the steps completed by a previous run whose inputs are unchanged,
+        by default False.
+    run_id : str, optional
+        The name of the checkpoint, by default "motivation_letter".
     """
 
+    # Imported here, the manifest, checkpoint and step_result modules build on this one
+    from checkpoint import Checkpoint
+    from manifest import load_configured_pipeline
+    from step_result import StepResult, step_input_hash
+
     inputs: Dict[str, str] = {}
     prompts: List[Prompt] = []
-    inputs, prompts= read_files(input_filenames="inputs.txt", prompt_filenames="prompts_2.txt")
+    inputs, prompts = load_configured_pipeline()
 
     # Prepare replacements dictionary
     replacements = {key: value for key, value in inputs.items()}
-
-    # Sequentially generate outputs and update replacements
-    for i, prompt in enumerate(prompts):
-        output = execute_step(
-            step=i, prompts=prompts, replacements=replacements
-        )
-        print(f"Input processed for {prompt.name}:\n")
-        print(f"{prompt.prompt}\n")
-        print(f"Generated output for {prompt.name}:\n")
-        print(f"{output}\n\n")
-        pass
-
-    # Save to .docx
-    output_file = "motivation_letter.docx"
-    save_to_docx(replacements["write_motivation_letter"], output_file)
+    checkpoint = Checkpoint.open(run_id, resume)
+
+    with span("generation_run"):
+        # Sequentially generate outputs and update replacements
+        for i, prompt in enumerate(prompts):
+            input_hash = step_input_hash(prompt, replacements)
+            restored = checkpoint.restore(prompt.name, input_hash)
+            if restored is not None:
+                replacements[prompt.name] = restored.parsed
+                print(f"Restored output for {prompt.name} from {checkpoint.path}\n")
+                continue
+            usage: Dict[str, int] = {}
+            output = execute_step(
+                step=i, prompts=prompts, replacements=replacements, usage=usage
+            )
+            if output is not None:
+                checkpoint.save(
+                    StepResult(
+                        prompt.name,
+                        output.encode("utf-8"),
+                        usage,
+                        model=prompt.model,
+                        input_hash=input_hash,
+                        parsed=replacements[prompt.name],
+                    )
+                )
+            print(f"Input processed for {prompt.name}:\n")
+            print(f"{prompt.prompt}\n")
+            print(f"Generated output for {prompt.name}:\n")
+            print(f"{output}\n\n")
+            pass
+
+        # Save to .docx
+        output_file = "motivation_letter.docx"
+        save_to_docx(replacements["write_motivation_letter"], output_file)
 
     print(f"Motivation letter saved to {output_file}")
 
 
 if __name__ == "__main__":
+    import argparse
 
-    main()
+    parser = argparse.ArgumentParser(description="Generate a motivation letter")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="skip the steps of the previous run whose inputs are unchanged",
+    )
+    parser.add_argument(
+        "--run-id",
+        default="motivation_letter",
+        help="name of the checkpoint of the run",
+    )
+    args = parser.parse_args()
+    main(resume=args.resume, run_id=args.run_id)
@@ -0,0 +1,186 @@
+"""Contains the cancel tokens of in-flight steps and the registry the web app aborts them with."""
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+class Cancelled(Exception):
+    """
+    Raised by a step whose token was cancelled, its output would be discarded anyway.
+    """
+
+    def __init__(self, reason: str):
+        self.reason = reason
+        super().__init__(f"Step cancelled ({reason})")
+
+
+class CancelToken:
+    """
+    Cancels one step execution, either explicitly or when its lease runs out.
+
+    Parameters
+    ----------
+    step : str, optional
+        The step the token belongs to, by default "".
+    lease : float, optional
+        The seconds the token stays valid without ``renew``, 0 for no lease, by default 0.
+        A client that stops renewing, e.g. a closed browser tab, is considered gone.
+    clock : Callable[[], float], optional
+        The monotonic clock, by default ``time.monotonic``.
+    """
+
+    step: str
+    lease: float
+    reason: Optional[str]
+
+    def __init__(
+        self, step: str = "", lease: float = 0.0, clock: Callable[[], float] = time.monotonic
+    ):
+        self.step = step
+        self.lease = lease
+        self.reason = None
+        self._clock = clock
+        self._renewed = clock()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    def renew(self) -> None:
+        self._renewed = self._clock()
+
+    @property
+    def cancelled(self) -> bool:
+        if self.reason is None and self.lease > 0 and self._clock() - self._renewed > self.lease:
+            self.cancel("disconnected")
+        return self.reason is not None
+
+    def cancel(self, reason: str = "aborted") -> bool:
+        """
+        Cancels the token and runs its callbacks, e.g. closing the response stream.
+
+        Parameters
+        ----------
+        reason : str, optional
+            ``aborted``, ``superseded`` or ``disconnected``, by default ``aborted``.
+
+        Returns
+        -------
+        bool
+            False if the token was already cancelled.
+        """
+        with self._lock:
+            if self.reason is not None:
+                return False
+            self.reason = reason
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+        return True
+
+    def add_callback(self, callback: Callable[[], None]) -> None:
+        """
+        Runs ``callback`` on cancellation, at once if the token is already cancelled.
+        """
+        with self._lock:
+            if self.reason is None:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self) -> None:
+        """
+        Raises
+        ------
+        Cancelled
+            If the token is cancelled or its lease ran out.
+        """
+        if self.cancelled:
+            raise Cancelled(self.reason or "aborted")
+
+
+class CancelRegistry:
+    """
+    The tokens of the steps in flight, by owner, e.g. a web session.
+
+    An owner has at most one step in flight: starting a step supersedes the previous one,
+    whose result would be discarded. The registry is per process, like the write-behind
+    sessions of the web app.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._tokens: Dict[str, CancelToken] = {}
+
+    def start(self, owner: str, step: str, lease: float = 0.0) -> CancelToken:
+        """
+        Registers a new step of the owner, cancelling the one in flight.
+
+        Parameters
+        ----------
+        owner : str
+            The owner of the step.
+        step : str
+            The name of the step.
+        lease : float, optional
+            The lease of the token, see ``CancelToken``, by default 0.
+
+        Returns
+        -------
+        CancelToken
+            The token to pass to ``execute_step``.
+        """
+        token = CancelToken(step, lease)
+        with self._lock:
+            previous = self._tokens.get(owner)
+            self._tokens[owner] = token
+        if previous is not None:
+            previous.cancel("superseded")
+        return token
+
+    def finish(self, owner: str, token: CancelToken) -> None:
+        """
+        Unregisters a step once it is done, unless a newer step of the owner replaced it.
+        """
+        with self._lock:
+            if self._tokens.get(owner) is token:
+                del self._tokens[owner]
+
+    def cancel(self, owner: str, reason: str = "aborted") -> bool:
+        """
+        Cancels the step of the owner in flight, if any.
+
+        Returns
+        -------
+        bool
+            Whether a step was cancelled.
+        """
+        with self._lock:
+            token = self._tokens.pop(owner, None)
+        return token is not None and token.cancel(reason)
+
+    def heartbeat(self, owner: str) -> bool:
+        """
+        Renews the lease of the step of the owner in flight, if any.
+
+        Returns
+        -------
+        bool
+            Whether a step is in flight.
+        """
+        with self._lock:
+            token = self._tokens.get(owner)
+        if token is None:
+            return False
+        token.renew()
+        return True
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+
+registry = CancelRegistry()
@@ -0,0 +1,302 @@
+"""Contains the record/replay layer for the calls to the OpenAI API.
+
+``JDA_CASSETTE`` is the file of the recorded calls, JSON lines gzipped if it ends with
+``.gz``. ``JDA_CASSETTE_MODE=record`` calls the API and appends every call to it, ``replay``
+(the default) answers from the file only. ``JDA_CASSETTE_LATENCY`` is ``recorded`` to wait
+as long as the recorded call, ``none`` (the default) to answer at once, or a number of
+seconds to wait for every call.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+from typing import IO, Any, Dict, Iterator, List, Optional
+
+from fake_llm import FakeStream
+
+# Request options that do not change the response
+IGNORED_OPTIONS = ("timeout", "extra_headers", "stream", "stream_options")
+
+
+class CassetteMiss(LookupError):
+    """
+    Raised in replay mode for a request that is not in the cassette.
+    """
+
+
+def request_key(request: Dict[str, Any]) -> str:
+    """
+    Hashes a request, ignoring the options that do not change the response.
+
+    Parameters
+    ----------
+    request : Dict[str, Any]
+        The keyword arguments of ``chat.completions.create``.
+
+    Returns
+    -------
+    str
+        A hex digest.
+    """
+    content = {key: value for key, value in request.items() if key not in IGNORED_OPTIONS}
+    text = json.dumps(content, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _open(path: str, mode: str) -> IO[str]:
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")  # type: ignore[return-value]
+    return open(path, mode, encoding="utf-8")
+
+
+def dump_response(response: Any) -> Dict[str, Any]:
+    """
+    Keeps the fields of a response read by the package.
+    """
+    message = response.choices[0].message
+    usage = getattr(response, "usage", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "model": getattr(response, "model", None),
+        "content": message.content,
+        "refusal": getattr(message, "refusal", None),
+        "finish_reason": getattr(response.choices[0], "finish_reason", "stop"),
+        "usage": None
+        if usage is None
+        else [
+            usage.prompt_tokens,
+            usage.completion_tokens,
+            getattr(details, "cached_tokens", 0) or 0,
+        ],
+    }
+
+
+def load_response(data: Dict[str, Any]) -> Any:
+    """
+    Rebuilds a response recorded by ``dump_response``, with the attributes of the real one.
+    """
+    usage = None
+    if data["usage"] is not None:
+        prompt_tokens, completion_tokens, cached = data["usage"]
+        usage = SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=cached),
+        )
+    message = SimpleNamespace(role="assistant", content=data["content"], refusal=data["refusal"])
+    return SimpleNamespace(
+        id="chatcmpl-cassette",
+        model=data["model"],
+        choices=[SimpleNamespace(index=0, finish_reason=data["finish_reason"], message=message)],
+        usage=usage,
+    )
+
+
+class Cassette:
+    """
+    The recorded calls of a cassette file.
+
+    Identical requests recorded several times are replayed in the recorded order, and the
+    last recording is repeated once they are exhausted.
+
+    Parameters
+    ----------
+    path : str
+        The cassette file.
+    mode : str, optional
+        ``record`` or ``replay``, by default ``replay``.
+    latency : str, optional
+        ``recorded``, ``none`` or a number of seconds, by default ``none``.
+    """
+
+    path: str
+    mode: str
+    latency: str
+
+    def __init__(self, path: str, mode: str = "replay", latency: str = "none"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode '{mode}'")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._replayed: Dict[str, int] = {}
+        if os.path.exists(path):
+            with _open(path, "r") as file:
+                for line in file:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry["key"], []).append(entry)
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._entries.values())
+
+    def record(self, request: Dict[str, Any], response: Any, seconds: float) -> None:
+        """
+        Appends a call to the cassette file.
+        """
+        entry = {
+            "key": request_key(request),
+            "model": request.get("model"),
+            "seconds": round(seconds, 4),
+            "response": dump_response(response),
+        }
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._entries.setdefault(entry["key"], []).append(entry)
+            # Appending keeps the file valid if the run is interrupted, gzip members included
+            with _open(self.path, "a") as file:
+                file.write(line)
+
+    def replay(self, request: Dict[str, Any]) -> Any:
+        """
+        Answers a request from the cassette, after the configured latency.
+
+        Streamed requests get the recorded response as a stream spread over that latency.
+
+        Raises
+        ------
+        CassetteMiss
+            If the request was never recorded.
+        """
+        key = request_key(request)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise CassetteMiss(
+                    f"Request {key} to model '{request.get('model')}' is not in cassette "
+                    f"{self.path}, record it with JDA_CASSETTE_MODE=record (jda --record)"
+                )
+            idx = self._replayed.get(key, 0)
+            self._replayed[key] = idx + 1
+            entry = entries[min(idx, len(entries) - 1)]
+        delay = 0.0
+        if self.latency == "recorded":
+            delay = entry["seconds"]
+        elif self.latency != "none":
+            delay = float(self.latency)
+        if request.get("stream"):
+            return FakeStream(load_response(entry["response"]), delay)
+        time.sleep(delay)
+        return load_response(entry["response"])
+
+
+class RecordingStream:
+    """
+    Passes a streamed response through and records it once it is complete.
+
+    A stream closed before its end, e.g. a cancelled step, is not recorded.
+    """
+
+    def __init__(self, cassette: Cassette, request: Dict[str, Any], stream: Any):
+        self.cassette = cassette
+        self.request = request
+        self.stream = stream
+        self.closed = False
+        self._start = time.perf_counter()
+
+    def __iter__(self) -> Iterator[Any]:
+        parts: List[str] = []
+        model, usage, finish_reason = self.request.get("model"), None, "stop"
+        for chunk in self.stream:
+            model = getattr(chunk, "model", None) or model
+            for choice in chunk.choices:
+                parts.append(getattr(choice.delta, "content", None) or "")
+                finish_reason = getattr(choice, "finish_reason", None) or finish_reason
+            usage = getattr(chunk, "usage", None) or usage
+            yield chunk
+        if self.closed:
+            return
+        message = SimpleNamespace(content="".join(parts), refusal=None)
+        response = SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(finish_reason=finish_reason, message=message)],
+            usage=usage,
+        )
+        self.cassette.record(self.request, response, time.perf_counter() - self._start)
+
+    def close(self) -> None:
+        self.closed = True
+        close = getattr(self.stream, "close", None)
+        if close is not None:
+            close()
+
+
+class _Completions:
+    def __init__(self, client: "CassetteClient"):
+        self._client = client
+
+    def create(self, **kwargs: Any) -> Any:
+        """
+        Mimics ``client.chat.completions.create``, recording or replaying the call.
+        """
+        cassette = self._client.cassette
+        if cassette.mode == "replay":
+            return cassette.replay(kwargs)
+        start = time.perf_counter()
+        response = self._client.wrapped.chat.completions.create(**kwargs)
+        if kwargs.get("stream"):
+            return RecordingStream(cassette, kwargs, response)
+        cassette.record(kwargs, response, time.perf_counter() - start)
+        return response
+
+
+class CassetteClient:
+    """
+    Drop-in replacement for the OpenAI client recording or replaying its calls.
+
+    Parameters
+    ----------
+    cassette : Cassette
+        The cassette.
+    wrapped : Optional[Any], optional
+        The client making the calls in record mode, by default None.
+    """
+
+    def __init__(self, cassette: Cassette, wrapped: Optional[Any] = None):
+        if cassette.mode == "record" and wrapped is None:
+            raise ValueError("Recording needs a client to call the API with")
+        self.cassette = cassette
+        self.wrapped = wrapped
+        self.chat = SimpleNamespace(completions=_Completions(self))
+
+    def with_options(self, **kwargs: Any) -> "CassetteClient":
+        """
+        Mimics ``client.with_options``, applying the options to the wrapped client.
+        """
+        if self.wrapped is None:
+            return self
+        return CassetteClient(self.cassette, self.wrapped.with_options(**kwargs))
+
+    def close(self) -> None:
+        close = getattr(self.wrapped, "close", None)
+        if close is not None:
+            close()
+
+
+_cassettes: Dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette() -> Optional[Cassette]:
+    """
+    Returns the cassette configured by ``JDA_CASSETTE``, loaded once per process.
+
+    The variables are read at every call, so tests and benchmarks can set them late.
+    """
+    path = os.getenv("JDA_CASSETTE", "")
+    if not path:
+        return None
+    mode = os.getenv("JDA_CASSETTE_MODE", "replay")
+    latency = os.getenv("JDA_CASSETTE_LATENCY", "none")
+    key = f"{path}\0{mode}\0{latency}"
+    with _cassettes_lock:
+        if key not in _cassettes:
+            _cassettes[key] = Cassette(path, mode, latency)
+        return _cassettes[key]
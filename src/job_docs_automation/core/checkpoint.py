@@ -0,0 +1,144 @@
+"""Contains the checkpoints of the step results of a run, to resume it after a crash."""
+
+import os
+import re
+import struct
+import tempfile
+import threading
+import warnings
+from typing import Dict, Optional
+
+from step_result import StepResult
+
+# Directory of the checkpoint files, one per run id
+CHECKPOINT_DIR = os.getenv("JDA_CHECKPOINT_DIR", ".jda_checkpoints")
+MAGIC = b"JDACKPT\x01"
+_LENGTH = struct.Struct("<I")
+
+
+def checkpoint_path(run_id: str, directory: str = CHECKPOINT_DIR) -> str:
+    """
+    Returns the checkpoint file of a run, with the characters unsafe in file names replaced.
+    """
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", run_id).lstrip(".") or "run"
+    return os.path.join(directory, f"{name}.ckpt")
+
+
+class Checkpoint:
+    """
+    The results of the completed steps of a run, written to disk after every step.
+
+    Every write replaces the file atomically, so a run killed at any point leaves either
+    the previous or the new checkpoint, never a truncated one. A result is only restored
+    for a step whose input hash, see ``step_result.step_input_hash``, is unchanged: editing
+    a prompt, the profile or the output of an upstream step runs the step again.
+
+    Parameters
+    ----------
+    path : str
+        The checkpoint file.
+    results : Optional[Dict[str, StepResult]], optional
+        The results already checkpointed, by prompt name, by default None.
+    """
+
+    path: str
+    results: Dict[str, StepResult]
+
+    def __init__(self, path: str, results: Optional[Dict[str, StepResult]] = None):
+        self.path = path
+        self.results = dict(results or {})
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(
+        cls, run_id: str, resume: bool = False, directory: str = CHECKPOINT_DIR
+    ) -> "Checkpoint":
+        """
+        Opens the checkpoint of a run.
+
+        Parameters
+        ----------
+        run_id : str
+            The id of the run, e.g. the name of the job posting.
+        resume : bool, optional
+            Whether to load the results of a previous run with the same id, by default
+            False. Otherwise the first completed step overwrites them.
+        directory : str, optional
+            The directory of the checkpoints, by default ``JDA_CHECKPOINT_DIR``.
+
+        Returns
+        -------
+        Checkpoint
+            The checkpoint, empty if there is nothing to resume.
+        """
+        path = checkpoint_path(run_id, directory)
+        if not resume or not os.path.exists(path):
+            return cls(path)
+        try:
+            return cls(path, read_checkpoint(path))
+        except (OSError, ValueError, struct.error) as error:
+            warnings.warn(f"Ignoring unreadable checkpoint {path}: {error}")
+            return cls(path)
+
+    def restore(self, name: str, input_hash: bytes) -> Optional[StepResult]:
+        """
+        Returns the checkpointed result of a step if it was produced from the same inputs.
+        """
+        result = self.results.get(name)
+        if result is None or result.input_hash != input_hash:
+            return None
+        return result
+
+    def save(self, result: StepResult) -> None:
+        """
+        Adds the result of a completed step and writes the checkpoint.
+        """
+        with self._lock:
+            self.results[result.prompt] = result
+            records = [record.to_bytes() for record in self.results.values()]
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            # Written next to the checkpoint, so that the rename stays on one file system
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as file:
+                    file.write(MAGIC)
+                    for record in records:
+                        file.write(_LENGTH.pack(len(record)))
+                        file.write(record)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+
+def read_checkpoint(path: str) -> Dict[str, StepResult]:
+    """
+    Reads the results written by ``Checkpoint.save``.
+
+    Raises
+    ------
+    ValueError
+        If the file is not a checkpoint.
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    if not data.startswith(MAGIC):
+        raise ValueError("not a checkpoint file")
+    view = memoryview(data)
+    offset = len(MAGIC)
+    results: Dict[str, StepResult] = {}
+    while offset < len(data):
+        (length,) = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        if offset + length > len(data):
+            raise ValueError("truncated checkpoint file")
+        result = StepResult.from_bytes(view[offset : offset + length])
+        results[result.prompt] = result
+        offset += length
+    return results
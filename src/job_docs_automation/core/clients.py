@@ -0,0 +1,158 @@
+"""Contains the factory of the clients calling the OpenAI API, shared by the whole package."""
+
+import importlib.util
+import os
+import threading
+import warnings
+from typing import Any, Dict, Optional, Tuple
+
+from cassette import CassetteClient, get_cassette
+from metrics import HTTP_CONNECTIONS, HTTP_REQUESTS
+
+# Connections kept open to the provider, per process
+POOL_SIZE = int(os.getenv("JDA_HTTP_POOL_SIZE", "20"))
+# Seconds an idle connection stays in the pool
+KEEPALIVE_EXPIRY = float(os.getenv("JDA_HTTP_KEEPALIVE_EXPIRY", "60"))
+# Multiplexes concurrent calls over one connection, needs the h2 package
+HTTP2 = os.getenv("JDA_HTTP2", "0") != "0"
+CONNECT_TIMEOUT = float(os.getenv("JDA_HTTP_CONNECT_TIMEOUT", "5"))
+# Default for every call, long enough for a full cover letter
+TIMEOUT = float(os.getenv("JDA_LLM_TIMEOUT", "120"))
+MAX_RETRIES = int(os.getenv("JDA_LLM_MAX_RETRIES", "2"))
+
+_clients: Dict[Tuple[str, ...], Any] = {}
+_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    # The pooled sockets belong to the parent, e.g. a pre-forking server that loaded the
+    # app before forking its workers, so every child builds its own clients
+    global _lock
+    _lock = threading.Lock()
+    _clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _trace(event_name: str, info: Dict[str, Any]) -> None:
+    # Called by the transport for every step of a request, connecting only for new ones
+    if event_name == "connection.connect_tcp.complete":
+        HTTP_CONNECTIONS.inc()
+
+
+def _on_request(request: Any) -> None:
+    request.extensions["trace"] = _trace
+
+
+def _on_response(response: Any) -> None:
+    HTTP_REQUESTS.inc(status=str(response.status_code))
+
+
+def _create_http_client() -> Any:
+    from openai import DEFAULT_CONNECTION_LIMITS, DefaultHttpxClient, Timeout
+
+    # The types of the HTTP library the installed openai is built on, the ones its client takes
+    Limits = type(DEFAULT_CONNECTION_LIMITS)
+    http2 = HTTP2
+    if http2 and importlib.util.find_spec("h2") is None:
+        warnings.warn("JDA_HTTP2 is set but the h2 package is not installed, using HTTP/1.1")
+        http2 = False
+    return DefaultHttpxClient(
+        http2=http2,
+        limits=Limits(
+            max_connections=POOL_SIZE,
+            max_keepalive_connections=POOL_SIZE,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        timeout=Timeout(TIMEOUT, connect=CONNECT_TIMEOUT),
+        event_hooks={"request": [_on_request], "response": [_on_response]},
+    )
+
+
+def _create_api_client(api_key: Optional[str], base_url: Optional[str]) -> Any:
+    if os.getenv("JDA_FAKE_LLM"):
+        from fake_llm import FakeOpenAI
+
+        return FakeOpenAI()
+    # Deferred, importing openai dominates the import time of the modules that use it and
+    # commands that never call the API should not pay for it
+    from openai import OpenAI
+
+    return OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=MAX_RETRIES,
+        timeout=TIMEOUT,
+        http_client=_create_http_client(),
+    )
+
+
+def _create_client(api_key: Optional[str], base_url: Optional[str]) -> Any:
+    cassette = get_cassette()
+    if cassette is None:
+        return _create_api_client(api_key, base_url)
+    if cassette.mode == "replay":
+        # Offline, neither the network nor openai is needed
+        return CassetteClient(cassette)
+    return CassetteClient(cassette, _create_api_client(api_key, base_url))
+
+
+def get_client(
+    api_key: Optional[str] = None,
+    timeout: Optional[float] = None,
+    base_url: Optional[str] = None,
+) -> Any:
+    """
+    Returns the client of this process for the API key, created on first use.
+
+    Every caller shares the client and so its connection pool, retries and timeouts.
+    Setting the ``JDA_FAKE_LLM`` environment variable returns an offline client that
+    answers with schema-conforming JSON after ``JDA_FAKE_LLM_LATENCY`` seconds instead.
+    Setting ``JDA_CASSETTE`` records the calls to a cassette file or replays them from
+    it, see the ``cassette`` module.
+
+    Parameters
+    ----------
+    api_key : Optional[str], optional
+        The OpenAI API key, by default ``OPENAI_API_KEY``.
+    timeout : Optional[float], optional
+        The timeout of the calls made with the returned client in seconds, by default
+        ``JDA_LLM_TIMEOUT``. The client still shares the pool of the default one.
+    base_url : Optional[str], optional
+        The URL of the API, by default ``OPENAI_BASE_URL`` or the OpenAI API.
+
+    Returns
+    -------
+    Any
+        An ``OpenAI`` client or a drop-in replacement for it.
+    """
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    base_url = base_url or os.getenv("OPENAI_BASE_URL")
+    fake = os.getenv("JDA_FAKE_LLM", "")
+    latency = os.getenv("JDA_FAKE_LLM_LATENCY", "") if fake else ""
+    cassette = get_cassette()
+    recording = "" if cassette is None else f"{cassette.path}:{cassette.mode}:{cassette.latency}"
+    key = (api_key or "", base_url or "", fake, latency, recording)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = _create_client(api_key, base_url)
+    if timeout is not None:
+        client = client.with_options(timeout=timeout)
+    return client
+
+
+def close_clients() -> None:
+    """
+    Closes the connections of every client, e.g. when a worker shuts down.
+    """
+    with _lock:
+        for client in _clients.values():
+            close = getattr(client, "close", None)
+            if close is not None:
+                close()
+        _clients.clear()
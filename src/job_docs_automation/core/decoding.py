@@ -0,0 +1,107 @@
+"""Contains the schema-aware decoder of structured LLM responses."""
+
+import json
+from typing import Any, Dict, FrozenSet, Iterable, List, Set, Tuple
+
+# Fields the model fills to reason before answering, not shown or passed to later steps
+DROP_FIELDS = ("reason",)
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def schema_properties(schema: Any) -> Set[str]:
+    """
+    Collects the property names declared anywhere in a JSON schema, including ``$defs``.
+
+    Parameters
+    ----------
+    schema : Any
+        The schema or a part of it.
+
+    Returns
+    -------
+    Set[str]
+        The property names.
+    """
+    names: Set[str] = set()
+    stack = [schema]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            properties = node.get("properties")
+            if isinstance(properties, dict):
+                names.update(properties)
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return names
+
+
+class ResponseDecoder:
+    """
+    Decodes the JSON responses of one prompt in a single pass.
+
+    Fields to drop are removed while the objects are built, so the tree is never walked
+    again. Schemas that declare none of them are parsed by the plain C decoder.
+
+    Parameters
+    ----------
+    output_schema : Dict[str, Any]
+        The output schema of the prompt.
+    drop_fields : Iterable[str], optional
+        The fields to drop, by default DROP_FIELDS.
+    """
+
+    drop: FrozenSet[str]
+
+    def __init__(self, output_schema: Dict[str, Any], drop_fields: Iterable[str] = DROP_FIELDS):
+        self.drop = frozenset(drop_fields) & schema_properties(output_schema)
+        if self.drop:
+            drop = self.drop
+
+            def object_pairs_hook(pairs: List[Tuple[str, Any]]) -> Dict[str, Any]:
+                return {key: value for key, value in pairs if key not in drop}
+
+            self._decoder = json.JSONDecoder(object_pairs_hook=object_pairs_hook)
+        else:
+            self._decoder = json.JSONDecoder()
+
+    def decode(self, text: str) -> Any:
+        """
+        Parses a response and drops the configured fields.
+
+        Parameters
+        ----------
+        text : str
+            The JSON text of the response.
+
+        Returns
+        -------
+        Any
+            The decoded value, usually a dictionary.
+
+        Raises
+        ------
+        json.JSONDecodeError
+            If the response is not valid JSON.
+        """
+        return self._decoder.decode(text)
+
+
+def canonical_json(value: Any) -> str:
+    """
+    Serializes a decoded output to compact JSON, the form stored and returned for steps.
+
+    Keys keep the order of the schema, which is the order the model answers in.
+
+    Parameters
+    ----------
+    value : Any
+        The decoded output.
+
+    Returns
+    -------
+    str
+        The JSON text without whitespace between tokens.
+    """
+    return _ENCODER.encode(value)
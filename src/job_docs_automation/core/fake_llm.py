@@ -0,0 +1,234 @@
+"""Contains an offline stand-in for the OpenAI client, used for load tests and local development."""
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List
+
+# Like the provider, prefixes are cached from 1024 tokens on, in steps of 128 tokens
+CACHE_MIN_TOKENS = 1024
+CACHE_STEP_TOKENS = 128
+_prefix_cache: "OrderedDict[bytes, None]" = OrderedDict()
+_prefix_lock = threading.Lock()
+
+
+def fake_value(schema: Dict[str, Any], defs: Dict[str, Any], depth: int = 0) -> Any:
+    """
+    Builds a value that conforms to a (strict mode) JSON schema.
+
+    Parameters
+    ----------
+    schema : Dict[str, Any]
+        The schema of the value.
+    defs : Dict[str, Any]
+        The ``$defs`` of the root schema, used to resolve references.
+    depth : int, optional
+        The current nesting level, used to stop recursive schemas, by default 0.
+
+    Returns
+    -------
+    Any
+        A value matching the schema.
+    """
+    if "$ref" in schema:
+        ref = schema["$ref"].split("/")[-1]
+        return fake_value(defs.get(ref, {}), defs, depth + 1) if ref in defs else None
+    if "anyOf" in schema:
+        options = schema["anyOf"]
+        # Prefer null in recursive structures so the output stays finite
+        nullable = [option for option in options if option.get("type") == "null"]
+        if depth > 3 and nullable:
+            return None
+        return fake_value(options[0], defs, depth + 1)
+    if "enum" in schema:
+        return schema["enum"][0]
+    schema_type = schema.get("type")
+    if isinstance(schema_type, list):
+        schema_type = schema_type[0]
+    if schema_type == "object":
+        return {
+            key: fake_value(value, defs, depth + 1)
+            for key, value in schema.get("properties", {}).items()
+        }
+    if schema_type == "array":
+        return (
+            [] if depth > 3 else [fake_value(schema.get("items", {}), defs, depth + 1)]
+        )
+    if schema_type in ("number", "integer"):
+        return 1
+    if schema_type == "boolean":
+        return True
+    if schema_type == "null":
+        return None
+    description = schema.get("description", "")
+    return f"Lorem ipsum dolor sit amet. {description}".strip()
+
+
+def cached_prefix_tokens(prompt_text: str, capacity: int = 100000) -> int:
+    """
+    Simulates the provider's prompt cache for a serialized prompt.
+
+    Parameters
+    ----------
+    prompt_text : str
+        The serialized request, schema and messages in the order they are sent.
+    capacity : int, optional
+        The number of prefixes kept, by default 100000.
+
+    Returns
+    -------
+    int
+        The tokens of the longest prefix seen before, at four characters per token.
+    """
+    step = CACHE_STEP_TOKENS * 4
+    boundaries = range(CACHE_MIN_TOKENS * 4, len(prompt_text) + 1, step)
+    digests = [
+        hashlib.blake2b(prompt_text[:end].encode("utf-8"), digest_size=16).digest()
+        for end in boundaries
+    ]
+    cached = 0
+    with _prefix_lock:
+        for end, digest in zip(boundaries, digests):
+            if digest in _prefix_cache:
+                _prefix_cache.move_to_end(digest)
+                cached = end // 4
+            else:
+                _prefix_cache[digest] = None
+        while len(_prefix_cache) > capacity:
+            _prefix_cache.popitem(last=False)
+    return cached
+
+
+class FakeStream:
+    """
+    Mimics the stream returned by ``create(..., stream=True)`` for a complete response.
+
+    The content is split in chunks delivered over ``latency`` seconds, and the last chunk
+    carries the usage, like with ``stream_options={"include_usage": True}``. ``close``
+    may be called from another thread and stops the iteration at the next chunk.
+
+    Parameters
+    ----------
+    response : Any
+        The complete response.
+    latency : float, optional
+        The seconds until the last chunk, by default 0.
+    chunks : int, optional
+        The number of content chunks, by default 8.
+    """
+
+    def __init__(self, response: Any, latency: float = 0.0, chunks: int = 8):
+        self.response = response
+        self.latency = latency
+        self.chunks = chunks
+        self.closed = threading.Event()
+
+    def __iter__(self) -> Iterator[Any]:
+        content = self.response.choices[0].message.content or ""
+        size = max(1, -(-len(content) // self.chunks))
+        pieces = [
+            content[idx : idx + size] for idx in range(0, len(content), size)
+        ] or [""]
+        for piece in pieces:
+            # Waiting on the event lets close() interrupt the latency of the chunk
+            if self.closed.wait(self.latency / len(pieces)):
+                return
+            delta = SimpleNamespace(role="assistant", content=piece, refusal=None)
+            choice = SimpleNamespace(index=0, delta=delta, finish_reason=None)
+            yield SimpleNamespace(
+                model=self.response.model, choices=[choice], usage=None
+            )
+        if not self.closed.is_set():
+            yield SimpleNamespace(
+                model=self.response.model, choices=[], usage=self.response.usage
+            )
+
+    def close(self) -> None:
+        self.closed.set()
+
+
+class _Completions:
+    def __init__(self, client: "FakeOpenAI"):
+        self._client = client
+
+    def create(self, messages: List[Dict[str, Any]], model: str, **kwargs: Any) -> Any:
+        """
+        Mimics ``client.chat.completions.create`` for ``json_schema`` responses.
+        """
+        if not kwargs.get("stream"):
+            self._client.sleep()
+        response_format = kwargs.get("response_format") or {}
+        json_schema = response_format.get("json_schema") or {}
+        schema = json_schema.get("schema", {})
+        content = json.dumps(fake_value(schema, schema.get("$defs", {})))
+        prompt_text = json.dumps(response_format, sort_keys=True) + "".join(
+            message["role"]
+            + (part.get("text", "") if isinstance(part, dict) else str(part))
+            for message in messages
+            for part in (
+                message["content"]
+                if isinstance(message["content"], list)
+                else [message["content"]]
+            )
+        )
+        prompt_chars = len(prompt_text)
+        with self._client.lock:
+            self._client.calls += 1
+        message = SimpleNamespace(role="assistant", content=content, refusal=None)
+        usage = SimpleNamespace(
+            prompt_tokens=prompt_chars // 4,
+            completion_tokens=len(content) // 4,
+            total_tokens=(prompt_chars + len(content)) // 4,
+            prompt_tokens_details=SimpleNamespace(
+                cached_tokens=cached_prefix_tokens(prompt_text)
+            ),
+        )
+        response = SimpleNamespace(
+            id="chatcmpl-fake",
+            model=model,
+            choices=[SimpleNamespace(index=0, finish_reason="stop", message=message)],
+            usage=usage,
+        )
+        if kwargs.get("stream"):
+            return FakeStream(response, self._client.delay())
+        return response
+
+
+class FakeOpenAI:
+    """
+    Offline client returning schema-conforming JSON after a configurable latency.
+
+    Parameters
+    ----------
+    latency : float, optional
+        Mean latency of a call in seconds, by default ``JDA_FAKE_LLM_LATENCY`` or 0.
+    jitter : float, optional
+        Relative jitter applied to the latency, by default 0.2.
+    """
+
+    def __init__(self, latency: float = -1.0, jitter: float = 0.2, **kwargs: Any):
+        if latency < 0:
+            latency = float(os.getenv("JDA_FAKE_LLM_LATENCY", "0"))
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=_Completions(self))
+
+    def with_options(self, **kwargs: Any) -> "FakeOpenAI":
+        """
+        Mimics ``client.with_options``, the options have no effect offline.
+        """
+        return self
+
+    def delay(self) -> float:
+        return self.latency * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def sleep(self) -> None:
+        if self.latency > 0:
+            time.sleep(self.delay())
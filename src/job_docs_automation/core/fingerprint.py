@@ -0,0 +1,183 @@
+"""Contains MinHash fingerprints of job postings to detect near-duplicate runs."""
+
+import hashlib
+import random
+import re
+import threading
+import unicodedata
+from array import array
+from typing import Dict, Iterable, List, Set, Tuple
+
+NUM_PERM = 64
+BANDS = 16
+SHINGLE_SIZE = 4
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Fixed permutations, fingerprints must stay comparable across processes and releases
+_rng = random.Random(0x4A4441)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+
+_TRACKING_PARAMS = re.compile(
+    r"(?:utm_\w+|gclid|fbclid|mc_cid|mc_eid|trk\w*|ref\w*|src|source|campaign\w*)=[^&\s#]*&?",
+    re.IGNORECASE,
+)
+_BULLET = re.compile(r"^\s*(?:[-*•·▪●◦‣–—]+|\(?\d{1,2}[.)]|\(?[a-z][.)])\s+", re.IGNORECASE)
+_WORD = re.compile(r"\w+")
+
+
+def normalize_posting(text: str) -> List[str]:
+    """
+    Normalizes a job posting into a list of lines of words.
+
+    Tracking parameters in URLs, bullet markers, case, punctuation and whitespace are
+    dropped, so that re-pasted postings with formatting-only changes normalize the same.
+
+    Parameters
+    ----------
+    text : str
+        The job posting.
+
+    Returns
+    -------
+    List[str]
+        The non-empty normalized lines.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _TRACKING_PARAMS.sub("", text)
+    lines = []
+    for line in text.splitlines():
+        words = _WORD.findall(_BULLET.sub("", line))
+        if words:
+            lines.append(" ".join(words))
+    return lines
+
+
+def shingles(lines: Iterable[str], size: int = SHINGLE_SIZE) -> Set[str]:
+    """
+    Computes the word shingles of each line.
+
+    Shingles never span two lines, so reordering bullet points does not change the set.
+
+    Parameters
+    ----------
+    lines : Iterable[str]
+        The normalized lines.
+    size : int, optional
+        The number of words per shingle, by default SHINGLE_SIZE.
+
+    Returns
+    -------
+    Set[str]
+        The shingles.
+    """
+    result = set()
+    for line in lines:
+        words = line.split(" ")
+        if len(words) <= size:
+            result.add(line)
+            continue
+        for idx in range(len(words) - size + 1):
+            result.add(" ".join(words[idx : idx + size]))
+    return result
+
+
+def fingerprint(text: str) -> bytes:
+    """
+    Computes the MinHash signature of a job posting.
+
+    Parameters
+    ----------
+    text : str
+        The job posting.
+
+    Returns
+    -------
+    bytes
+        ``NUM_PERM`` 32-bit minimums, 256 bytes.
+    """
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+        for shingle in shingles(normalize_posting(text))
+    ]
+    signature = array("I", [_MAX_HASH] * NUM_PERM)
+    if hashes:
+        for idx, (a, b) in enumerate(_PERMUTATIONS):
+            signature[idx] = min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+    return signature.tobytes()
+
+
+def similarity(signature_a: bytes, signature_b: bytes) -> float:
+    """
+    Estimates the Jaccard similarity of the postings behind two signatures.
+
+    Returns
+    -------
+    float
+        The fraction of equal MinHash values, between 0 and 1.
+    """
+    a, b = array("I"), array("I")
+    a.frombytes(signature_a)
+    b.frombytes(signature_b)
+    if len(a) != len(b) or not a:
+        return 0.0
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+class PostingIndex:
+    """
+    Locality-sensitive hashing index of posting fingerprints.
+
+    Signatures are split into ``BANDS`` bands. Two postings become candidates when any
+    band matches exactly, which keeps queries sublinear in the number of indexed runs.
+    """
+
+    def __init__(self) -> None:
+        self._signatures: Dict[int, bytes] = {}
+        self._buckets: Dict[Tuple[int, bytes], Set[int]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    @staticmethod
+    def _bands(signature: bytes) -> List[Tuple[int, bytes]]:
+        width = len(signature) // BANDS
+        return [(band, signature[band * width : (band + 1) * width]) for band in range(BANDS)]
+
+    def add(self, run_id: int, signature: bytes) -> None:
+        with self._lock:
+            self._signatures[run_id] = signature
+            for band in self._bands(signature):
+                self._buckets.setdefault(band, set()).add(run_id)
+
+    def query(self, signature: bytes, threshold: float) -> List[Tuple[int, float]]:
+        """
+        Finds the indexed postings similar to a new one.
+
+        Parameters
+        ----------
+        signature : bytes
+            The fingerprint of the new posting.
+        threshold : float
+            The minimum estimated Jaccard similarity.
+
+        Returns
+        -------
+        List[Tuple[int, float]]
+            The run id and similarity of every match reaching the threshold, the most
+            similar first and the most recent run first among equals.
+        """
+        with self._lock:
+            candidates: Set[int] = set()
+            for band in self._bands(signature):
+                candidates |= self._buckets.get(band, set())
+            scored = [
+                (similarity(signature, self._signatures[run_id]), run_id) for run_id in candidates
+            ]
+        return [
+            (run_id, score) for score, run_id in sorted(scored, reverse=True) if score >= threshold
+        ]
@@ -0,0 +1,416 @@
+"""
+Contains the pipeline manifest, a single JSON file declaring inputs and prompts.
+
+A manifest looks like::
+
+    {
+        "model": "gpt-4o",
+        "inputs": {"experience": "inputs/experience.txt", "education": {"text": "..."}},
+        "runtime_inputs": ["job_description"],
+        "prompts": [
+            {
+                "name": "find_company",
+                "prompt_file": "prompts/find_company/prompt.txt",
+                "input": "Job description:\\n<job_description>",
+                "schema_file": "prompts/find_company/schema.json",
+                "user_independent": true
+            },
+            {
+                "name": "write_cover_letter",
+                "prompt": "Write a cover letter.",
+                "input_file": "prompts/write_cover_letter/input.txt",
+                "schema_file": "prompts/write_cover_letter/schema.json",
+                "depends_on": ["find_company"],
+                "model": "gpt-4o-mini"
+            }
+        ],
+        "documents": [
+            {"name": "cover_letter", "step": "write_cover_letter", "field": "cover_letter"},
+            {"name": "email", "step": "write_email", "format": "text"}
+        ]
+    }
+
+Documents are the outputs of terminal steps that get rendered, by default the last step
+only. File paths are relative to the manifest, never to the working directory. The manifest is
+validated and compiled into a bundle with every text and schema inlined, which later
+loads in a single read as long as the manifest and the files it references are unchanged.
+"""
+
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend import (
+    DOCUMENT_FORMATS,
+    MODEL,
+    PLACEHOLDER,
+    Prompt,
+    check_user_independent,
+    read_files,
+)
+from runner import OutputDocument, default_documents
+from step_cache import DEFAULT_TTL, SHARED_INPUTS
+from strict_schema import StrictSchemaError, normalize_schemas, warn_fixes
+from tracing import span
+
+BUNDLE_VERSION = 3
+# Keys of a prompt entry copied to the bundle as they are
+PROMPT_OPTIONS = ("user_independent", "cache_ttl", "drop_fields")
+
+
+class ManifestError(ValueError):
+    """
+    Raised when a manifest is invalid, with every problem found listed in ``errors``.
+    """
+
+    def __init__(self, path: str, errors: List[str]):
+        self.path = path
+        self.errors = errors
+        super().__init__(f"Invalid pipeline manifest {path}:\n- " + "\n- ".join(errors))
+
+
+def _read_text(
+    base_dir: str, entry: Dict[str, Any], key: str, sources: Dict[str, List[int]]
+) -> str:
+    """
+    Reads the inline ``key`` or the ``<key>_file`` of an entry, recording the file's stat.
+    """
+    if key in entry:
+        return entry[key]
+    path = os.path.join(base_dir, entry[f"{key}_file"])
+    with open(path, "r", encoding="utf-8") as file:
+        stat = os.fstat(file.fileno())
+        sources[path] = [stat.st_mtime_ns, stat.st_size]
+        return file.read()
+
+
+def document_errors(
+    documents: List[Dict[str, Any]], prompts: Dict[str, Dict[str, Any]]
+) -> List[str]:
+    """
+    Checks the documents rendered from the outputs of the steps.
+
+    Parameters
+    ----------
+    documents : List[Dict[str, Any]]
+        The document entries of the manifest.
+    prompts : Dict[str, Dict[str, Any]]
+        The compiled prompt entries by name.
+
+    Returns
+    -------
+    List[str]
+        The problems found.
+    """
+    errors = []
+    names = [document.get("name") for document in documents]
+    for document in documents:
+        name, step = document.get("name"), document.get("step")
+        if not name or not step:
+            errors.append("every document needs a name and a step")
+            continue
+        if names.count(name) > 1:
+            errors.append(f"document '{name}': name is declared more than once")
+        if step not in prompts:
+            errors.append(f"document '{name}': unknown step '{step}'")
+            continue
+        if document.get("format", "docx") not in DOCUMENT_FORMATS:
+            errors.append(f"document '{name}': unsupported format '{document['format']}'")
+        properties = prompts[step]["schema"].get("properties", {})
+        if "field" in document and document["field"] not in properties:
+            errors.append(f"document '{name}': step '{step}' has no field '{document['field']}'")
+    return errors
+
+
+def order_prompts(entries: List[Dict[str, Any]], errors: List[str]) -> List[Dict[str, Any]]:
+    """
+    Sorts the prompts topologically by their dependencies, keeping the declared order
+    where it is free.
+
+    Parameters
+    ----------
+    entries : List[Dict[str, Any]]
+        The prompt entries with their ``depends_on`` sets resolved.
+    errors : List[str]
+        Receives a message for every dependency cycle.
+
+    Returns
+    -------
+    List[Dict[str, Any]]
+        The entries in execution order, without the ones in a cycle.
+    """
+    pending = {entry["name"]: entry for entry in entries}
+    ordered: List[Dict[str, Any]] = []
+    while pending:
+        ready = [
+            entry for entry in pending.values() if not (entry["depends_on"] & pending.keys())
+        ]
+        if not ready:
+            errors.append(f"dependency cycle between prompts {sorted(pending)}")
+            break
+        # One at a time, so an entry never overtakes an earlier declared one that is ready
+        entry = ready[0]
+        ordered.append(entry)
+        del pending[entry["name"]]
+    return ordered
+
+
+def compile_manifest(path: str) -> Dict[str, Any]:
+    """
+    Reads and validates a manifest and inlines everything it references.
+
+    Parameters
+    ----------
+    path : str
+        The path to the manifest.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The bundle: inputs, prompts in execution order and the stats of the source files.
+
+    Raises
+    ------
+    ManifestError
+        If the manifest or a file it references is invalid.
+    """
+    path = os.path.abspath(path)
+    base_dir = os.path.dirname(path)
+    stat = os.stat(path)
+    sources: Dict[str, List[int]] = {path: [stat.st_mtime_ns, stat.st_size]}
+    errors: List[str] = []
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+    except json.JSONDecodeError as error:
+        raise ManifestError(path, [f"not valid JSON: {error}"]) from error
+
+    default_model = manifest.get("model", MODEL)
+    inputs: Dict[str, str] = {}
+    for name, value in manifest.get("inputs", {}).items():
+        entry = {"text_file": value} if isinstance(value, str) else value
+        try:
+            inputs[name] = _read_text(base_dir, entry, "text", sources)
+        except (OSError, KeyError) as error:
+            errors.append(f"input '{name}': {error}")
+
+    available = set(inputs) | set(manifest.get("runtime_inputs", SHARED_INPUTS))
+    entries: List[Dict[str, Any]] = []
+    names = [entry.get("name") for entry in manifest.get("prompts", [])]
+    for entry in manifest.get("prompts", []):
+        name = entry.get("name")
+        if not name:
+            errors.append("every prompt needs a name")
+            continue
+        if names.count(name) > 1:
+            errors.append(f"prompt '{name}': name is declared more than once")
+        if name in available:
+            errors.append(f"prompt '{name}': name is also an input")
+        compiled: Dict[str, Any] = {"name": name, "model": entry.get("model", default_model)}
+        try:
+            compiled["prompt"] = ""
+            if "prompt" in entry or "prompt_file" in entry:
+                compiled["prompt"] = _read_text(base_dir, entry, "prompt", sources)
+            compiled["input"] = _read_text(base_dir, entry, "input", sources)
+            schema = entry.get("schema")
+            if schema is None:
+                schema = json.loads(_read_text(base_dir, entry, "schema", sources))
+            compiled["schema"] = schema
+        except KeyError as error:
+            errors.append(f"prompt '{name}': missing {error.args[0]} or its inline value")
+            continue
+        except (OSError, ValueError) as error:
+            errors.append(f"prompt '{name}': {error}")
+            continue
+        for key in PROMPT_OPTIONS:
+            if key in entry:
+                compiled[key] = entry[key]
+
+        referenced = {
+            match.group(1).split(".")[0] for match in PLACEHOLDER.finditer(compiled["input"])
+        }
+        undefined = sorted(referenced - available - set(names))
+        if undefined:
+            errors.append(f"prompt '{name}': undefined placeholders {undefined}")
+        depends_on = set(entry.get("depends_on", []))
+        unknown = sorted(depends_on - set(names))
+        if unknown:
+            errors.append(f"prompt '{name}': depends on unknown prompts {unknown}")
+        compiled["depends_on"] = (depends_on | referenced) & set(names) - {name}
+        if name in referenced:
+            errors.append(f"prompt '{name}': references its own output")
+        entries.append(compiled)
+
+    try:
+        schemas, fixes = normalize_schemas({entry["name"]: entry["schema"] for entry in entries})
+    except StrictSchemaError as error:
+        errors.extend(error.errors)
+    else:
+        warn_fixes(fixes)
+        for entry in entries:
+            entry["schema"] = schemas[entry["name"]]
+    ordered = order_prompts(entries, errors)
+    documents = manifest.get("documents", [])
+    errors.extend(document_errors(documents, {entry["name"]: entry for entry in entries}))
+    if errors:
+        raise ManifestError(path, errors)
+    for entry in ordered:
+        entry["depends_on"] = sorted(entry["depends_on"])
+    try:
+        check_user_independent([prompt_from_bundle(entry) for entry in ordered])
+    except ValueError as error:
+        raise ManifestError(path, [str(error)]) from error
+    return {
+        "version": BUNDLE_VERSION,
+        "sources": sources,
+        "inputs": inputs,
+        "prompts": ordered,
+        "documents": documents,
+    }
+
+
+def prompt_from_bundle(entry: Dict[str, Any]) -> Prompt:
+    """
+    Builds a :class:`Prompt` from a compiled prompt entry.
+    """
+    options = {key: entry[key] for key in PROMPT_OPTIONS if key in entry}
+    options.setdefault("cache_ttl", DEFAULT_TTL)
+    return Prompt(
+        entry["name"],
+        entry["prompt"],
+        entry["input"],
+        entry["schema"],
+        model=entry["model"],
+        depends_on=entry.get("depends_on", ()),
+        **options,
+    )
+
+
+def bundle_path(manifest_path: str) -> str:
+    """
+    Returns where the bundle of a manifest is cached, ``JDA_BUNDLE_DIR`` or next to it.
+    """
+    manifest_path = os.path.abspath(manifest_path)
+    bundle_dir = os.getenv("JDA_BUNDLE_DIR") or os.path.dirname(manifest_path)
+    stem = os.path.splitext(os.path.basename(manifest_path))[0]
+    return os.path.join(bundle_dir, f".{stem}.bundle.json")
+
+
+def _is_fresh(bundle: Dict[str, Any]) -> bool:
+    if bundle.get("version") != BUNDLE_VERSION:
+        return False
+    for source, (mtime_ns, size) in bundle["sources"].items():
+        try:
+            stat = os.stat(source)
+        except OSError:
+            return False
+        if stat.st_mtime_ns != mtime_ns or stat.st_size != size:
+            return False
+    return True
+
+
+def load_bundle(manifest_path: str) -> Dict[str, Any]:
+    """
+    Loads the compiled bundle of a manifest, compiling it again if a source changed.
+
+    Parameters
+    ----------
+    manifest_path : str
+        The path to the manifest.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The bundle.
+    """
+    cache_path = bundle_path(manifest_path)
+    bundle: Optional[Dict[str, Any]] = None
+    try:
+        with open(cache_path, "r", encoding="utf-8") as file:
+            bundle = json.load(file)
+    except (OSError, ValueError):
+        bundle = None
+    if bundle is not None and _is_fresh(bundle):
+        return bundle
+
+    bundle = compile_manifest(manifest_path)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(bundle, file, ensure_ascii=False, separators=(",", ":"))
+        # Atomic, concurrent workers never read a partial bundle
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # A read-only deployment still works, it just compiles on every start
+        pass
+    return bundle
+
+
+def load_pipeline(manifest_path: str) -> Tuple[Dict[str, str], List[Prompt]]:
+    """
+    Loads the inputs and prompts of a pipeline manifest.
+
+    Parameters
+    ----------
+    manifest_path : str
+        The path to the manifest.
+
+    Returns
+    -------
+    Tuple[Dict[str, str], List[Prompt]]
+        The same as :func:`backend.read_files`: the inputs and the prompts in execution order.
+    """
+    with span("load_pipeline", **{"jda.manifest": manifest_path}):
+        bundle = load_bundle(manifest_path)
+        return dict(bundle["inputs"]), [prompt_from_bundle(entry) for entry in bundle["prompts"]]
+
+
+def load_configured_pipeline(
+    manifest_path: Optional[str] = None,
+) -> Tuple[Dict[str, str], List[Prompt]]:
+    """
+    Loads the pipeline manifest given or set in ``JDA_PIPELINE``, or else the legacy
+    ``inputs/`` and ``prompts/`` directories of the working directory.
+
+    Parameters
+    ----------
+    manifest_path : Optional[str], optional
+        The path to the manifest, by default ``JDA_PIPELINE``.
+
+    Returns
+    -------
+    Tuple[Dict[str, str], List[Prompt]]
+        The inputs and the prompts in execution order.
+    """
+    manifest_path = manifest_path or os.getenv("JDA_PIPELINE")
+    if manifest_path:
+        return load_pipeline(manifest_path)
+    return read_files(input_filenames="inputs.txt", prompt_filenames="prompts_2.txt")
+
+
+def load_documents(manifest_path: Optional[str], prompts: List[Prompt]) -> List[OutputDocument]:
+    """
+    Loads the documents declared by a manifest.
+
+    Parameters
+    ----------
+    manifest_path : Optional[str]
+        The path to the manifest, by default ``JDA_PIPELINE``.
+    prompts : List[Prompt]
+        The prompts of the pipeline.
+
+    Returns
+    -------
+    List[OutputDocument]
+        The documents, or the last step only for legacy pipelines and manifests without any.
+    """
+    manifest_path = manifest_path or os.getenv("JDA_PIPELINE")
+    documents = load_bundle(manifest_path)["documents"] if manifest_path else []
+    if not documents:
+        return default_documents(prompts)
+    return [
+        OutputDocument(
+            document["name"], document["step"], document.get("format", "docx"), document.get("field")
+        )
+        for document in documents
+    ]
@@ -0,0 +1,299 @@
+"""Contains a lightweight Prometheus-style metrics registry for the generation pipeline."""
+
+import bisect
+import os
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+# Set JDA_METRICS=0 to turn every observation into a no-op
+ENABLED = os.getenv("JDA_METRICS", "1") != "0"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind: str
+    name: str
+    documentation: str
+    label_names: Tuple[str, ...]
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """
+        Renders the metric in the Prometheus text exposition format.
+
+        Returns
+        -------
+        str
+            The HELP and TYPE lines followed by one line per sample.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, _format_labels(self.label_names, key), value) for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (last one is +Inf)..., sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            state[idx] += 1
+            state[-1] += value
+
+    def count(self, **labels: str) -> int:
+        state = self._values.get(self._key(labels))
+        return int(sum(state[:-1])) if state else 0
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        samples = []
+        for key, state in items:
+            cumulative = 0.0
+            bounds = [f"{bound:g}" for bound in self.buckets] + ["+Inf"]
+            for bound, bucket_count in zip(bounds, state[:-1]):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names + ("le",), key + (bound,))
+                samples.append((f"{self.name}_bucket", labels, cumulative))
+            labels = _format_labels(self.label_names, key)
+            samples.append((f"{self.name}_sum", labels, state[-1]))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+M = TypeVar("M", bound=_Metric)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: M) -> M:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """
+        Renders every registered metric in the Prometheus text exposition format.
+
+        Returns
+        -------
+        str
+            The exposition text, terminated by a newline.
+        """
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+OPERATION_DURATION = REGISTRY.register(
+    Histogram(
+        "jda_operation_duration_seconds",
+        "Latency of pipeline operations.",
+        ("operation", "prompt"),
+    )
+)
+OPERATION_ERRORS = REGISTRY.register(
+    Counter("jda_operation_errors_total", "Pipeline operations that raised.", ("operation", "prompt"))
+)
+IN_FLIGHT = REGISTRY.register(
+    Gauge("jda_operations_in_flight", "Pipeline operations currently running.", ("operation",))
+)
+LLM_TOKENS = REGISTRY.register(
+    Counter(
+        "jda_llm_tokens_total",
+        "Tokens reported by the LLM provider, by kind (prompt, completion, cached).",
+        ("prompt", "model", "kind"),
+    )
+)
+CACHE_REQUESTS = REGISTRY.register(
+    Counter("jda_cache_requests_total", "Cache lookups by cache and result.", ("cache", "result"))
+)
+LLM_CANCELLATIONS = REGISTRY.register(
+    Counter(
+        "jda_llm_cancellations_total",
+        "LLM calls stopped before their end, by reason (aborted, superseded, disconnected).",
+        ("prompt", "reason"),
+    )
+)
+# Fair share of the LLM calls, see scheduler.FairScheduler
+QUEUE_WAIT = REGISTRY.register(
+    Histogram(
+        "jda_scheduler_queue_wait_seconds",
+        "Time LLM calls waited for a slot, by priority class (interactive, prefetch, batch).",
+        ("priority",),
+    )
+)
+QUEUED = REGISTRY.register(
+    Gauge("jda_scheduler_queued", "LLM calls waiting for a slot, by priority class.", ("priority",))
+)
+# Connections reused = requests - connections opened
+HTTP_REQUESTS = REGISTRY.register(
+    Counter("jda_http_requests_total", "HTTP requests to the LLM provider by status.", ("status",))
+)
+HTTP_CONNECTIONS = REGISTRY.register(
+    Counter("jda_http_connections_opened_total", "HTTP connections opened to the LLM provider.")
+)
+
+
+@contextmanager
+def track(operation: str, prompt: str = "") -> Iterator[None]:
+    """
+    Records latency, errors and in-flight count of the wrapped block.
+
+    Parameters
+    ----------
+    operation : str
+        The name of the operation, e.g. ``generate_text``.
+    prompt : str, optional
+        The name of the prompt the operation works on, by default "".
+    """
+    if not ENABLED:
+        yield
+        return
+    IN_FLIGHT.inc(operation=operation)
+    start = perf_counter()
+    try:
+        yield
+    except BaseException:
+        OPERATION_ERRORS.inc(operation=operation, prompt=prompt)
+        raise
+    finally:
+        IN_FLIGHT.dec(operation=operation)
+        OPERATION_DURATION.observe(perf_counter() - start, operation=operation, prompt=prompt)
+
+
+def record_usage(prompt: str, model: str, usage: object) -> None:
+    """
+    Records the token usage of an LLM response.
+
+    Parameters
+    ----------
+    prompt : str
+        The name of the prompt.
+    model : str
+        The model that served the request.
+    usage : object
+        The ``usage`` attribute of the response, or None.
+    """
+    if not ENABLED or usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    LLM_TOKENS.inc(prompt_tokens, prompt=prompt, model=model, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, prompt=prompt, model=model, kind="completion")
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", 0) or 0
+    LLM_TOKENS.inc(cached_tokens, prompt=prompt, model=model, kind="cached")
+    record_cache("provider_prompt", cached_tokens > 0)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """
+    Records a cache lookup.
+
+    Parameters
+    ----------
+    cache : str
+        The name of the cache.
+    hit : bool
+        Whether the lookup was a hit.
+    """
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_cancellation(prompt: str, reason: str) -> None:
+    """
+    Records an LLM call stopped because its output is no longer wanted.
+
+    Parameters
+    ----------
+    prompt : str
+        The name of the prompt.
+    reason : str
+        Why the call was cancelled, e.g. ``disconnected``.
+    """
+    LLM_CANCELLATIONS.inc(prompt=prompt, reason=reason)
@@ -0,0 +1,304 @@
+"""Contains a BM25 index over profile chunks, used to keep only the relevant parts in prompts."""
+
+import hashlib
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+TOP_K = int(os.getenv("JDA_RETRIEVAL_TOP_K", "5"))
+K1 = 1.5
+B = 0.75
+
+_WORD = re.compile(r"[^\W_]+(?:[+#.][^\W_]*)*")
+_BULLET = re.compile(r"^\s*(?:[-*•·▪●◦‣–—]+|\d{1,2}[.)])\s+")
+STOPWORDS = frozenset(
+    """a an and are as at be been but by for from has have in into is it its of on or our
+    that the their this to was we were will with you your i my me he she they them his her
+    not no so if than then there these those which who whom what when where how all any
+    can could should would may might must also very more most other such only own same
+    about over under again further once here both each few some nor too just""".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into lower-case terms, dropping stop words and plural endings.
+
+    Parameters
+    ----------
+    text : str
+        The text to tokenize.
+
+    Returns
+    -------
+    List[str]
+        The terms.
+    """
+    terms = []
+    for word in _WORD.findall(text.casefold()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 4 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def chunk_text(text: str) -> List[str]:
+    """
+    Splits a profile field into retrievable chunks.
+
+    Paragraphs separated by blank lines are chunks, and so is every bullet point. A line
+    ending with a colon is a heading and is repeated at the start of each bullet under it.
+
+    Parameters
+    ----------
+    text : str
+        The profile field.
+
+    Returns
+    -------
+    List[str]
+        The chunks in their original order.
+    """
+    chunks: List[str] = []
+    for paragraph in re.split(r"\n\s*\n", text.strip()):
+        current: List[str] = []
+        heading = ""
+        for line in paragraph.splitlines():
+            if not line.strip():
+                continue
+            if _BULLET.match(line):
+                if current:
+                    chunks.append("\n".join(current))
+                current = [heading + line.strip()]
+            elif line.rstrip().endswith(":") and not current:
+                heading = line.strip() + "\n"
+            else:
+                current.append(line.strip())
+        if current:
+            chunks.append("\n".join(current))
+        elif heading:
+            chunks.append(heading.strip())
+    return chunks
+
+
+def _digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class _LRU(OrderedDict):
+    def __init__(self, capacity: int):
+        super().__init__()
+        self.capacity = capacity
+
+    def lookup(self, key: str):
+        value = self.get(key)
+        if value is not None:
+            self.move_to_end(key)
+        return value
+
+    def store(self, key: str, value) -> None:
+        self[key] = value
+        self.move_to_end(key)
+        while len(self) > self.capacity:
+            self.popitem(last=False)
+
+
+# Term counts of individual chunks, shared by every index so that editing one item of a
+# profile only tokenizes that item again
+_chunk_terms: _LRU = _LRU(20000)
+_indexes: _LRU = _LRU(512)
+_lock = threading.Lock()
+
+
+class FieldIndex:
+    """
+    BM25 index over the chunks of one profile field.
+
+    Parameters
+    ----------
+    chunks : List[str]
+        The chunks of the field.
+    """
+
+    def __init__(self, chunks: List[str]):
+        self.chunks = chunks
+        self.terms: List[Counter] = []
+        self.lengths: List[int] = []
+        self.df: Counter = Counter()
+        for chunk in chunks:
+            key = _digest(chunk)
+            with _lock:
+                terms = _chunk_terms.lookup(key)
+            if terms is None:
+                terms = Counter(tokenize(chunk))
+                with _lock:
+                    _chunk_terms.store(key, terms)
+            self.terms.append(terms)
+            self.lengths.append(sum(terms.values()))
+            self.df.update(terms.keys())
+        self.avgdl = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    def scores(self, query_terms: List[str]) -> List[float]:
+        """
+        Computes the Okapi BM25 score of every chunk.
+
+        Parameters
+        ----------
+        query_terms : List[str]
+            The tokenized query.
+
+        Returns
+        -------
+        List[float]
+            One score per chunk.
+        """
+        n = len(self.chunks)
+        query = Counter(query_terms)
+        idf = {
+            term: math.log((n - self.df[term] + 0.5) / (self.df[term] + 0.5) + 1)
+            for term in query
+            if self.df[term]
+        }
+        scores = []
+        for terms, length in zip(self.terms, self.lengths):
+            norm = K1 * (1 - B + B * length / self.avgdl) if self.avgdl else K1
+            score = 0.0
+            for term, weight in idf.items():
+                tf = terms.get(term, 0)
+                if tf:
+                    score += weight * tf * (K1 + 1) / (tf + norm)
+            scores.append(score)
+        return scores
+
+    def top_k(self, query: str, k: int) -> List[str]:
+        """
+        Selects the k chunks most relevant to the query, in their original order.
+
+        Parameters
+        ----------
+        query : str
+            The query text, typically the job description.
+        k : int
+            The number of chunks to keep.
+
+        Returns
+        -------
+        List[str]
+            The selected chunks.
+        """
+        if len(self.chunks) <= k:
+            return list(self.chunks)
+        scores = self.scores(tokenize(query))
+        ranked = sorted(range(len(scores)), key=lambda idx: (-scores[idx], idx))[:k]
+        return [self.chunks[idx] for idx in sorted(ranked)]
+
+
+def field_index(text: str) -> FieldIndex:
+    """
+    Returns the index of a field, building it from cached chunk terms if the text is new.
+
+    Parameters
+    ----------
+    text : str
+        The field text.
+
+    Returns
+    -------
+    FieldIndex
+        The index.
+    """
+    key = _digest(text)
+    with _lock:
+        index: Optional[FieldIndex] = _indexes.lookup(key)
+    if index is None:
+        index = FieldIndex(chunk_text(text))
+        with _lock:
+            _indexes.store(key, index)
+    return index
+
+
+def index_profile(fields: Dict[str, str]) -> None:
+    """
+    Indexes every field of a profile ahead of time, e.g. right after it is saved.
+
+    Parameters
+    ----------
+    fields : Dict[str, str]
+        The profile fields by name.
+    """
+    for text in fields.values():
+        if text:
+            field_index(text)
+
+
+def relevant(text: str, query: str, k: int = TOP_K) -> str:
+    """
+    Keeps the k chunks of the text most relevant to the query.
+
+    Parameters
+    ----------
+    text : str
+        The field text.
+    query : str
+        The query text.
+    k : int, optional
+        The number of chunks to keep, by default ``JDA_RETRIEVAL_TOP_K`` or 5.
+
+    Returns
+    -------
+    str
+        The selected chunks separated by blank lines.
+    """
+    if not query.strip():
+        return text
+    index = field_index(text)
+    if len(index.chunks) <= k:
+        return text
+    parts = []
+    last_heading = None
+    for chunk in index.top_k(query, k):
+        heading, _, body = chunk.partition("\n")
+        if not body or not heading.endswith(":"):
+            heading, body = "", chunk
+        # Bullets of the same heading are printed under it once
+        if heading and heading == last_heading:
+            parts[-1] += "\n" + body
+        else:
+            parts.append(chunk)
+        last_heading = heading
+    return "\n\n".join(parts)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens of a text, with tiktoken if it is installed.
+
+    Returns
+    -------
+    int
+        The number of tokens.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        # Roughly four characters per token for English text
+        return (len(text) + 3) // 4
+    return len(tiktoken.get_encoding("o200k_base").encode(text))
+
+
+def parse_filter(spec: str) -> Tuple[str, int]:
+    """
+    Parses a placeholder filter such as ``relevant`` or ``relevant:3``.
+
+    Returns
+    -------
+    Tuple[str, int]
+        The filter name and its k.
+    """
+    name, _, arg = spec.partition(":")
+    return name, int(arg) if arg else TOP_K
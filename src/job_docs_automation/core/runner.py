@@ -0,0 +1,328 @@
+"""Contains the runner executing the steps of a pipeline as a dependency graph."""
+
+import contextvars
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from backend import DOCUMENT_FORMATS, Prompt, execute_step, render_document
+from checkpoint import Checkpoint
+from step_cache import SharedStepCache
+from step_result import StepResult, step_input_hash
+from tracing import span
+
+
+class StepError(RuntimeError):
+    """
+    Raised when a step of a run produces no output.
+    """
+
+
+class RunResult:
+    """
+    The outputs, durations, token usage and rendered documents of one run.
+    """
+
+    outputs: Dict[str, Any]
+    timings: Dict[str, float]
+    usage: Dict[str, Dict[str, int]]
+    documents: Dict[str, str]
+    resumed: List[str]
+
+    def __init__(self) -> None:
+        self.outputs = {}
+        self.timings = {}
+        self.usage = {}
+        # The steps restored from a checkpoint instead of running
+        self.resumed = []
+        # The paths of the rendered documents by name
+        self.documents = {}
+
+
+class OutputDocument:
+    """
+    A document rendered from the output of a step.
+
+    Several documents, e.g. a cover letter, a CV summary and an application email, can be
+    rendered from different terminal steps that share the same upstream steps.
+
+    Parameters
+    ----------
+    name : str
+        The name of the document, used in its file name.
+    step : str
+        The step whose output is rendered.
+    output_format : str, optional
+        ``docx``, ``text`` or ``json``, by default ``docx``.
+    field : Optional[str], optional
+        The field of the output holding the text, by default all string fields.
+    """
+
+    name: str
+    step: str
+    output_format: str
+    field: Optional[str]
+
+    def __init__(
+        self, name: str, step: str, output_format: str = "docx", field: Optional[str] = None
+    ):
+        if output_format not in DOCUMENT_FORMATS:
+            raise ValueError(f"Unsupported document format '{output_format}'")
+        self.name = name
+        self.step = step
+        self.output_format = output_format
+        self.field = field
+
+
+def default_documents(prompts: List[Prompt]) -> List[OutputDocument]:
+    """
+    Returns the single document of a pipeline that declares none, rendered from its last step.
+    """
+    return [OutputDocument(prompts[-1].name, prompts[-1].name)] if prompts else []
+
+
+def step_graph(prompts: List[Prompt]) -> Dict[str, List[str]]:
+    """
+    Maps every step to the steps it depends on.
+
+    Parameters
+    ----------
+    prompts : List[Prompt]
+        The prompts of the pipeline in execution order.
+
+    Returns
+    -------
+    Dict[str, List[str]]
+        The dependencies of each step.
+    """
+    names = [prompt.name for prompt in prompts]
+    return {prompt.name: prompt.dependencies(names) for prompt in prompts}
+
+
+def required_steps(prompts: List[Prompt], targets: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Lists the steps needed to produce the targets, in execution order.
+
+    Parameters
+    ----------
+    prompts : List[Prompt]
+        The prompts of the pipeline in execution order.
+    targets : Optional[Iterable[str]], optional
+        The steps whose outputs are wanted, by default all of them.
+
+    Returns
+    -------
+    List[str]
+        The targets and all the steps they depend on.
+
+    Raises
+    ------
+    KeyError
+        If a target is not a step of the pipeline.
+    """
+    graph = step_graph(prompts)
+    if targets is None:
+        return list(graph)
+    needed: Set[str] = set()
+    stack = list(targets)
+    while stack:
+        name = stack.pop()
+        if name not in graph:
+            raise KeyError(f"Unknown step '{name}'")
+        if name not in needed:
+            needed.add(name)
+            stack.extend(graph[name])
+    return [name for name in graph if name in needed]
+
+
+def run_pipeline(
+    prompts: List[Prompt],
+    replacements: Dict[str, Any],
+    parallel: int = 1,
+    shared_cache: Optional[SharedStepCache] = None,
+    targets: Optional[Iterable[str]] = None,
+    on_step: Optional[Callable[[str, Any], None]] = None,
+    checkpoint: Optional[Checkpoint] = None,
+) -> RunResult:
+    """
+    Runs the steps of a pipeline, each as soon as the steps it depends on are done.
+
+    Parameters
+    ----------
+    prompts : List[Prompt]
+        The prompts of the pipeline in execution order.
+    replacements : Dict[str, Any]
+        The inputs of the run, updated with the output of every step.
+    parallel : int, optional
+        The maximum number of steps running at the same time, by default 1. With 0 the
+        steps run one after the other in the calling thread, e.g. to profile them.
+    shared_cache : Optional[SharedStepCache], optional
+        The cache for the outputs of user-independent steps, by default None.
+    targets : Optional[Iterable[str]], optional
+        The steps whose outputs are wanted, by default all of them.
+    on_step : Optional[Callable[[str, Any], None]], optional
+        Called with the name and output of every step once it is done, in the thread that
+        ran it, by default None.
+    checkpoint : Optional[Checkpoint], optional
+        Saves the result of every step once it is done, and restores the results of the
+        steps whose inputs have not changed instead of running them, by default None.
+
+    Returns
+    -------
+    RunResult
+        The outputs, durations and token usage of the steps that ran.
+
+    Raises
+    ------
+    StepError
+        If a step fails to produce an output.
+    """
+    graph = step_graph(prompts)
+    index = {prompt.name: idx for idx, prompt in enumerate(prompts)}
+    pending = required_steps(prompts, targets)
+    done: Set[str] = {name for name in graph if name in replacements and name not in pending}
+    result = RunResult()
+
+    def run_step(name: str, inputs: Dict[str, Any]) -> None:
+        # Reads and writes ``inputs``, its own copy of the replacements when steps run in
+        # threads, as the others add their outputs to theirs meanwhile
+        usage: Dict[str, int] = {}
+        start = time.perf_counter()
+        input_hash = b""
+        restored = None
+        if checkpoint is not None:
+            input_hash = step_input_hash(prompts[index[name]], inputs)
+            restored = checkpoint.restore(name, input_hash)
+        if restored is not None:
+            inputs[name] = restored.parsed
+            result.resumed.append(name)
+        else:
+            output = execute_step(index[name], prompts, inputs, shared_cache, usage)
+            if output is None:
+                raise StepError(f"Step '{name}' produced no output")
+            if checkpoint is not None:
+                checkpoint.save(
+                    StepResult(
+                        name,
+                        output.encode("utf-8"),
+                        usage,
+                        time.perf_counter() - start,
+                        prompts[index[name]].model,
+                        input_hash,
+                        parsed=inputs[name],
+                    )
+                )
+        result.timings[name] = time.perf_counter() - start
+        result.outputs[name] = inputs[name]
+        result.usage[name] = usage
+        if on_step is not None:
+            on_step(name, inputs[name])
+
+    def ready() -> List[str]:
+        return [name for name in pending if set(graph[name]) <= done]
+
+    with span("generation_run", **{"jda.steps": len(pending), "jda.parallel": parallel}):
+        if parallel <= 0:
+            # cProfile only sees the thread it was enabled in
+            while pending:
+                names = ready()
+                if not names:
+                    raise StepError(f"Steps {pending} depend on steps that are not in the run")
+                for name in names:
+                    pending.remove(name)
+                    run_step(name, replacements)
+                    done.add(name)
+            return result
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            running: Dict[Future, str] = {}
+            while pending or running:
+                for name in ready():
+                    if len(running) >= parallel:
+                        break
+                    pending.remove(name)
+                    # Each thread gets a copy of the context, so its spans join this run,
+                    # and of the replacements, which only this thread updates
+                    context = contextvars.copy_context()
+                    future = executor.submit(context.run, run_step, name, dict(replacements))
+                    running[future] = name
+                if not running:
+                    raise StepError(f"Steps {pending} depend on steps that are not in the run")
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    future.result()
+                    replacements[name] = result.outputs[name]
+                    done.add(name)
+    return result
+
+
+def run_documents(
+    prompts: List[Prompt],
+    replacements: Dict[str, Any],
+    documents: List[OutputDocument],
+    output_dir: str,
+    stem: str,
+    parallel: int = 1,
+    shared_cache: Optional[SharedStepCache] = None,
+    output_format: Optional[str] = None,
+    checkpoint: Optional[Checkpoint] = None,
+) -> RunResult:
+    """
+    Runs the steps needed by the documents and renders each one as soon as its step is done.
+
+    Upstream steps shared by several documents run once, and the steps specific to each
+    document run concurrently with up to ``parallel`` steps at a time.
+
+    Parameters
+    ----------
+    prompts : List[Prompt]
+        The prompts of the pipeline in execution order.
+    replacements : Dict[str, Any]
+        The inputs of the run, updated with the output of every step.
+    documents : List[OutputDocument]
+        The documents to render.
+    output_dir : str
+        The directory of the documents.
+    stem : str
+        The start of the file names, followed by the document name, e.g. ``acme-cover_letter``.
+    parallel : int, optional
+        The maximum number of steps running at the same time, by default 1, 0 to run them
+        in the calling thread.
+    shared_cache : Optional[SharedStepCache], optional
+        The cache for the outputs of user-independent steps, by default None.
+    output_format : Optional[str], optional
+        Overrides the format of every document, by default None.
+    checkpoint : Optional[Checkpoint], optional
+        The checkpoint of the run, see ``run_pipeline``, by default None. The documents of
+        restored steps are rendered again.
+
+    Returns
+    -------
+    RunResult
+        The result of the run, with the path of every document by name in ``documents``.
+    """
+    paths: Dict[str, str] = {}
+
+    def render(step: str, output: Any) -> None:
+        for document in documents:
+            if document.step == step:
+                name = stem if len(documents) == 1 else f"{stem}-{document.name}"
+                paths[document.name] = render_document(
+                    output,
+                    os.path.join(output_dir, name),
+                    output_format or document.output_format,
+                    document.field,
+                )
+
+    result = run_pipeline(
+        prompts,
+        replacements,
+        parallel=parallel,
+        shared_cache=shared_cache,
+        targets=[document.step for document in documents],
+        on_step=render,
+        checkpoint=checkpoint,
+    )
+    result.documents = paths
+    return result
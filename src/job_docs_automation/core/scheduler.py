@@ -0,0 +1,399 @@
+"""Contains the rate limiter and the fair-share scheduler of the calls to the API in the process."""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from cancellation import Cancelled, CancelToken
+from metrics import QUEUE_WAIT, QUEUED
+
+# The limits of the API key, 0 disables the corresponding limit
+RATE_LIMIT_RPM = int(os.getenv("JDA_RATE_LIMIT_RPM", "0"))
+RATE_LIMIT_TPM = int(os.getenv("JDA_RATE_LIMIT_TPM", "0"))
+# LLM calls in flight in the process and per user, 0 disables the corresponding cap
+LLM_CONCURRENCY = int(os.getenv("JDA_LLM_CONCURRENCY", "0"))
+USER_CONCURRENCY = int(os.getenv("JDA_USER_CONCURRENCY", "0"))
+
+# Priority classes, from highest to lowest: a user waiting for a step, work started ahead
+# of the user asking for it, and offline jobs such as evaluations
+INTERACTIVE = "interactive"
+PREFETCH = "prefetch"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, PREFETCH, BATCH)
+
+
+class RateLimiter:
+    """
+    Token buckets for the requests and tokens sent to the API per minute.
+
+    Callers reserve their share before waiting, so threads that arrive together are
+    spread over the following seconds instead of all retrying at once when the bucket
+    refills.
+
+    Parameters
+    ----------
+    requests_per_minute : int, optional
+        The maximum number of requests per minute, by default 0 (unlimited).
+    tokens_per_minute : int, optional
+        The maximum number of tokens per minute, by default 0 (unlimited).
+    clock : Callable[[], float], optional
+        The monotonic clock, replaced in tests, by default ``time.monotonic``.
+    sleep : Callable[[float], None], optional
+        The function waiting for a reservation, by default ``time.sleep``.
+    """
+
+    requests_per_minute: int
+    tokens_per_minute: int
+
+    def __init__(
+        self,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        # Buckets start full and go negative while reservations are pending
+        self._levels: Dict[str, float] = {
+            "requests": float(requests_per_minute),
+            "tokens": float(tokens_per_minute),
+        }
+        self._updated = clock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests_per_minute > 0 or self.tokens_per_minute > 0
+
+    def reserve(self, tokens: int = 0) -> float:
+        """
+        Takes one request and ``tokens`` tokens from the buckets without waiting.
+
+        Parameters
+        ----------
+        tokens : int, optional
+            The estimated tokens of the request, by default 0.
+
+        Returns
+        -------
+        float
+            The seconds to wait before sending the request.
+        """
+        if not self.enabled:
+            return 0.0
+        limits = {"requests": self.requests_per_minute, "tokens": self.tokens_per_minute}
+        amounts = {"requests": 1, "tokens": tokens}
+        with self._lock:
+            now = self._clock()
+            elapsed = now - self._updated
+            self._updated = now
+            wait = 0.0
+            for bucket, limit in limits.items():
+                if limit <= 0:
+                    continue
+                level = min(limit, self._levels[bucket] + elapsed * limit / 60)
+                # A request larger than the bucket waits for a full bucket, not forever
+                level -= min(amounts[bucket], limit)
+                self._levels[bucket] = level
+                if level < 0:
+                    wait = max(wait, -level * 60 / limit)
+        return wait
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        Waits until a request of ``tokens`` tokens fits within the limits.
+
+        Parameters
+        ----------
+        tokens : int, optional
+            The estimated tokens of the request, by default 0.
+
+        Returns
+        -------
+        float
+            The seconds waited.
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+
+_limiter = RateLimiter(RATE_LIMIT_RPM, RATE_LIMIT_TPM)
+
+
+def get_limiter() -> RateLimiter:
+    """
+    Returns the limiter used by ``generate_text``.
+    """
+    return _limiter
+
+
+def set_limiter(limiter: RateLimiter) -> RateLimiter:
+    """
+    Replaces the limiter used by ``generate_text``, e.g. for an evaluation run.
+
+    Returns
+    -------
+    RateLimiter
+        The previous limiter, to restore it afterwards.
+    """
+    global _limiter
+    previous, _limiter = _limiter, limiter
+    return previous
+
+
+def estimate_tokens(*texts: str) -> int:
+    """
+    Estimates the tokens of a request at four characters per token, like ``fake_llm``.
+    """
+    return sum(len(text) for text in texts) // 4
+
+
+# The user, priority class and weight of the calls made in the current context
+_work: ContextVar[Tuple[str, str, float]] = ContextVar("jda_work", default=("", INTERACTIVE, 1.0))
+
+
+@contextmanager
+def work(user: str = "", priority: str = INTERACTIVE, weight: float = 1.0) -> Iterator[None]:
+    """
+    Attributes the LLM calls made within the block to a user and a priority class.
+
+    The attribution follows the context, so the steps ``run_pipeline`` runs in its threads
+    inherit it. Calls made outside any block are interactive calls of the anonymous user.
+
+    Parameters
+    ----------
+    user : str, optional
+        The user the calls are made for, e.g. a session key, by default "".
+    priority : str, optional
+        ``interactive``, ``prefetch`` or ``batch``, by default ``interactive``.
+    weight : float, optional
+        The share of the user relative to the other users of the class, by default 1.
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority '{priority}', expected one of {PRIORITIES}")
+    if weight <= 0:
+        raise ValueError("The weight must be positive")
+    token = _work.set((user, priority, weight))
+    try:
+        yield
+    finally:
+        _work.reset(token)
+
+
+def current_work() -> Tuple[str, str, float]:
+    """
+    Returns the user, priority class and weight set by the innermost ``work`` block.
+    """
+    return _work.get()
+
+
+class _Waiter:
+    def __init__(self, user: str, priority: str, start: float, finish: float, seq: int):
+        self.user = user
+        self.priority = priority
+        self.start = start
+        self.finish = finish
+        self.seq = seq
+        self.granted = threading.Event()
+
+
+class FairScheduler:
+    """
+    Hands out the slots of the LLM calls by priority class, then fairly between users.
+
+    A call waits while the process runs ``concurrency`` calls or its user runs
+    ``user_concurrency`` calls. A freed slot goes to the highest class with a waiting call
+    whose user is under its cap, so batch work only gets the capacity interactive calls
+    leave. Within a class the users share the slots by weighted fair queueing: every call
+    is tagged with the virtual time its user would finish at, ``cost / weight`` after its
+    previous call, and the smallest tag goes first. A user sending many calls is therefore
+    served at the rate of its weight, not in proportion to its calls.
+
+    Parameters
+    ----------
+    concurrency : int, optional
+        The maximum number of calls in flight, by default 0 (unlimited).
+    user_concurrency : int, optional
+        The maximum number of calls in flight per user, by default 0 (unlimited).
+    clock : Callable[[], float], optional
+        The monotonic clock measuring the queue wait, by default ``time.monotonic``.
+    """
+
+    concurrency: int
+    user_concurrency: int
+
+    def __init__(
+        self,
+        concurrency: int = 0,
+        user_concurrency: int = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.concurrency = concurrency
+        self.user_concurrency = user_concurrency
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._queues: Dict[str, List[_Waiter]] = {priority: [] for priority in PRIORITIES}
+        self._virtual: Dict[str, float] = {priority: 0.0 for priority in PRIORITIES}
+        self._finish: Dict[Tuple[str, str], float] = {}
+        self._running = 0
+        self._running_by_user: Dict[str, int] = {}
+        self._seq = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.concurrency > 0 or self.user_concurrency > 0
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def queued(self, priority: Optional[str] = None) -> int:
+        """
+        Returns the number of waiting calls, of one class or of all of them.
+        """
+        with self._lock:
+            if priority is not None:
+                return len(self._queues[priority])
+            return sum(len(queue) for queue in self._queues.values())
+
+    @contextmanager
+    def slot(self, cost: int = 1, cancel: Optional[CancelToken] = None) -> Iterator[float]:
+        """
+        Holds a slot for the call made within the block, waiting for it first.
+
+        The user and class of the call are those of the current ``work`` block.
+
+        Parameters
+        ----------
+        cost : int, optional
+            The size of the call, e.g. its estimated tokens, by default 1.
+        cancel : Optional[CancelToken], optional
+            The token of the call, a cancelled call leaves the queue, by default None.
+
+        Yields
+        ------
+        float
+            The seconds waited for the slot.
+
+        Raises
+        ------
+        Cancelled
+            If the token is cancelled while the call waits.
+        """
+        if not self.enabled:
+            yield 0.0
+            return
+        user, priority, weight = current_work()
+        waited = self.acquire(user, priority, max(cost, 1) / weight, cancel)
+        try:
+            yield waited
+        finally:
+            self.release(user)
+
+    def acquire(
+        self, user: str, priority: str, cost: float = 1.0, cancel: Optional[CancelToken] = None
+    ) -> float:
+        """
+        Waits for a slot, see ``slot``, which releases it as well.
+
+        Returns
+        -------
+        float
+            The seconds waited.
+        """
+        start = self._clock()
+        with self._lock:
+            begin = max(self._virtual[priority], self._finish.get((priority, user), 0.0))
+            waiter = _Waiter(user, priority, begin, begin + cost, self._seq)
+            self._seq += 1
+            self._finish[(priority, user)] = waiter.finish
+            self._queues[priority].append(waiter)
+            self._dispatch()
+        waited = 0.0
+        if not waiter.granted.is_set():
+            QUEUED.inc(priority=priority)
+            try:
+                # The lease of a token runs out without a callback, so it is polled
+                while not waiter.granted.wait(None if cancel is None else 0.5):
+                    if cancel is not None and cancel.cancelled:
+                        with self._lock:
+                            if not waiter.granted.is_set():
+                                self._queues[priority].remove(waiter)
+                                raise Cancelled(cancel.reason or "aborted")
+            finally:
+                QUEUED.dec(priority=priority)
+            waited = self._clock() - start
+        QUEUE_WAIT.observe(waited, priority=priority)
+        return waited
+
+    def release(self, user: str) -> None:
+        with self._lock:
+            self._running -= 1
+            self._running_by_user[user] -= 1
+            if not self._running_by_user[user]:
+                del self._running_by_user[user]
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        # Called with the lock held, grants the free slots to the waiting calls
+        while self.concurrency <= 0 or self._running < self.concurrency:
+            waiter = None
+            for priority in PRIORITIES:
+                eligible = [
+                    candidate
+                    for candidate in self._queues[priority]
+                    if self.user_concurrency <= 0
+                    or self._running_by_user.get(candidate.user, 0) < self.user_concurrency
+                ]
+                if eligible:
+                    waiter = min(eligible, key=lambda candidate: (candidate.finish, candidate.seq))
+                    break
+            if waiter is None:
+                return
+            queue = self._queues[waiter.priority]
+            queue.remove(waiter)
+            self._virtual[waiter.priority] = max(self._virtual[waiter.priority], waiter.start)
+            if not queue:
+                # Tags behind the virtual time no longer matter, keeps one entry per active user
+                virtual = self._virtual[waiter.priority]
+                for key in [
+                    key
+                    for key, finish in self._finish.items()
+                    if key[0] == waiter.priority and finish <= virtual
+                ]:
+                    del self._finish[key]
+            self._running += 1
+            self._running_by_user[waiter.user] = self._running_by_user.get(waiter.user, 0) + 1
+            waiter.granted.set()
+
+
+_scheduler = FairScheduler(LLM_CONCURRENCY, USER_CONCURRENCY)
+
+
+def get_scheduler() -> FairScheduler:
+    """
+    Returns the scheduler used by ``generate_text``.
+    """
+    return _scheduler
+
+
+def set_scheduler(scheduler: FairScheduler) -> FairScheduler:
+    """
+    Replaces the scheduler used by ``generate_text``.
+
+    Returns
+    -------
+    FairScheduler
+        The previous scheduler, to restore it afterwards.
+    """
+    global _scheduler
+    previous, _scheduler = _scheduler, scheduler
+    return previous
@@ -0,0 +1,94 @@
+"""Contains the cache shared across users for the outputs of user-independent steps."""
+
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, Optional, Tuple
+
+# Inputs that describe the job posting rather than the applicant
+SHARED_INPUTS = ("job_description",)
+
+DEFAULT_TTL = 24 * 60 * 60
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes text so that formatting-only differences map to the same cache key.
+
+    Parameters
+    ----------
+    text : str
+        The text to normalize.
+
+    Returns
+    -------
+    str
+        The NFKC-normalized, case-folded text with collapsed whitespace.
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip().casefold()
+
+
+def shared_cache_key(
+    name: str, prompt: str, output_schema: Dict[str, Any], model: str, rendered_input: str
+) -> str:
+    """
+    Computes the key of a user-independent step output.
+
+    Everything that determines the output is part of the key: the prompt, its schema,
+    the model and the rendered input, which only contains posting-level data.
+
+    Returns
+    -------
+    str
+        A hex digest.
+    """
+    digest = hashlib.sha256()
+    for part in (
+        name,
+        prompt,
+        json.dumps(output_schema, sort_keys=True, separators=(",", ":")),
+        model,
+        normalize_text(rendered_input),
+    ):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class SharedStepCache:
+    """
+    Interface of the caches passed to ``execute_step`` for user-independent steps.
+    """
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, prompt_name: str, value: Any, ttl: int) -> None:
+        raise NotImplementedError
+
+
+class MemorySharedCache(SharedStepCache):
+    """
+    In-process shared cache with TTL expiry, for the command line and tests.
+    """
+
+    def __init__(self) -> None:
+        self._entries: Dict[str, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            return entry[1]
+
+    def set(self, key: str, prompt_name: str, value: Any, ttl: int) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
@@ -0,0 +1,208 @@
+"""Contains the typed record of a step output and its compact binary form."""
+
+import hashlib
+import json
+import struct
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+from backend import Prompt
+from decoding import canonical_json
+
+FORMAT_VERSION = 1
+USAGE_KEYS = ("prompt_tokens", "completion_tokens", "cached_tokens")
+# Version, flags, latency, token usage and the lengths of the name, model and input hash
+_HEADER = struct.Struct("<BBfIIIHHB")
+_HAS_USAGE = 1
+_COMPRESSED = 2
+# Shorter outputs do not shrink enough to pay for decompressing them
+MIN_COMPRESSED_SIZE = 256
+
+
+class StepResult:
+    """
+    The output of one step of a run, with the usage, latency and inputs that produced it.
+
+    The output is compressed once, the first time the result is serialized, and a result
+    read back keeps it compressed until it is used. Moving a result between the session,
+    the options and the runs therefore never parses or serializes the output again.
+
+    Parameters
+    ----------
+    prompt : str
+        The name of the prompt of the step.
+    output_json : bytes
+        The output as canonical JSON, see ``decoding.canonical_json``.
+    usage : Optional[Dict[str, int]], optional
+        The prompt, completion and cached tokens of the call, by default None. Empty for
+        outputs that did not come from a call, e.g. from the shared cache.
+    latency : float, optional
+        The seconds the step took, by default 0.
+    model : str, optional
+        The model asked for the output, by default "".
+    input_hash : bytes, optional
+        The digest of the inputs of the step, see ``step_input_hash``, by default empty.
+    parsed : Optional[Any], optional
+        The output already parsed, saves parsing ``output_json`` again, by default None.
+    """
+
+    __slots__ = (
+        "prompt",
+        "usage",
+        "latency",
+        "model",
+        "input_hash",
+        "_output_json",
+        "_packed",
+        "_parsed",
+    )
+
+    prompt: str
+    usage: Dict[str, int]
+    latency: float
+    model: str
+    input_hash: bytes
+
+    def __init__(
+        self,
+        prompt: str,
+        output_json: bytes,
+        usage: Optional[Dict[str, int]] = None,
+        latency: float = 0.0,
+        model: str = "",
+        input_hash: bytes = b"",
+        parsed: Optional[Any] = None,
+    ):
+        self.prompt = prompt
+        self.usage = dict(usage or {})
+        self.latency = latency
+        self.model = model
+        self.input_hash = input_hash
+        self._output_json: Optional[bytes] = output_json
+        # The flags and the output as serialized, compressed or not
+        self._packed: Optional[Tuple[int, bytes]] = None
+        self._parsed = parsed
+
+    @classmethod
+    def from_output(cls, prompt: str, output: Any, **kwargs: Any) -> "StepResult":
+        """
+        Creates the result of a decoded output, e.g. one read from a previous run.
+        """
+        return cls(prompt, canonical_json(output).encode("utf-8"), parsed=output, **kwargs)
+
+    @property
+    def output_json(self) -> bytes:
+        if self._output_json is None:
+            flags, packed = self._packed
+            self._output_json = zlib.decompress(packed) if flags & _COMPRESSED else packed
+        return self._output_json  # type: ignore[return-value]
+
+    @property
+    def parsed(self) -> Any:
+        """
+        The decoded output, parsed on first access. Shared, not to be modified.
+        """
+        if self._parsed is None:
+            self._parsed = json.loads(self.output_json)
+        return self._parsed
+
+    def to_bytes(self) -> bytes:
+        """
+        Serializes the result to its binary form.
+
+        Returns
+        -------
+        bytes
+            A fixed header followed by the name, the model, the input hash and the output,
+            compressed unless it is short.
+        """
+        if self._packed is None:
+            output = self.output_json
+            if len(output) >= MIN_COMPRESSED_SIZE:
+                self._packed = (_COMPRESSED, zlib.compress(output))
+            else:
+                self._packed = (0, output)
+        flags, packed = self._packed
+        prompt = self.prompt.encode("utf-8")
+        model = self.model.encode("utf-8")
+        header = _HEADER.pack(
+            FORMAT_VERSION,
+            flags | (_HAS_USAGE if self.usage else 0),
+            self.latency,
+            *(self.usage.get(key, 0) for key in USAGE_KEYS),
+            len(prompt),
+            len(model),
+            len(self.input_hash),
+        )
+        return b"".join((header, prompt, model, self.input_hash, packed))
+
+    @classmethod
+    def from_bytes(cls, data: Any) -> "StepResult":
+        """
+        Reads a result serialized by ``to_bytes``, without decompressing its output.
+
+        Parameters
+        ----------
+        data : Any
+            The bytes or a memoryview of them, e.g. a slice of a larger buffer.
+
+        Raises
+        ------
+        ValueError
+            If the data is not a result of this format version.
+        """
+        if len(data) < _HEADER.size or data[0] != FORMAT_VERSION:
+            raise ValueError(f"Not a step result of format version {FORMAT_VERSION}")
+        _, flags, latency, *counts, prompt_len, model_len, hash_len = _HEADER.unpack_from(data)
+        offset = _HEADER.size
+        prompt = bytes(data[offset : offset + prompt_len]).decode("utf-8")
+        offset += prompt_len
+        model = bytes(data[offset : offset + model_len]).decode("utf-8")
+        offset += model_len
+        input_hash = bytes(data[offset : offset + hash_len])
+        offset += hash_len
+        usage = dict(zip(USAGE_KEYS, counts)) if flags & _HAS_USAGE else None
+        result = cls(prompt, b"", usage, latency, model, input_hash)
+        result._output_json = None
+        result._packed = (flags & _COMPRESSED, bytes(data[offset:]))
+        return result
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, StepResult):
+            return NotImplemented
+        return self.to_bytes() == other.to_bytes()
+
+    def __repr__(self) -> str:
+        return f"StepResult({self.prompt!r}, model={self.model!r}, latency={self.latency:.2f})"
+
+
+def step_input_hash(prompt: Prompt, replacements: Dict[str, Any], max_loops: int = 5) -> bytes:
+    """
+    Hashes everything a step output depends on: the prompt, its schema, the model and the
+    rendered input.
+
+    Parameters
+    ----------
+    prompt : Prompt
+        The prompt of the step.
+    replacements : Dict[str, Any]
+        The inputs and outputs of the previous steps.
+    max_loops : int, optional
+        The maximum number of loops to replace placeholders, by default 5.
+
+    Returns
+    -------
+    bytes
+        A 16-byte digest, the same for two runs that would send the same request.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (
+        prompt.name,
+        prompt.prompt,
+        json.dumps(prompt.output_schema, sort_keys=True, separators=(",", ":")),
+        prompt.model,
+        prompt.replace_input(replacements, max_loops) or "",
+    ):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.digest()
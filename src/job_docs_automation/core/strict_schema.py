@@ -0,0 +1,290 @@
+"""Contains the normalizer and linter of strict structured-output JSON schemas."""
+
+import copy
+import hashlib
+import json
+import os
+import threading
+import warnings
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+# Keywords rejected by strict structured outputs
+UNSUPPORTED_KEYWORDS = {
+    "string": ("minLength", "maxLength", "pattern", "format"),
+    "number": ("minimum", "maximum", "multipleOf", "exclusiveMinimum", "exclusiveMaximum"),
+    "object": (
+        "patternProperties",
+        "unevaluatedProperties",
+        "propertyNames",
+        "minProperties",
+        "maxProperties",
+    ),
+    "array": (
+        "unevaluatedItems",
+        "contains",
+        "minContains",
+        "maxContains",
+        "minItems",
+        "maxItems",
+        "uniqueItems",
+    ),
+}
+UNSUPPORTED_KEYWORDS["integer"] = UNSUPPORTED_KEYWORDS["number"]
+# Composition keywords rejected by strict structured outputs that cannot be rewritten.
+# "oneOf" is rewritten to "anyOf", which only also accepts outputs matching several branches
+UNSUPPORTED_COMPOSITION = (
+    "allOf",
+    "not",
+    "if",
+    "then",
+    "else",
+    "dependentRequired",
+    "dependentSchemas",
+)
+# Keywords holding a subschema or a list of them, checked as well
+SUBSCHEMA_KEYWORDS = ("items", "prefixItems", "anyOf", "oneOf") + UNSUPPORTED_COMPOSITION[:5]
+# Keys that are not part of the schema itself, e.g. the name written by meta_schema
+ROOT_METADATA = ("name",)
+# "fix" repairs what it can, "reject" reports every deviation as an error
+MODE = os.getenv("JDA_STRICT_SCHEMAS", "fix")
+
+
+class StrictSchemaError(ValueError):
+    """
+    Raised when a schema cannot be used in strict mode, with every problem in ``errors``.
+    """
+
+    def __init__(self, errors: List[str]):
+        self.errors = errors
+        super().__init__("Invalid strict schema:\n- " + "\n- ".join(errors))
+
+
+def _types(node: Dict[str, Any]) -> List[str]:
+    node_type = node.get("type", [])
+    return node_type if isinstance(node_type, list) else [node_type]
+
+
+def _hoist_defs(schema: Dict[str, Any], fixes: List[str], errors: List[str]) -> Dict[str, str]:
+    """
+    Moves nested ``$defs`` and ``definitions`` to the root ``$defs``.
+
+    Returns
+    -------
+    Dict[str, str]
+        The new reference of every moved definition by its old reference.
+    """
+    moved: Dict[str, str] = {}
+    root_defs = schema.setdefault("$defs", {})
+    if "definitions" in schema:
+        for name, definition in schema.pop("definitions").items():
+            moved[f"#/definitions/{name}"] = f"#/$defs/{name}"
+            root_defs.setdefault(name, definition)
+        fixes.append("moved 'definitions' to '$defs'")
+
+    def visit(node: Any, path: str) -> None:
+        if isinstance(node, dict):
+            for key in ("$defs", "definitions"):
+                if key in node and node is not schema:
+                    for name, definition in node.pop(key).items():
+                        if name in root_defs:
+                            errors.append(f"{path}/{key}/{name}: clashes with a root definition")
+                            continue
+                        moved[f"{path}/{key}/{name}"] = f"#/$defs/{name}"
+                        root_defs[name] = definition
+                    fixes.append(f"{path}: moved '{key}' to the root '$defs'")
+            for key, value in list(node.items()):
+                visit(value, f"{path}/{key}")
+        elif isinstance(node, list):
+            for idx, value in enumerate(node):
+                visit(value, f"{path}/{idx}")
+
+    visit(schema, "#")
+    if not root_defs:
+        del schema["$defs"]
+    return moved
+
+
+def lint_schema(schema: Any) -> Tuple[Dict[str, Any], List[str], List[str]]:
+    """
+    Normalizes a schema to the rules of strict structured outputs.
+
+    Every object requires all of its properties and sets ``additionalProperties`` to false,
+    unsupported keywords are removed, ``oneOf`` becomes ``anyOf``, definitions live in the
+    root ``$defs`` and every ``$ref`` resolves. Other composition keywords such as ``allOf``
+    or ``if`` cannot be fixed, their subschemas are normalized all the same.
+
+    Parameters
+    ----------
+    schema : Any
+        The parsed schema.
+
+    Returns
+    -------
+    Tuple[Dict[str, Any], List[str], List[str]]
+        The normalized copy, the fixes applied and the problems that cannot be fixed.
+    """
+    if not isinstance(schema, dict):
+        return {}, [], ["#: schema must be a JSON object"]
+    schema = copy.deepcopy(schema)
+    fixes: List[str] = []
+    errors: List[str] = []
+    for key in ROOT_METADATA:
+        if key in schema and not isinstance(schema[key], dict):
+            del schema[key]
+            fixes.append(f"#: removed '{key}'")
+    if "object" not in _types(schema):
+        errors.append("#: root must have type 'object'")
+    moved = _hoist_defs(schema, fixes, errors)
+    defs = schema.get("$defs", {})
+
+    def visit(node: Any, path: str) -> None:
+        if isinstance(node, list):
+            for idx, value in enumerate(node):
+                visit(value, f"{path}/{idx}")
+            return
+        if not isinstance(node, dict):
+            return
+        ref = node.get("$ref")
+        if isinstance(ref, str):
+            if ref in moved:
+                node["$ref"] = ref = moved[ref]
+                fixes.append(f"{path}: rewrote $ref to {ref}")
+            if ref != "#" and not (ref.startswith("#/$defs/") and ref[len("#/$defs/") :] in defs):
+                errors.append(f"{path}: unresolved $ref {ref}")
+        if "oneOf" in node:
+            if "anyOf" in node:
+                errors.append(f"{path}: 'oneOf' next to 'anyOf' is not supported")
+            else:
+                node["anyOf"] = node.pop("oneOf")
+                fixes.append(f"{path}: rewrote 'oneOf' to 'anyOf'")
+        for keyword in UNSUPPORTED_COMPOSITION:
+            if keyword in node:
+                errors.append(f"{path}: unsupported '{keyword}'")
+        for node_type in _types(node):
+            for keyword in UNSUPPORTED_KEYWORDS.get(node_type, ()):
+                if keyword in node:
+                    del node[keyword]
+                    fixes.append(f"{path}: removed unsupported '{keyword}'")
+        if "object" in _types(node):
+            properties = node.get("properties")
+            if not isinstance(properties, dict) or not properties:
+                errors.append(f"{path}: object must declare properties")
+            else:
+                if set(node.get("required", [])) != set(properties):
+                    node["required"] = list(properties)
+                    fixes.append(f"{path}: required all properties")
+                for name, value in properties.items():
+                    visit(value, f"{path}/properties/{name}")
+            if node.get("additionalProperties") is not False:
+                node["additionalProperties"] = False
+                fixes.append(f"{path}: set additionalProperties to false")
+        for key in SUBSCHEMA_KEYWORDS:
+            if key in node:
+                visit(node[key], f"{path}/{key}")
+        if isinstance(node.get("dependentSchemas"), dict):
+            for name, value in node["dependentSchemas"].items():
+                visit(value, f"{path}/dependentSchemas/{name}")
+
+    visit(schema, "#")
+    for name, definition in defs.items():
+        visit(definition, f"#/$defs/{name}")
+    return schema, fixes, errors
+
+
+_compiled: "OrderedDict[str, Tuple[Dict[str, Any], List[str], List[str]]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _digest(schema: Any) -> str:
+    text = json.dumps(schema, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def normalize_schema(schema: Any, mode: str = "") -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Normalizes a schema, caching the result by the content of the schema.
+
+    Parameters
+    ----------
+    schema : Any
+        The parsed schema.
+    mode : str, optional
+        ``fix`` to repair what can be repaired or ``reject`` to accept only schemas that
+        need no fix, by default ``JDA_STRICT_SCHEMAS`` or ``fix``.
+
+    Returns
+    -------
+    Tuple[Dict[str, Any], List[str]]
+        The normalized schema and the fixes applied.
+
+    Raises
+    ------
+    StrictSchemaError
+        If the schema cannot be fixed, or needs a fix in ``reject`` mode.
+    """
+    key = _digest(schema)
+    with _lock:
+        result = _compiled.get(key)
+        if result is not None:
+            _compiled.move_to_end(key)
+    if result is None:
+        result = lint_schema(schema)
+        with _lock:
+            _compiled[key] = result
+            while len(_compiled) > 1024:
+                _compiled.popitem(last=False)
+    normalized, fixes, errors = result
+    if (mode or MODE) == "reject":
+        errors = errors + fixes
+    if errors:
+        raise StrictSchemaError(errors)
+    return copy.deepcopy(normalized), list(fixes)
+
+
+def normalize_schemas(
+    schemas: Dict[str, Any], mode: str = ""
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, List[str]]]:
+    """
+    Normalizes the schemas of all the prompts of a pipeline at once.
+
+    Parameters
+    ----------
+    schemas : Dict[str, Any]
+        The parsed schemas by prompt name.
+    mode : str, optional
+        ``fix`` or ``reject``, by default ``JDA_STRICT_SCHEMAS`` or ``fix``.
+
+    Returns
+    -------
+    Tuple[Dict[str, Dict[str, Any]], Dict[str, List[str]]]
+        The normalized schemas and the fixes applied, by prompt name.
+
+    Raises
+    ------
+    StrictSchemaError
+        With the problems of every schema, prefixed with the prompt name.
+    """
+    normalized: Dict[str, Dict[str, Any]] = {}
+    fixes: Dict[str, List[str]] = {}
+    errors: List[str] = []
+    for name, schema in schemas.items():
+        try:
+            normalized[name], fixes[name] = normalize_schema(schema, mode)
+        except StrictSchemaError as error:
+            errors.extend(f"prompt '{name}': {message}" for message in error.errors)
+    if errors:
+        raise StrictSchemaError(errors)
+    return normalized, fixes
+
+
+def warn_fixes(fixes: Dict[str, List[str]]) -> None:
+    """
+    Warns about the fixes applied to the schemas of a pipeline, so they get fixed at the source.
+    """
+    for name, applied in fixes.items():
+        if applied:
+            warnings.warn(
+                f"Schema of prompt '{name}' was normalized for strict mode: " + "; ".join(applied),
+                stacklevel=3,
+            )
@@ -0,0 +1,246 @@
+"""Contains a minimal tracing layer that exports spans as OpenTelemetry (OTLP/JSON) lines."""
+
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+# Tracing is enabled when JDA_TRACE_FILE is set. Each line of the file is an OTLP/JSON
+# ``ExportTraceServiceRequest``, the format written by the OpenTelemetry collector's file
+# exporter, so the file can be replayed into any OTLP-compatible backend.
+TRACE_FILE = os.getenv("JDA_TRACE_FILE", "")
+SAMPLE_RATE = float(os.getenv("JDA_TRACE_SAMPLE_RATE", "1.0"))
+SERVICE_NAME = "job_docs_automation"
+
+
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: str
+    sampled: bool
+    attributes: Dict[str, Any]
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: str, sampled: bool):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.sampled = sampled
+        self.attributes = {}
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if self.sampled and value is not None:
+            self.attributes[key] = value
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """
+        Converts the span to its OTLP/JSON representation.
+
+        Returns
+        -------
+        Dict[str, Any]
+            The span as a dictionary following the OTLP/JSON encoding.
+        """
+        span: Dict[str, Any] = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("jda_current_span", default=None)
+_write_lock = threading.Lock()
+
+
+def is_sampled(trace_id: str) -> bool:
+    """
+    Decides deterministically whether a trace is sampled, like OpenTelemetry's TraceIdRatioBased.
+
+    Parameters
+    ----------
+    trace_id : str
+        The 32 hex digit trace id.
+
+    Returns
+    -------
+    bool
+        True if tracing is enabled and the trace falls within the sampling rate.
+    """
+    if not TRACE_FILE or SAMPLE_RATE <= 0:
+        return False
+    return int(trace_id[-8:], 16) < SAMPLE_RATE * 0x100000000
+
+
+def new_trace() -> Dict[str, Any]:
+    """
+    Starts a trace spanning several requests, e.g. a generation run in the web app.
+
+    Returns
+    -------
+    Dict[str, Any]
+        A JSON-serializable trace context to store in the session and pass to :func:`use_trace`.
+    """
+    trace_id = secrets.token_hex(16)
+    return {
+        "trace_id": trace_id,
+        "span_id": secrets.token_hex(8),
+        "start_ns": time.time_ns(),
+        "sampled": is_sampled(trace_id),
+    }
+
+
+@contextmanager
+def use_trace(trace: Optional[Dict[str, Any]]) -> Iterator[None]:
+    """
+    Makes the spans opened inside the block children of a trace created by :func:`new_trace`.
+
+    Parameters
+    ----------
+    trace : Optional[Dict[str, Any]]
+        The trace context, or None to start a new trace per root span.
+    """
+    if not trace:
+        yield
+        return
+    parent = Span("", trace["trace_id"], "", trace["sampled"])
+    parent.span_id = trace["span_id"]
+    token = _current_span.set(parent)
+    try:
+        yield
+    finally:
+        _current_span.reset(token)
+
+
+def end_trace(trace: Optional[Dict[str, Any]], name: str, **attributes: Any) -> None:
+    """
+    Exports the root span of a trace created by :func:`new_trace`.
+
+    Parameters
+    ----------
+    trace : Optional[Dict[str, Any]]
+        The trace context.
+    name : str
+        The name of the root span.
+    """
+    if not trace or not trace["sampled"]:
+        return
+    root = Span(name, trace["trace_id"], "", True)
+    root.span_id = trace["span_id"]
+    root.start_ns = trace["start_ns"]
+    root.end_ns = time.time_ns()
+    root.attributes.update({key: value for key, value in attributes.items() if value is not None})
+    _export([root])
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def set_attributes(**attributes: Any) -> None:
+    """
+    Sets attributes on the current span, if any.
+    """
+    span_ = _current_span.get()
+    if span_ is not None and span_.sampled:
+        for key, value in attributes.items():
+            span_.set_attribute(key, value)
+
+
+# Finished spans waiting for their local root span to end
+_pending: ContextVar[Optional[List[Span]]] = ContextVar("jda_pending_spans", default=None)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Opens a child span of the current span, or the root span of a new trace.
+
+    Spans are buffered and written to ``JDA_TRACE_FILE`` when the outermost span of the
+    current request or run ends.
+
+    Parameters
+    ----------
+    name : str
+        The name of the span.
+
+    Yields
+    ------
+    Optional[Span]
+        The span, or None if the trace is not sampled.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        trace_id = secrets.token_hex(16)
+        new_span = Span(name, trace_id, "", is_sampled(trace_id))
+    else:
+        new_span = Span(name, parent.trace_id, parent.span_id, parent.sampled)
+    if not new_span.sampled:
+        yield None
+        return
+
+    for key, value in attributes.items():
+        new_span.set_attribute(key, value)
+    pending = _pending.get()
+    pending_token = _pending.set([]) if pending is None else None
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as exc:
+        new_span.error = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        _current_span.reset(token)
+        new_span.end_ns = time.time_ns()
+        buffered = _pending.get()
+        buffered.append(new_span)  # type: ignore[union-attr]
+        if pending_token is not None:
+            _pending.reset(pending_token)
+            _export(buffered)  # type: ignore[arg-type]
+
+
+def _export(spans: List[Span]) -> None:
+    if not spans:
+        return
+    request = {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [
+                    {
+                        "scope": {"name": SERVICE_NAME},
+                        "spans": [span_.to_otlp() for span_ in spans],
+                    }
+                ],
+            }
+        ]
+    }
+    line = json.dumps(request, separators=(",", ":")) + "\n"
+    with _write_lock:
+        with open(TRACE_FILE, "a", encoding="utf-8") as file:
+            file.write(line)
@@ -1,19 +1,23 @@
 """
-This is a skeleton file that can serve as a starting point for a Python
-console script. To run this script uncomment the following lines in the
+Command line interface of job_docs_automation, the ``jda`` command.
+
+To install it as a console script add the following lines to the
 ``[options.entry_points]`` section in ``setup.cfg``::
 
     console_scripts =
-         fibonacci = job_docs_automation.skeleton:run
+         jda = job_docs_automation.skeleton:run
 
 Then run ``pip install .`` (or ``pip install -e .`` for editable mode)
-which will install the command ``fibonacci`` inside your current environment.
-
-Besides console scripts, the header (i.e. until ``_logger``...) of this file can
-also be used as template for Python modules.
+which will install the command ``jda`` inside your current environment.
+Without installing, ``python -m job_docs_automation`` runs the same command.
 
-Note:
-    This file can be renamed depending on your needs or safely removed if not needed.
+Subcommands:
+    - ``jda generate``: runs the pipeline for one job posting and writes its documents.
+    - ``jda batch``: runs the pipeline for many job postings concurrently.
+    - ``--resume``: with ``generate`` or ``batch``, skips the steps completed by an
+      interrupted run of the same posting whose inputs have not changed.
+    - ``jda bench``: runs the pipeline against the offline fake LLM and reports the
+      time spent per step.
 
 References:
     - https://setuptools.pypa.io/en/latest/userguide/entry_point.html
@@ -21,8 +25,15 @@ References:
 """
 
 import argparse
+import cProfile
+import io
 import logging
+import os
+import pstats
+import statistics
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from job_docs_automation import __version__
 
@@ -32,28 +43,125 @@ __license__ = "MIT"
 
 _logger = logging.getLogger(__name__)
 
+# The core modules import each other as top-level modules (see ``CORE_DIR`` in
+# web_app/settings.py)
+CORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "core")
+if CORE_DIR not in sys.path:
+    sys.path.append(CORE_DIR)
+
+FORMATS = ("docx", "json", "text")
+# Steps of different documents run concurrently
+DEFAULT_PARALLEL = 4
+RESUME_HELP = (
+    "restore the steps of an interrupted run of the same posting whose inputs are unchanged, "
+    "see JDA_CHECKPOINT_DIR"
+)
+
 
 # ---- Python API ----
 # The functions defined in this section can be imported by users in their
 # Python scripts/interactive interpreter, e.g. via
-# `from job_docs_automation.skeleton import fib`,
+# `from job_docs_automation.skeleton import generate`,
 # when using this Python module as a library.
 
 
-def fib(n):
-    """Fibonacci example function
+def load(pipeline=None, model=None):
+    """Load the inputs, prompts and documents of a pipeline
+
+    Args:
+      pipeline (Optional[str]): path of a pipeline manifest, by default
+          ``JDA_PIPELINE`` or the legacy ``inputs/`` and ``prompts/`` directories.
+      model (Optional[str]): model used by every step instead of the configured ones.
+
+    Returns:
+      Tuple[Dict[str, str], List[Prompt], List[OutputDocument]]: the inputs, the
+      prompts and the documents rendered from their outputs
+    """
+    from manifest import load_configured_pipeline, load_documents
+
+    inputs, prompts = load_configured_pipeline(pipeline)
+    if model:
+        for prompt in prompts:
+            prompt.model = model
+    return inputs, prompts, load_documents(pipeline, prompts)
+
+
+def generate(
+    inputs,
+    prompts,
+    documents,
+    job_description,
+    output_dir="outputs",
+    stem="document",
+    parallel=1,
+    shared_cache=None,
+    output_format=None,
+    checkpoint=None,
+):
+    """Run the pipeline for one job posting and render its documents
+
+    Steps shared by several documents run once, the rest run concurrently.
+
+    Args:
+      inputs (Dict[str, str]): the inputs of the pipeline, e.g. the profile.
+      prompts (List[Prompt]): the prompts of the pipeline.
+      documents (List[OutputDocument]): the documents to render.
+      job_description (str): the job posting.
+      output_dir (str): the directory of the documents.
+      stem (str): the start of the file names, e.g. the name of the posting.
+      parallel (int): maximum number of steps running at the same time, 0 to run
+          them in the calling thread.
+      shared_cache (Optional[SharedStepCache]): cache of user-independent steps.
+      output_format (Optional[str]): overrides the format of every document.
+      checkpoint (Optional[Checkpoint]): saves every completed step and restores the
+          unchanged ones of an interrupted run.
+
+    Returns:
+      RunResult: the outputs, durations and token usage of every step and the paths
+      of the documents
+    """
+    from runner import run_documents
+
+    os.makedirs(output_dir, exist_ok=True)
+    replacements = {**inputs, "job_description": job_description}
+    return run_documents(
+        prompts,
+        replacements,
+        documents,
+        output_dir,
+        stem,
+        parallel=parallel,
+        shared_cache=shared_cache,
+        output_format=output_format,
+        checkpoint=checkpoint,
+    )
+
+
+def step_report(results, prompts):
+    """Summarize the step durations and token usage of several runs
 
     Args:
-      n (int): integer
+      results (List[RunResult]): the results of the runs.
+      prompts (List[Prompt]): the prompts of the pipeline.
 
     Returns:
-      int: n-th Fibonacci number
+      str: one line per step with the mean and maximum duration and the tokens
     """
-    assert n > 0
-    a, b = 1, 1
-    for _i in range(n - 1):
-        a, b = b, a + b
-    return a
+    lines = [f"{'step':<28}{'runs':>6}{'mean ms':>10}{'max ms':>10}{'prompt':>9}{'cached':>9}"]
+    for prompt in prompts:
+        timings = [
+            result.timings[prompt.name] for result in results if prompt.name in result.timings
+        ]
+        if not timings:
+            continue
+        usages = [result.usage.get(prompt.name, {}) for result in results]
+        lines.append(
+            f"{prompt.name:<28}{len(timings):>6}{statistics.mean(timings) * 1000:>10.1f}"
+            f"{max(timings) * 1000:>10.1f}"
+            f"{sum(usage.get('prompt_tokens', 0) for usage in usages):>9}"
+            f"{sum(usage.get('cached_tokens', 0) for usage in usages):>9}"
+        )
+    return "\n".join(lines)
 
 
 # ---- CLI ----
@@ -72,14 +180,48 @@ def parse_args(args):
     Returns:
       :obj:`argparse.Namespace`: command line parameters namespace
     """
-    parser = argparse.ArgumentParser(description="Just a Fibonacci demonstration")
-    parser.add_argument(
-        "--version",
-        action="version",
-        version=f"job_docs_automation {__version__}",
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--pipeline", help="pipeline manifest, by default JDA_PIPELINE")
+    common.add_argument("--model", help="model used by every step instead of the configured ones")
+    common.add_argument(
+        "--parallel",
+        type=int,
+        default=DEFAULT_PARALLEL,
+        help="maximum number of steps or runs at the same time, 0 for one by one",
     )
-    parser.add_argument(dest="n", help="n-th Fibonacci number", type=int, metavar="INT")
-    parser.add_argument(
+    common.add_argument(
+        "--cache",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="share the outputs of user-independent steps between runs",
+    )
+    common.add_argument(
+        "--document",
+        dest="documents",
+        action="append",
+        help="render only this document, can be repeated, by default all of them",
+    )
+    common.add_argument(
+        "--format", choices=FORMATS, help="format of every document instead of the configured ones"
+    )
+    common.add_argument(
+        "--profile",
+        action="store_true",
+        help="print a cProfile breakdown and the time per step, implies --parallel 0",
+    )
+    common.add_argument(
+        "--cassette",
+        help="replay the API calls from this file instead of calling the API, see --record",
+    )
+    common.add_argument(
+        "--record", action="store_true", help="call the API and record the calls to --cassette"
+    )
+    common.add_argument(
+        "--cassette-latency",
+        default="none",
+        help="replayed latency: none, recorded or a number of seconds, by default none",
+    )
+    common.add_argument(
         "-v",
         "--verbose",
         dest="loglevel",
@@ -87,7 +229,7 @@ def parse_args(args):
         action="store_const",
         const=logging.INFO,
     )
-    parser.add_argument(
+    common.add_argument(
         "-vv",
         "--very-verbose",
         dest="loglevel",
@@ -95,6 +237,46 @@ def parse_args(args):
         action="store_const",
         const=logging.DEBUG,
     )
+
+    parser = argparse.ArgumentParser(prog="jda", description="Generate job application documents")
+    parser.add_argument(
+        "--version",
+        action="version",
+        version=f"job_docs_automation {__version__}",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = commands.add_parser(
+        "generate", parents=[common], help="generate the document for one job posting"
+    )
+    generate_parser.add_argument(
+        "job_description", help="file with the job posting, - to read it from stdin"
+    )
+    generate_parser.add_argument(
+        "-o", "--output", help="start of the file names, by default the name of the posting"
+    )
+    generate_parser.add_argument(
+        "--output-dir", default="outputs", help="directory of the documents"
+    )
+    generate_parser.add_argument("--resume", action="store_true", help=RESUME_HELP)
+
+    batch_parser = commands.add_parser(
+        "batch", parents=[common], help="generate the documents for many job postings"
+    )
+    batch_parser.add_argument("job_descriptions", nargs="+", help="files with job postings")
+    batch_parser.add_argument("--output-dir", default="outputs", help="directory of the documents")
+    batch_parser.add_argument("--resume", action="store_true", help=RESUME_HELP)
+
+    bench_parser = commands.add_parser(
+        "bench",
+        parents=[common],
+        help="time the pipeline against the offline fake LLM or a replayed --cassette",
+    )
+    bench_parser.add_argument("--runs", type=int, default=5, help="runs of the pipeline")
+    bench_parser.add_argument("--latency", type=float, default=0.0, help="fake LLM latency (s)")
+    bench_parser.add_argument(
+        "--job-description", help="file with the job posting, by default a built-in sample"
+    )
     return parser.parse_args(args)
 
 
@@ -110,20 +292,190 @@ def setup_logging(loglevel):
     )
 
 
-def main(args):
-    """Wrapper allowing :func:`fib` to be called with string arguments in a CLI fashion
+def read_job_description(path):
+    """Read a job posting from a file, or from stdin if the path is ``-``"""
+    if path == "-":
+        return sys.stdin.read()
+    with open(path, "r", encoding="utf-8") as file:
+        return file.read()
+
+
+def posting_stem(path):
+    """Name the documents of a posting after its file, e.g. ``acme`` for ``postings/acme.txt``"""
+    return "stdin" if path == "-" else os.path.splitext(os.path.basename(path))[0] or "document"
+
+
+def posting_stems(paths):
+    """Name the documents of several postings, numbering the names that clash
 
-    Instead of returning the value from :func:`fib`, it prints the result to the
-    ``stdout`` in a nicely formatted message.
+    Args:
+      paths (List[str]): the files with the postings.
+
+    Returns:
+      List[str]: one distinct name per posting, e.g. ``acme`` and ``acme-2`` for
+      ``a/acme.txt`` and ``b/acme.txt``, the same for the same paths in the same order
+    """
+    stems = []
+    for path in paths:
+        stem = candidate = posting_stem(path)
+        number = 1
+        while candidate in stems:
+            number += 1
+            candidate = f"{stem}-{number}"
+        stems.append(candidate)
+    return stems
+
+
+def open_checkpoint(stem, resume):
+    """Open the checkpoint of the run of a posting, named after its documents
+
+    Args:
+      stem (str): the start of the file names of the documents.
+      resume (bool): whether to restore the steps of a previous run.
+
+    Returns:
+      Checkpoint: the checkpoint, saved to ``JDA_CHECKPOINT_DIR``
+    """
+    from checkpoint import Checkpoint
+
+    checkpoint = Checkpoint.open(stem, resume)
+    if resume:
+        _logger.info("Resuming %s from %d checkpointed steps", stem, len(checkpoint))
+    return checkpoint
+
+
+def command_generate(args, inputs, prompts, documents, shared_cache):
+    stem = args.output or posting_stem(args.job_description)
+    result = generate(
+        inputs,
+        prompts,
+        documents,
+        read_job_description(args.job_description),
+        output_dir=args.output_dir,
+        stem=stem,
+        parallel=args.parallel,
+        shared_cache=shared_cache,
+        output_format=args.format,
+        checkpoint=open_checkpoint(stem, args.resume),
+    )
+    if result.resumed:
+        print(f"Restored from the checkpoint: {', '.join(result.resumed)}")
+    for path in result.documents.values():
+        print(f"Document saved to {path}")
+    return [result]
+
+
+def command_batch(args, inputs, prompts, documents, shared_cache):
+    def run_one(path, stem):
+        result = generate(
+            inputs,
+            prompts,
+            documents,
+            read_job_description(path),
+            output_dir=args.output_dir,
+            stem=stem,
+            parallel=min(args.parallel, 1),
+            shared_cache=shared_cache,
+            output_format=args.format,
+            checkpoint=open_checkpoint(stem, args.resume),
+        )
+        _logger.info("Documents saved to %s", ", ".join(result.documents.values()))
+        return result
+
+    stems = posting_stems(args.job_descriptions)
+    if args.parallel <= 0:
+        results = list(map(run_one, args.job_descriptions, stems))
+    else:
+        # Runs in parallel instead of steps: a posting's steps mostly depend on each other
+        with ThreadPoolExecutor(max_workers=args.parallel) as executor:
+            results = list(executor.map(run_one, args.job_descriptions, stems))
+    print(f"{len(results)} postings processed, documents saved to {args.output_dir}")
+    return results
+
+
+def command_bench(args, inputs, prompts, documents, shared_cache):
+    import tempfile
+
+    job_description = (
+        read_job_description(args.job_description)
+        if args.job_description
+        else "Acme is hiring a Data Engineer with Python, SQL, Airflow and Spark experience."
+    )
+    results = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            results.append(
+                generate(
+                    inputs,
+                    prompts,
+                    documents,
+                    job_description,
+                    output_dir=output_dir,
+                    parallel=args.parallel,
+                    shared_cache=shared_cache,
+                    output_format=args.format,
+                )
+            )
+        elapsed = time.perf_counter() - start
+    print(step_report(results, prompts))
+    print(f"\n{args.runs} runs in {elapsed:.2f}s, {elapsed / args.runs * 1000:.1f} ms per run")
+    return results
+
+
+COMMANDS = {"generate": command_generate, "batch": command_batch, "bench": command_bench}
+
+
+def main(args):
+    """Wrapper allowing the pipeline to be run with string arguments in a CLI fashion
 
     Args:
       args (List[str]): command line parameters as list of strings
-          (for example  ``["--verbose", "42"]``).
+          (for example  ``["generate", "posting.txt", "--format", "text"]``).
     """
     args = parse_args(args)
     setup_logging(args.loglevel)
-    _logger.debug("Starting crazy calculations...")
-    print(f"The {args.n}-th Fibonacci number is {fib(args.n)}")
+    if args.record and not args.cassette:
+        raise SystemExit("--record needs --cassette")
+    if args.cassette:
+        os.environ["JDA_CASSETTE"] = args.cassette
+        os.environ["JDA_CASSETTE_MODE"] = "record" if args.record else "replay"
+        os.environ["JDA_CASSETTE_LATENCY"] = args.cassette_latency
+        if not args.record:
+            # Replays are offline, the key only has to be set
+            os.environ.setdefault("OPENAI_API_KEY", "cassette")
+    if args.command == "bench" and not (args.cassette and not args.record):
+        # Never call the API from a benchmark
+        os.environ["JDA_FAKE_LLM"] = "1"
+        os.environ["JDA_FAKE_LLM_LATENCY"] = str(args.latency)
+        os.environ.setdefault("OPENAI_API_KEY", "fake")
+    if not os.getenv("OPENAI_API_KEY"):
+        raise SystemExit("OPENAI_API_KEY is not set")
+
+    from step_cache import MemorySharedCache
+
+    inputs, prompts, documents = load(args.pipeline, args.model)
+    if args.documents:
+        unknown = set(args.documents) - {document.name for document in documents}
+        if unknown:
+            raise SystemExit(f"Unknown documents {sorted(unknown)}")
+        documents = [document for document in documents if document.name in args.documents]
+    shared_cache = MemorySharedCache() if args.cache else None
+    _logger.debug("Loaded %d inputs and %d prompts", len(inputs), len(prompts))
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        # The profiler only sees the main thread, so the steps run in it
+        args.parallel = 0
+        profiler.enable()
+    results = COMMANDS[args.command](args, inputs, prompts, documents, shared_cache)
+    if profiler is not None:
+        profiler.disable()
+        if args.command != "bench":
+            print(step_report(results, prompts), file=sys.stderr)
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(20)
+        print(stream.getvalue(), file=sys.stderr)
     _logger.info("Script ends here")
 
 
@@ -144,6 +496,6 @@ if __name__ == "__main__":
     # After installing your project with pip, users can also run your Python
     # modules as scripts via the ``-m`` flag, as defined in PEP 338::
     #
-    #     python -m job_docs_automation.skeleton 42
+    #     python -m job_docs_automation.skeleton generate posting.txt
     #
     run()
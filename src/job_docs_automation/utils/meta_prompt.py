@@ -1,6 +1,19 @@
+import argparse
+import difflib
+import hashlib
+import json
 import os
+import sys
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
 
-from openai import OpenAI
+CORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../core")
+if CORE_DIR not in sys.path:
+    sys.path.append(CORE_DIR)
+
+from clients import get_client  # noqa: E402
 
 META_PROMPT = """
 Given a task description or existing prompt, produce a detailed system prompt to guide a language model in completing the task effectively.
@@ -49,11 +62,20 @@ The final prompt you output should adhere to the following structure below. Do n
 """.strip()
 
 
-def generate_prompt(task_or_prompt_a: str):
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+MODEL = "gpt-4o"
+# Written next to each prompt.txt by the batch mode
+PROPOSAL_FILE = "prompt.proposed.txt"
+DIFF_FILE = "prompt.diff"
+# Proposals by input hash, in the prompts directory
+CACHE_FILE = ".meta_prompt_cache.json"
+
+
+def generate_prompt(task_or_prompt_a: str, client=None, model: str = MODEL):
+    if client is None:
+        client = get_client()
 
     completion = client.chat.completions.create(
-        model="gpt-4o",
+        model=model,
         messages=[
             {
                 "role": "system",
@@ -69,10 +91,139 @@ def generate_prompt(task_or_prompt_a: str):
     return completion.choices[0].message.content
 
 
-if __name__ == "__main__":
-    task_or_prompt = """
+def input_hash(prompt: str, model: str) -> str:
+    """
+    Hashes everything that determines a proposal: the meta prompt, the model and the prompt.
 
+    Returns
+    -------
+    str
+        A hex digest.
     """
+    digest = hashlib.sha256()
+    for part in (META_PROMPT, model, prompt):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
 
-    system_prompt = generate_prompt(task_or_prompt)
-    print(system_prompt)
+
+def write_proposal(prompt_dir: str, original: str, proposal: str) -> None:
+    """
+    Writes a proposal and its unified diff against the original next to ``prompt.txt``.
+    """
+    with open(os.path.join(prompt_dir, PROPOSAL_FILE), "w", encoding="utf-8") as file:
+        file.write(proposal)
+    diff = difflib.unified_diff(
+        original.splitlines(keepends=True),
+        proposal.splitlines(keepends=True),
+        fromfile=os.path.join(prompt_dir, "prompt.txt"),
+        tofile=os.path.join(prompt_dir, PROPOSAL_FILE),
+    )
+    with open(os.path.join(prompt_dir, DIFF_FILE), "w", encoding="utf-8") as file:
+        file.writelines(diff)
+
+
+def improve_prompts(
+    prompts_dir: str,
+    parallel: int = 8,
+    model: str = MODEL,
+    client=None,
+    force: bool = False,
+) -> Dict[str, str]:
+    """
+    Proposes improvements for every ``<prompts_dir>/<name>/prompt.txt`` concurrently.
+
+    All calls share one client, so they also share its connection pool. Prompts whose
+    input hash is in the cache and whose proposal is still on disk are skipped. A failed
+    call only fails its prompt: the other proposals are still written and cached, and the
+    next run retries the failed ones.
+
+    Parameters
+    ----------
+    prompts_dir : str
+        The directory with one subdirectory per prompt.
+    parallel : int, optional
+        The maximum number of concurrent calls, by default 8.
+    model : str, optional
+        The model writing the proposals, by default MODEL.
+    client : optional
+        The OpenAI client, by default one is created.
+    force : bool, optional
+        Whether to ignore the cache, by default False.
+
+    Returns
+    -------
+    Dict[str, str]
+        ``generated``, ``cached`` or ``failed`` for every prompt name.
+    """
+    cache_path = os.path.join(prompts_dir, CACHE_FILE)
+    cache: Dict[str, str] = {}
+    if os.path.exists(cache_path) and not force:
+        with open(cache_path, "r", encoding="utf-8") as file:
+            cache = json.load(file)
+
+    todo: Dict[str, str] = {}
+    status: Dict[str, str] = {}
+    originals: Dict[str, str] = {}
+    for name in sorted(os.listdir(prompts_dir)):
+        prompt_path = os.path.join(prompts_dir, name, "prompt.txt")
+        if not os.path.isfile(prompt_path):
+            continue
+        with open(prompt_path, "r", encoding="utf-8") as file:
+            originals[name] = file.read()
+        key = input_hash(originals[name], model)
+        proposal_path = os.path.join(prompts_dir, name, PROPOSAL_FILE)
+        if key in cache and os.path.exists(proposal_path):
+            status[name] = "cached"
+        else:
+            todo[name] = key
+
+    if todo:
+        client = client or get_client()
+        with ThreadPoolExecutor(max_workers=max(parallel, 1)) as executor:
+            futures = {
+                name: executor.submit(generate_prompt, originals[name], client, model)
+                for name in todo
+            }
+            for name, future in futures.items():
+                try:
+                    cache[todo[name]] = future.result()
+                except Exception as error:
+                    warnings.warn(f"Failed to improve prompt {name}: {error}")
+                    status[name] = "failed"
+                else:
+                    status[name] = "generated"
+
+    for name in todo:
+        if status[name] == "failed":
+            continue
+        write_proposal(os.path.join(prompts_dir, name), originals[name], cache[todo[name]])
+    # Only the hashes of the current prompts are kept
+    current = {input_hash(original, model) for original in originals.values()}
+    with open(cache_path, "w", encoding="utf-8") as file:
+        json.dump({key: value for key, value in cache.items() if key in current}, file, indent=2)
+    return status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Propose improvements for system prompts")
+    parser.add_argument(
+        "--batch",
+        metavar="PROMPTS_DIR",
+        help="improve every <PROMPTS_DIR>/<name>/prompt.txt and write proposals and diffs",
+    )
+    parser.add_argument("--parallel", type=int, default=8, help="concurrent calls")
+    parser.add_argument("--model", default=MODEL)
+    parser.add_argument("--force", action="store_true", help="ignore cached proposals")
+    parser.add_argument("task", nargs="?", default="", help="task or prompt to improve")
+    args = parser.parse_args()
+
+    if args.batch:
+        start = time.perf_counter()
+        results = improve_prompts(args.batch, args.parallel, args.model, force=args.force)
+        for name, result in results.items():
+            print(f"{name}: {result}")
+        print(f"{len(results)} prompts in {time.perf_counter() - start:.1f}s")
+    else:
+        system_prompt = generate_prompt(args.task, model=args.model)
+        print(system_prompt)
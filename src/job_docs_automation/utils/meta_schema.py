@@ -1,7 +1,13 @@
-from openai import OpenAI
 import json
+import os
+import sys
 
-client = OpenAI()
+CORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../core")
+if CORE_DIR not in sys.path:
+    sys.path.append(CORE_DIR)
+
+from clients import get_client  # noqa: E402
+from strict_schema import normalize_schema  # noqa: E402
 
 META_SCHEMA = {
     "name": "metaschema",
@@ -230,7 +236,7 @@ Output: {
 
 
 def generate_schema(description: str):
-    completion = client.chat.completions.create(
+    completion = get_client().chat.completions.create(
         model="gpt-4o-mini",
         response_format={"type": "json_schema", "json_schema": META_SCHEMA},
         messages=[
@@ -245,7 +251,10 @@ def generate_schema(description: str):
         ],
     )
 
-    return json.loads(completion.choices[0].message.content)
+    # The model does not always follow the rules, fix locally what can be fixed, this raises
+    # StrictSchemaError with every remaining problem
+    schema, _ = normalize_schema(json.loads(completion.choices[0].message.content), mode="fix")
+    return schema
 
 
 if __name__ == "__main__":
@@ -1,6 +1,11 @@
-from openai import OpenAI
+import os
+import sys
 
-client = OpenAI()
+CORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../core")
+if CORE_DIR not in sys.path:
+    sys.path.append(CORE_DIR)
+
+from clients import get_client  # noqa: E402
 
 META_PROMPT = """
 Given a current prompt and a change description, produce a detailed system prompt to guide a language model in completing the task effectively.
@@ -69,7 +74,7 @@ The final prompt you output should adhere to the following structure below. Do n
 
 
 def generate_prompt(task_or_prompt: str):
-    completion = client.chat.completions.create(
+    completion = get_client().chat.completions.create(
         model="gpt-4o",
         messages=[
             {
@@ -0,0 +1,497 @@
+"""Evaluates pipeline variants over a corpus of job descriptions and compares them."""
+
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+CORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../core")
+if CORE_DIR not in sys.path:
+    sys.path.append(CORE_DIR)
+
+from backend import PLACEHOLDER, Prompt, document_text  # noqa: E402
+from manifest import load_documents, load_pipeline  # noqa: E402
+from runner import OutputDocument, run_pipeline  # noqa: E402
+from scheduler import BATCH, RateLimiter, set_limiter, work  # noqa: E402
+from step_cache import MemorySharedCache, SharedStepCache  # noqa: E402
+
+CACHE_FILE = ".prompt_eval_cache.json"
+CORPUS_EXTENSIONS = (".txt", ".md")
+STATUSES = ("ok", "schema_failure", "error")
+
+
+class Variant:
+    """
+    A pipeline under evaluation, loaded from its manifest.
+    """
+
+    name: str
+    inputs: Dict[str, str]
+    prompts: List[Prompt]
+    documents: List[OutputDocument]
+
+    def __init__(self, name: str, manifest_path: str):
+        self.name = name
+        self.inputs, self.prompts = load_pipeline(manifest_path)
+        self.documents = load_documents(manifest_path, self.prompts)
+
+    def run_key(self, job_description: str) -> str:
+        """
+        Hashes everything that determines a run: the prompts, the inputs and the posting.
+
+        Returns
+        -------
+        str
+            A hex digest.
+        """
+        content = {
+            "inputs": self.inputs,
+            "prompts": [
+                [
+                    prompt.name,
+                    prompt.prompt,
+                    prompt.prompt_input,
+                    prompt.output_schema,
+                    prompt.model,
+                ]
+                for prompt in self.prompts
+            ],
+            "documents": [[document.step, document.field] for document in self.documents],
+            "job_description": job_description,
+        }
+        text = json.dumps(content, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def read_corpus(paths: List[str]) -> Dict[str, str]:
+    """
+    Reads the job descriptions of the corpus.
+
+    Parameters
+    ----------
+    paths : List[str]
+        Files, or directories whose ``.txt`` and ``.md`` files are read.
+
+    Returns
+    -------
+    Dict[str, str]
+        The job descriptions by file name without extension.
+    """
+    files: List[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name)
+                for name in sorted(os.listdir(path))
+                if name.endswith(CORPUS_EXTENSIONS)
+            )
+        else:
+            files.append(path)
+    corpus: Dict[str, str] = {}
+    for path in files:
+        with open(path, "r", encoding="utf-8") as file:
+            corpus[os.path.splitext(os.path.basename(path))[0]] = file.read()
+    return corpus
+
+
+def schema_violations(
+    value: Any, schema: Dict[str, Any], defs: Dict[str, Any], drop: frozenset, path: str = "#"
+) -> List[str]:
+    """
+    Checks a decoded output against the subset of JSON schema used in strict mode.
+
+    Parameters
+    ----------
+    value : Any
+        The decoded output.
+    schema : Dict[str, Any]
+        The schema of the value.
+    defs : Dict[str, Any]
+        The ``$defs`` of the root schema.
+    drop : frozenset
+        The fields removed by the decoder, which are not required in the output.
+    path : str, optional
+        The location of the value, by default ``#``.
+
+    Returns
+    -------
+    List[str]
+        The violations found, empty if the value conforms.
+    """
+    if "$ref" in schema:
+        ref = schema["$ref"]
+        target = defs.get("#") if ref == "#" else defs.get(ref.split("/")[-1])
+        if target is None:
+            return [f"{path}: unresolved $ref {ref}"]
+        return schema_violations(value, target, defs, drop, path)
+    if "anyOf" in schema:
+        for option in schema["anyOf"]:
+            if not schema_violations(value, option, defs, drop, path):
+                return []
+        return [f"{path}: matches no option of anyOf"]
+    if "enum" in schema and value not in schema["enum"]:
+        return [f"{path}: {value!r} is not one of {schema['enum']}"]
+    types = schema.get("type", [])
+    types = types if isinstance(types, list) else [types]
+    checks = {
+        "object": lambda item: isinstance(item, dict),
+        "array": lambda item: isinstance(item, list),
+        "string": lambda item: isinstance(item, str),
+        "integer": lambda item: isinstance(item, int) and not isinstance(item, bool),
+        "number": lambda item: isinstance(item, (int, float)) and not isinstance(item, bool),
+        "boolean": lambda item: isinstance(item, bool),
+        "null": lambda item: item is None,
+    }
+    if types and not any(checks[name](value) for name in types if name in checks):
+        return [f"{path}: expected {' or '.join(types)}"]
+    violations: List[str] = []
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        for key in schema.get("required", []):
+            if key not in value and key not in drop:
+                violations.append(f"{path}: missing '{key}'")
+        for key, item in value.items():
+            if key in properties:
+                violations.extend(
+                    schema_violations(item, properties[key], defs, drop, f"{path}/{key}")
+                )
+            elif schema.get("additionalProperties") is False:
+                violations.append(f"{path}: unexpected '{key}'")
+    elif isinstance(value, list) and "items" in schema:
+        for idx, item in enumerate(value):
+            violations.extend(schema_violations(item, schema["items"], defs, drop, f"{path}/{idx}"))
+    return violations
+
+
+def output_violations(prompt: Prompt, output: Any) -> List[str]:
+    """
+    Checks the decoded output of a step against the schema of its prompt.
+    """
+    defs = {**prompt.output_schema.get("$defs", {}), "#": prompt.output_schema}
+    return schema_violations(output, prompt.output_schema, defs, prompt.decoder.drop)
+
+
+def _strings(value: Any) -> List[str]:
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        return [text for item in value.values() for text in _strings(item)]
+    if isinstance(value, list):
+        return [text for item in value for text in _strings(item)]
+    return []
+
+
+def quality_checks(
+    texts: List[str], outputs: Dict[str, Any], min_words: int, max_words: int
+) -> Dict[str, bool]:
+    """
+    Runs cheap automatic checks on the documents and the outputs of a run.
+
+    Parameters
+    ----------
+    texts : List[str]
+        The text of every document.
+    outputs : Dict[str, Any]
+        The decoded output of every step.
+    min_words : int
+        The minimum number of words of a document.
+    max_words : int
+        The maximum number of words of a document, 0 for no limit.
+
+    Returns
+    -------
+    Dict[str, bool]
+        Whether each check passed: ``no_empty_fields``, ``no_placeholders`` and ``length``.
+    """
+    words = [len(text.split()) for text in texts]
+    return {
+        "no_empty_fields": all(text.strip() for text in _strings(outputs)),
+        "no_placeholders": not any(PLACEHOLDER.search(text) for text in texts),
+        "length": all(
+            count >= min_words and (not max_words or count <= max_words) for count in words
+        ),
+    }
+
+
+def evaluate_run(
+    variant: Variant,
+    job_description: str,
+    shared_cache: Optional[SharedStepCache] = None,
+    step_parallel: int = 1,
+    min_words: int = 150,
+    max_words: int = 600,
+) -> Dict[str, Any]:
+    """
+    Runs one variant on one job description.
+
+    Parameters
+    ----------
+    variant : Variant
+        The pipeline to run.
+    job_description : str
+        The job posting.
+    shared_cache : Optional[SharedStepCache], optional
+        The cache for the outputs of user-independent steps, by default None.
+    step_parallel : int, optional
+        The maximum number of steps of the run running at the same time, by default 1.
+    min_words, max_words : int, optional
+        The bounds of the ``length`` check, by default 150 and 600.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The ``status`` (``ok``, ``schema_failure`` or ``error``), the run time in ``seconds``,
+        the summed token ``usage``, the ``checks`` and the ``violations`` or ``error``.
+    """
+    replacements: Dict[str, Any] = {**variant.inputs, "job_description": job_description}
+    record: Dict[str, Any] = {"status": "ok", "usage": {}, "checks": {}, "violations": []}
+    start = time.perf_counter()
+    try:
+        # Evaluations use the capacity left by the users, each variant getting a fair share
+        with work(f"eval:{variant.name}", BATCH):
+            result = run_pipeline(
+                variant.prompts,
+                replacements,
+                parallel=step_parallel,
+                shared_cache=shared_cache,
+                targets=[document.step for document in variant.documents],
+            )
+    except json.JSONDecodeError as error:
+        # The response of a step is not even JSON
+        record.update(status="schema_failure", error=str(error))
+    except Exception as error:
+        # Also API errors such as rate limits and timeouts, one run must not end the others
+        record.update(status="error", error=f"{type(error).__name__}: {error}")
+    record["seconds"] = time.perf_counter() - start
+    if record["status"] != "ok":
+        return record
+    for step_usage in result.usage.values():
+        for key, count in step_usage.items():
+            record["usage"][key] = record["usage"].get(key, 0) + count
+    for prompt in variant.prompts:
+        if prompt.name in result.outputs:
+            record["violations"].extend(
+                f"{prompt.name} {violation}"
+                for violation in output_violations(prompt, result.outputs[prompt.name])
+            )
+    if record["violations"]:
+        record["status"] = "schema_failure"
+    texts = [
+        document_text(result.outputs[document.step], document.field)
+        for document in variant.documents
+    ]
+    record["checks"] = quality_checks(texts, result.outputs, min_words, max_words)
+    return record
+
+
+def evaluate(
+    variants: List[Variant],
+    corpus: Dict[str, str],
+    parallel: int = 4,
+    step_parallel: int = 1,
+    shared_cache: Optional[SharedStepCache] = None,
+    cache_path: Optional[str] = None,
+    min_words: int = 150,
+    max_words: int = 600,
+) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    Runs every variant on every job description of the corpus concurrently.
+
+    Runs whose prompts, inputs and posting are unchanged since a previous evaluation are
+    read from ``cache_path`` instead, so a report after editing one variant only reruns
+    that variant. Set ``JDA_RATE_LIMIT_RPM`` and ``JDA_RATE_LIMIT_TPM`` (or ``--rpm`` and
+    ``--tpm``) to keep the runs within the limits of the API key.
+
+    Parameters
+    ----------
+    variants : List[Variant]
+        The pipelines to compare.
+    corpus : Dict[str, str]
+        The job descriptions by name.
+    parallel : int, optional
+        The maximum number of runs at the same time, by default 4.
+    step_parallel : int, optional
+        The maximum number of steps of a run at the same time, by default 1.
+    shared_cache : Optional[SharedStepCache], optional
+        The cache for the outputs of user-independent steps, shared by all the runs so
+        variants with the same upstream prompts compute them once, by default None.
+    cache_path : Optional[str], optional
+        The JSON file with the records of previous runs, by default None.
+    min_words, max_words : int, optional
+        The bounds of the ``length`` check, by default 150 and 600.
+
+    Returns
+    -------
+    Dict[str, Dict[str, Dict[str, Any]]]
+        The record of every run, by variant and job description name, see ``evaluate_run``.
+    """
+    cache: Dict[str, Dict[str, Any]] = {}
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as file:
+            cache = json.load(file)
+
+    records: Dict[str, Dict[str, Dict[str, Any]]] = {variant.name: {} for variant in variants}
+    todo: List[Tuple[Variant, str, str]] = []
+    for variant in variants:
+        for posting, job_description in corpus.items():
+            key = variant.run_key(job_description)
+            if key in cache:
+                records[variant.name][posting] = {**cache[key], "cached": True}
+            else:
+                todo.append((variant, posting, key))
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(parallel, 1)) as executor:
+            futures = {
+                executor.submit(
+                    evaluate_run,
+                    variant,
+                    corpus[posting],
+                    shared_cache,
+                    step_parallel,
+                    min_words,
+                    max_words,
+                ): (variant, posting, key)
+                for variant, posting, key in todo
+            }
+            for future, (variant, posting, key) in futures.items():
+                records[variant.name][posting] = future.result()
+                # Errors are usually transient (rate limits, timeouts), so only answers are kept
+                if records[variant.name][posting]["status"] != "error":
+                    cache[key] = records[variant.name][posting]
+    finally:
+        # The runs paid for are kept even if the evaluation is interrupted
+        if cache_path:
+            current = {variant.run_key(text) for variant in variants for text in corpus.values()}
+            with open(cache_path, "w", encoding="utf-8") as file:
+                json.dump({key: value for key, value in cache.items() if key in current}, file)
+    return records
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def summarize(records: Dict[str, Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, float]]:
+    """
+    Aggregates the records of ``evaluate`` per variant.
+
+    Returns
+    -------
+    Dict[str, Dict[str, float]]
+        For every variant: the number of ``runs``, the ``schema_failure_rate`` and
+        ``error_rate``, the ``p50_s`` and ``p95_s`` run time, the mean ``prompt_tokens``,
+        ``completion_tokens`` and ``cached_tokens`` and the pass rate of every check.
+    """
+    summary: Dict[str, Dict[str, float]] = {}
+    for name, runs in records.items():
+        values = list(runs.values())
+        answered = [record for record in values if record["status"] != "error"]
+        row: Dict[str, float] = {"runs": len(values)}
+        for status in STATUSES[1:]:
+            count = sum(1 for record in values if record["status"] == status)
+            row[f"{status}_rate"] = count / len(values) if values else 0.0
+        seconds = [record["seconds"] for record in answered if not record.get("cached")]
+        seconds = seconds or [record["seconds"] for record in answered]
+        row["p50_s"] = statistics.median(seconds) if seconds else 0.0
+        row["p95_s"] = _percentile(seconds, 0.95)
+        for key in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+            counts = [record["usage"].get(key, 0) for record in answered]
+            row[key] = statistics.mean(counts) if counts else 0.0
+        checked = [record["checks"] for record in answered if record["checks"]]
+        for check in sorted({check for checks in checked for check in checks}):
+            row[f"check_{check}"] = sum(checks.get(check, False) for checks in checked) / len(
+                checked
+            )
+        summary[name] = row
+    return summary
+
+
+def format_report(summary: Dict[str, Dict[str, float]]) -> str:
+    """
+    Formats the summary as a Markdown table with one column per variant.
+    """
+    names = list(summary)
+    metrics = [key for key in next(iter(summary.values()), {})]
+    lines = [
+        "| metric | " + " | ".join(names) + " |",
+        "|---" * (len(names) + 1) + "|",
+    ]
+    for metric in metrics:
+        cells = []
+        for name in names:
+            value = summary[name].get(metric, 0.0)
+            if metric.endswith("_rate") or metric.startswith("check_"):
+                cells.append(f"{value:.0%}")
+            elif metric.endswith("_s"):
+                cells.append(f"{value:.2f}")
+            else:
+                cells.append(f"{value:.0f}")
+        lines.append(f"| {metric} | " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+
+def parse_variant(spec: str) -> Tuple[str, str]:
+    """
+    Splits ``NAME=MANIFEST`` into its parts, the name defaults to the manifest path.
+    """
+    name, _, path = spec.rpartition("=")
+    return (name or path), path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare pipeline variants over a corpus of job descriptions"
+    )
+    parser.add_argument(
+        "variants", nargs="+", metavar="[NAME=]MANIFEST", help="pipeline manifest of a variant"
+    )
+    parser.add_argument(
+        "--corpus",
+        action="append",
+        required=True,
+        help="job description file, or directory of .txt/.md files (repeatable)",
+    )
+    parser.add_argument("--parallel", type=int, default=4, help="concurrent runs")
+    parser.add_argument("--step-parallel", type=int, default=1, help="concurrent steps per run")
+    parser.add_argument("--rpm", type=int, help="requests per minute of the API key")
+    parser.add_argument("--tpm", type=int, help="tokens per minute of the API key")
+    parser.add_argument("--min-words", type=int, default=150)
+    parser.add_argument("--max-words", type=int, default=600)
+    parser.add_argument(
+        "--cache",
+        default=CACHE_FILE,
+        help=f"file with the records of previous runs, by default {CACHE_FILE}",
+    )
+    parser.add_argument("--force", action="store_true", help="ignore the records of previous runs")
+    parser.add_argument("--json", metavar="PATH", help="also write the records and the summary")
+    args = parser.parse_args()
+
+    if args.rpm or args.tpm:
+        set_limiter(RateLimiter(args.rpm or 0, args.tpm or 0))
+    if args.force and os.path.exists(args.cache):
+        os.remove(args.cache)
+    start = time.perf_counter()
+    results = evaluate(
+        [Variant(*parse_variant(spec)) for spec in args.variants],
+        read_corpus(args.corpus),
+        parallel=args.parallel,
+        step_parallel=args.step_parallel,
+        shared_cache=MemorySharedCache(),
+        cache_path=args.cache,
+        min_words=args.min_words,
+        max_words=args.max_words,
+    )
+    report = summarize(results)
+    print(format_report(report))
+    runs = sum(len(runs) for runs in results.values())
+    print(f"\n{runs} runs in {time.perf_counter() - start:.1f}s")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({"summary": report, "records": results}, file, indent=2)
@@ -1,3 +1,48 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.utils import timezone
 
-# Register your models here.
+from .models import DailyUsage, SharedStepResult
+
+
+@admin.register(SharedStepResult)
+class SharedStepResultAdmin(admin.ModelAdmin):
+    list_display = ("prompt_name", "key", "created_at", "expires_at")
+    list_filter = ("prompt_name",)
+    search_fields = ("key", "prompt_name")
+    readonly_fields = ("key", "prompt_name", "output", "created_at", "expires_at")
+    actions = ["purge_selected", "purge_expired"]
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Purge selected entries")
+    def purge_selected(self, request, queryset):
+        deleted, _ = queryset.delete()
+        self.message_user(request, f"Purged {deleted} entries.", messages.SUCCESS)
+
+    @admin.action(description="Purge expired entries among the selected ones")
+    def purge_expired(self, request, queryset):
+        # "Select all" in the changelist extends the selection to every filtered entry
+        deleted, _ = queryset.filter(expires_at__lte=timezone.now()).delete()
+        self.message_user(request, f"Purged {deleted} expired entries.", messages.SUCCESS)
+
+
+@admin.register(DailyUsage)
+class DailyUsageAdmin(admin.ModelAdmin):
+    list_display = (
+        "period",
+        "user",
+        "model",
+        "calls",
+        "prompt_tokens",
+        "completion_tokens",
+        "cached_tokens",
+    )
+    list_filter = ("model", "period")
+    search_fields = ("user__username",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
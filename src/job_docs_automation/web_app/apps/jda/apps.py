@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AppNameConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.jda'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,62 @@
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+from fingerprint import PostingIndex
+
+from .models import GenerationRun
+
+# Per-user indexes are rebuilt from the database after this many seconds, so runs
+# created by other worker processes are eventually found too
+INDEX_MAX_AGE = 300
+# Only the most recent runs of a user are indexed
+INDEX_MAX_RUNS = 500
+
+_indexes: Dict[int, Tuple[float, PostingIndex]] = {}
+_lock = threading.Lock()
+
+
+def _user_index(user_id: int) -> PostingIndex:
+    with _lock:
+        entry = _indexes.get(user_id)
+    if entry is not None and time.monotonic() - entry[0] < INDEX_MAX_AGE:
+        return entry[1]
+    index = PostingIndex()
+    rows = (
+        GenerationRun.objects.filter(user_id=user_id)
+        .order_by("-created_at")
+        .values_list("id", "fingerprint")[:INDEX_MAX_RUNS]
+    )
+    for run_id, signature in rows:
+        index.add(run_id, bytes(signature))
+    with _lock:
+        _indexes[user_id] = (time.monotonic(), index)
+    return index
+
+
+def find_duplicate_runs(user_id: int, signature: bytes) -> List[Tuple[int, float]]:
+    """
+    Finds the earlier runs of the user on near-identical postings.
+
+    Parameters
+    ----------
+    user_id : int
+        The id of the user.
+    signature : bytes
+        The fingerprint of the new posting.
+
+    Returns
+    -------
+    List[Tuple[int, float]]
+        The run ids and the estimated similarities, the best match first.
+    """
+    threshold = getattr(settings, "JDA_DUPLICATE_THRESHOLD", 0.8)
+    return _user_index(user_id).query(signature, threshold)
+
+
+def register_run(run: GenerationRun) -> None:
+    """
+    Adds a new run to the user's index.
+    """
+    _user_index(run.user_id).add(run.id, bytes(run.fingerprint))
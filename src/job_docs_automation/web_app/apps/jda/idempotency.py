@@ -0,0 +1,170 @@
+"""
+Single-flight coalescing of duplicate requests carrying the same ``Idempotency-Key``.
+
+A double click on Next or a resent request would otherwise run the step twice, paying
+for two calls and advancing ``current_step`` twice. The page sends the same key for the
+same action on the same step. The first request with a key runs the view, concurrent
+ones wait for it and get its response, and later ones get the response stored in the
+session.
+
+The calls in flight are tracked per process: duplicates are only coalesced when they
+reach the same worker. Under a pre-forking server, concurrent duplicates answered by
+different workers both run the view, and so both run ``execute_step``. Only once the
+first one has saved the session are later duplicates answered from it, on any worker.
+"""
+
+import functools
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+from rest_framework.response import Response
+
+# Completed responses kept per session, only the last actions can be resent
+SESSION_FIELD = "idempotent_responses"
+MAX_STORED = 8
+MAX_KEY_LENGTH = 100
+
+
+class InFlight(Exception):
+    """
+    Raised when the call of a key in flight takes longer than its duplicates wait for it.
+    """
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Optional[Tuple[int, Any]] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Runs one function per key at a time, the callers of a key in flight share its result.
+
+    Results stay available for ``ttl`` seconds after the call, which covers duplicates
+    that arrive once the call is done but before its session is saved.
+
+    Parameters
+    ----------
+    ttl : float, optional
+        The seconds a result is kept after its call, by default 30.
+    wait : Optional[float], optional
+        The maximum seconds a caller waits for the call in flight, by default no limit.
+    """
+
+    def __init__(self, ttl: float = 30.0, wait: Optional[float] = None):
+        self.ttl = ttl
+        self.wait = wait
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._recent: Dict[str, Tuple[float, Tuple[int, Any]]] = {}
+        self.shared = 0
+
+    def do(
+        self, key: str, function: Callable[[], Tuple[int, Any]]
+    ) -> Tuple[Tuple[int, Any], bool]:
+        """
+        Runs ``function`` unless a call with the same key is in flight or recent.
+
+        Parameters
+        ----------
+        key : str
+            The key of the call.
+        function : Callable[[], Tuple[int, Any]]
+            Computes the status code and data of the response.
+
+        Returns
+        -------
+        Tuple[Tuple[int, Any], bool]
+            The result and whether it was shared with another call.
+
+        Raises
+        ------
+        InFlight
+            If the call in flight is not done after ``wait`` seconds.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for recent_key in [k for k, (expiry, _) in self._recent.items() if expiry <= now]:
+                del self._recent[recent_key]
+            if key in self._recent:
+                self.shared += 1
+                return self._recent[key][1], True
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+        if not leader:
+            if not call.done.wait(self.wait):
+                raise InFlight(key)
+            if call.error is not None:
+                raise call.error
+            assert call.result is not None
+            return call.result, True
+        try:
+            call.result = function()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                if call.result is not None and 200 <= call.result[0] < 300:
+                    self._recent[key] = (time.monotonic() + self.ttl, call.result)
+            call.done.set()
+        return call.result, False
+
+
+flights = SingleFlight(settings.JDA_IDEMPOTENCY_TTL, settings.JDA_IDEMPOTENCY_WAIT)
+
+
+def idempotent(view: Callable[..., Response]) -> Callable[..., Response]:
+    """
+    Coalesces the requests to the view that carry the same ``Idempotency-Key`` header.
+
+    Requests without the header run the view as before. Only successful responses are
+    shared with later requests, a failed call can be retried with the same key. Duplicates
+    still waiting after ``JDA_IDEMPOTENCY_WAIT`` seconds get a 409 and free their worker.
+    """
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs) -> Response:
+        idempotency_key = request.META.get("HTTP_IDEMPOTENCY_KEY", "")[:MAX_KEY_LENGTH]
+        if not idempotency_key:
+            return view(request, *args, **kwargs)
+        stored = request.session.get(SESSION_FIELD, {}).get(idempotency_key)
+        if stored is not None:
+            return _replayed(*stored)
+
+        if request.session.session_key is None:
+            request.session.save()
+        responses = {}
+
+        def run() -> Tuple[int, Any]:
+            response = view(request, *args, **kwargs)
+            responses["response"] = response
+            if 200 <= response.status_code < 300:
+                completed = request.session.get(SESSION_FIELD, {})
+                completed[idempotency_key] = [response.status_code, response.data]
+                request.session[SESSION_FIELD] = dict(list(completed.items())[-MAX_STORED:])
+            return response.status_code, response.data
+
+        # Keys are per session, another user sending the same key gets nothing from it
+        try:
+            result, shared = flights.do(f"{request.session.session_key}:{idempotency_key}", run)
+        except InFlight:
+            return Response({"error": "Request in progress."}, status=409)
+        if shared:
+            return _replayed(*result)
+        return responses["response"]
+
+    return wrapper
+
+
+def _replayed(status: int, data: Any) -> Response:
+    return Response(data, status=status, headers={"Idempotent-Replayed": "true"})
@@ -0,0 +1,30 @@
+import time
+
+from apps.jda.usage import rollup_usage
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Adds the new records of the usage ledger to the hourly and daily rollups."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=10000)
+        parser.add_argument(
+            "--every",
+            type=float,
+            default=0,
+            help="Rolls up every this many seconds instead of once, e.g. in a sidecar.",
+        )
+
+    def handle(self, *args, batch_size: int, every: float, **options):
+        while True:
+            total = 0
+            while True:
+                rolled_up = rollup_usage(batch_size)
+                total += rolled_up
+                if rolled_up < batch_size:
+                    break
+            self.stdout.write(f"Rolled up {total} usage records.")
+            if every <= 0:
+                return
+            time.sleep(every)
@@ -1,6 +1,9 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+# Profile fields that are used as pipeline inputs of the same name
+PROFILE_FIELDS = ("experience", "education", "highlights", "hobbies", "languages", "other")
+
 
 class Profile(models.Model):
     user = models.OneToOneField(get_user_model(), on_delete=models.CASCADE)
@@ -15,4 +18,94 @@ class CoverLetter(models.Model):
     user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
     title = models.CharField(max_length=255)
     content = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class SharedStepResult(models.Model):
+    """Output of a user-independent step, shared by every user who runs it on the same posting."""
+
+    key = models.CharField(max_length=64, primary_key=True)
+    prompt_name = models.CharField(max_length=255, db_index=True)
+    output = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.prompt_name} ({self.key[:12]})"
+
+
+class GenerationRun(models.Model):
+    """A generation run of a user, kept to offer its step outputs when the posting is pasted again."""
+
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+    job_description = models.TextField()
+    # MinHash signature of the posting, see core/fingerprint.py
+    fingerprint = models.BinaryField()
+    outputs = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class UsageRecord(models.Model):
+    """One LLM call, appended to the usage ledger and never updated, see usage.py."""
+
+    # Kept when the user or the run is deleted, the spend happened anyway
+    user = models.ForeignKey(get_user_model(), null=True, on_delete=models.SET_NULL)
+    run = models.ForeignKey(GenerationRun, null=True, on_delete=models.SET_NULL)
+    prompt_name = models.CharField(max_length=255)
+    model = models.CharField(max_length=100)
+    prompt_tokens = models.PositiveIntegerField()
+    completion_tokens = models.PositiveIntegerField()
+    cached_tokens = models.PositiveIntegerField()
+    latency = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # The calls of a user not rolled up yet, see usage.tokens_used
+        indexes = [models.Index(fields=["user", "id"])]
+
+
+class UsageRollup(models.Model):
+    """Calls and tokens of a user and model over a period, summed from the usage ledger."""
+
+    # Emptied before a user is deleted, see usage.release_user_usage
+    user = models.ForeignKey(get_user_model(), null=True, on_delete=models.SET_NULL)
+    model = models.CharField(max_length=100)
+    # Start of the period, in UTC
+    period = models.DateTimeField()
+    calls = models.PositiveIntegerField(default=0)
+    prompt_tokens = models.BigIntegerField(default=0)
+    completion_tokens = models.BigIntegerField(default=0)
+    cached_tokens = models.BigIntegerField(default=0)
+    latency = models.FloatField(default=0.0)
+
+    class Meta:
+        abstract = True
+        indexes = [models.Index(fields=["user", "period"], name="%(app_label)s_%(class)s_period")]
+        # One row per key, usage.rollup_usage adds to it. NULLs are distinct in unique
+        # constraints, so the row of the anonymous calls has its own
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "model", "period"], name="%(app_label)s_%(class)s_unique"
+            ),
+            models.UniqueConstraint(
+                fields=["model", "period"],
+                condition=models.Q(user__isnull=True),
+                name="%(app_label)s_%(class)s_unique_anonymous",
+            ),
+        ]
+
+
+class HourlyUsage(UsageRollup):
+    pass
+
+
+class DailyUsage(UsageRollup):
+    pass
+
+
+class UsageWatermark(models.Model):
+    """The last ledger record summed into the rollups."""
+
+    name = models.CharField(max_length=50, primary_key=True)
+    last_record_id = models.BigIntegerField(default=0)
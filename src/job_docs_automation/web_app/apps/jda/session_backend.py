@@ -0,0 +1,195 @@
+"""
+Session engine keeping active sessions in an in-process LRU with write-behind persistence.
+
+Every step request rewrites the whole session. With the default database engine each of
+those saves is a synchronous write that serializes on SQLite's single writer lock. This
+engine serves loads and saves from memory and persists dirty sessions in batches from a
+background thread, so many step requests share one write transaction.
+
+The cache is per process and a cached session is never read from the database again, so
+the engine is opt-in (``JDA_WRITE_BEHIND_SESSIONS=1``, see settings.py): use it only with
+a single (threaded) server process or with sticky sessions, otherwise another process
+serves a stale copy of the session. Updates made in the last
+``JDA_SESSION_FLUSH_INTERVAL`` seconds are lost if the process dies.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.sessions.backends.base import CreateError
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.db import DatabaseError, connection
+from django.utils import timezone
+
+_logger = logging.getLogger(__name__)
+
+# session_key -> (encoded session data, expire date)
+Entry = Tuple[str, datetime]
+
+
+class WriteBehindBuffer:
+    """
+    LRU of encoded sessions plus the set of keys waiting to be written to the database.
+
+    Parameters
+    ----------
+    capacity : int
+        The maximum number of sessions kept in memory. Dirty sessions are never evicted
+        before they are flushed.
+    flush_interval : float
+        The number of seconds between two batched writes.
+    """
+
+    def __init__(self, capacity: int, flush_interval: float):
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        # Held for a whole flush, from taking the batch to writing it
+        self.flush_lock = threading.Lock()
+        self.entries: "OrderedDict[str, Entry]" = OrderedDict()
+        self.dirty: Dict[str, Entry] = {}
+        self.flushes = 0
+        self.rows_written = 0
+        self._thread: Optional[threading.Thread] = None
+
+    def get(self, session_key: str) -> Optional[Entry]:
+        with self.lock:
+            entry = self.entries.get(session_key)
+            if entry is not None:
+                self.entries.move_to_end(session_key)
+            return entry
+
+    def put(self, session_key: str, entry: Entry, dirty: bool) -> None:
+        with self.lock:
+            self.entries[session_key] = entry
+            self.entries.move_to_end(session_key)
+            if dirty:
+                self.dirty[session_key] = entry
+            while len(self.entries) > self.capacity:
+                oldest = next(iter(self.entries))
+                if oldest in self.dirty:
+                    break
+                del self.entries[oldest]
+        if dirty:
+            self._ensure_flusher()
+
+    def discard(self, session_key: str) -> None:
+        with self.lock:
+            self.entries.pop(session_key, None)
+            self.dirty.pop(session_key, None)
+
+    def flush(self) -> int:
+        """
+        Writes every dirty session to the database in one upsert.
+
+        Returns
+        -------
+        int
+            The number of sessions written.
+        """
+        with self.flush_lock:
+            return self._flush()
+
+    def _flush(self) -> int:
+        with self.lock:
+            batch, self.dirty = self.dirty, {}
+        if not batch:
+            return 0
+        model = DBStore.get_model_class()
+        objs = [
+            model(session_key=key, session_data=data, expire_date=expire_date)
+            for key, (data, expire_date) in batch.items()
+        ]
+        try:
+            model.objects.bulk_create(
+                objs,
+                update_conflicts=True,
+                unique_fields=["session_key"],
+                update_fields=["session_data", "expire_date"],
+            )
+        except DatabaseError:
+            _logger.exception("Failed to flush %d sessions, retrying later", len(batch))
+            with self.lock:
+                for key, entry in batch.items():
+                    # Keep newer updates that arrived during the failed flush
+                    self.dirty.setdefault(key, entry)
+            return 0
+        with self.lock:
+            self.flushes += 1
+            self.rows_written += len(batch)
+        return len(batch)
+
+    def _ensure_flusher(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self.lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="session-write-behind", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            finally:
+                # Do not keep a connection open between batches unless CONN_MAX_AGE allows it
+                connection.close_if_unusable_or_obsolete()
+
+
+BUFFER = WriteBehindBuffer(
+    capacity=getattr(settings, "JDA_SESSION_CACHE_SIZE", 2000),
+    flush_interval=getattr(settings, "JDA_SESSION_FLUSH_INTERVAL", 0.5),
+)
+atexit.register(BUFFER.flush)
+
+
+class SessionStore(DBStore):
+    """
+    Database session store fronted by :data:`BUFFER`.
+    """
+
+    def load(self):
+        entry = BUFFER.get(self.session_key) if self.session_key else None
+        if entry is None:
+            s = self._get_session_from_db()
+            if s is None:
+                return {}
+            entry = (s.session_data, s.expire_date)
+            BUFFER.put(s.session_key, entry, dirty=False)
+        data, expire_date = entry
+        if expire_date <= timezone.now():
+            self._session_key = None
+            return {}
+        return self.decode(data)
+
+    def exists(self, session_key):
+        return BUFFER.get(session_key) is not None or super().exists(session_key)
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        if must_create and self.exists(self.session_key):
+            raise CreateError
+        data = self._get_session(no_load=must_create)
+        entry = (self.encode(data), self.get_expiry_date())
+        BUFFER.put(self.session_key, entry, dirty=True)
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        # Waits for a flush in progress, which would otherwise write the session back
+        with BUFFER.flush_lock:
+            BUFFER.discard(session_key)
+            super().delete(session_key)
@@ -0,0 +1,75 @@
+"""
+Session serializer storing the step results of a session in their binary form.
+
+With the JSON serializer every request parsed and re-serialized every output of the run,
+twice for the outputs that are also options. This one writes the session as JSON in which
+each ``StepResult`` is a reference to a record appended after it. The records keep their
+outputs compressed, so loading a session only slices them, outputs are decompressed and
+parsed when a view reads them, and saving it copies them as they were loaded.
+"""
+
+import json
+import struct
+from typing import Any, Dict, List
+
+from step_result import StepResult
+
+MAGIC = b"JDA\x01"
+REFERENCE = "__step_result__"
+_LENGTH = struct.Struct("<I")
+
+
+class StepResultSerializer:
+    """
+    Drop-in replacement for ``django.core.signing.JSONSerializer`` aware of step results.
+
+    Sessions written by the JSON serializer are still read.
+    """
+
+    def dumps(self, obj: Any) -> bytes:
+        records: List[bytes] = []
+        # The selected option is also the result of its step, it is written once
+        indexes: Dict[int, int] = {}
+
+        def default(value: Any) -> Dict[str, int]:
+            if isinstance(value, StepResult):
+                if id(value) not in indexes:
+                    indexes[id(value)] = len(records)
+                    records.append(value.to_bytes())
+                return {REFERENCE: indexes[id(value)]}
+            raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+        text = json.dumps(obj, separators=(",", ":"), default=default).encode("latin-1")
+        parts = [MAGIC, _LENGTH.pack(len(text)), text]
+        for record in records:
+            parts.append(_LENGTH.pack(len(record)))
+            parts.append(record)
+        return b"".join(parts)
+
+    def loads(self, data: bytes) -> Any:
+        if not data.startswith(MAGIC):
+            return json.loads(data.decode("latin-1"))
+        view = memoryview(data)
+        offset = len(MAGIC)
+        (length,) = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        text = view[offset : offset + length]
+        offset += length
+        records: List[memoryview] = []
+        while offset < len(data):
+            (length,) = _LENGTH.unpack_from(data, offset)
+            offset += _LENGTH.size
+            records.append(view[offset : offset + length])
+            offset += length
+
+        results: Dict[int, StepResult] = {}
+
+        def object_hook(value: Dict[str, Any]) -> Any:
+            if len(value) == 1 and REFERENCE in value:
+                idx = value[REFERENCE]
+                if idx not in results:
+                    results[idx] = StepResult.from_bytes(records[idx])
+                return results[idx]
+            return value
+
+        return json.loads(bytes(text).decode("latin-1"), object_hook=object_hook)
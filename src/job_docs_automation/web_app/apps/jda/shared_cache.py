@@ -0,0 +1,36 @@
+from datetime import timedelta
+from typing import Any, Optional
+
+from django.db import DatabaseError
+from django.utils import timezone
+from step_cache import SharedStepCache
+
+from .models import SharedStepResult
+
+
+class DatabaseSharedCache(SharedStepCache):
+    """
+    Shared step cache stored in the :class:`SharedStepResult` table, visible to every worker.
+    """
+
+    def get(self, key: str) -> Optional[Any]:
+        row = (
+            SharedStepResult.objects.filter(key=key, expires_at__gt=timezone.now())
+            .values_list("output", flat=True)
+            .first()
+        )
+        return row
+
+    def set(self, key: str, prompt_name: str, value: Any, ttl: int) -> None:
+        try:
+            SharedStepResult.objects.update_or_create(
+                key=key,
+                defaults={
+                    "prompt_name": prompt_name,
+                    "output": value,
+                    "expires_at": timezone.now() + timedelta(seconds=ttl),
+                },
+            )
+        except DatabaseError:
+            # Caching is best effort, the user already has the generated output
+            pass
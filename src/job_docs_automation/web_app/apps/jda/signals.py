@@ -0,0 +1,18 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+from retrieval import index_profile
+
+from .models import PROFILE_FIELDS, Profile
+from .usage import release_user_usage
+
+
+@receiver(post_save, sender=Profile)
+def reindex_profile(sender, instance: Profile, **kwargs) -> None:
+    # Only chunks that changed are tokenized again, the rest come from the chunk cache
+    index_profile({field: getattr(instance, field) for field in PROFILE_FIELDS})
+
+
+@receiver(pre_delete, sender=get_user_model())
+def release_usage(sender, instance, **kwargs) -> None:
+    release_user_usage(instance)
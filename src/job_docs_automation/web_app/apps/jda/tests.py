@@ -1,3 +1,510 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from typing import Any, Dict, List
+from unittest import mock
 
-# Create your tests here.
+from backend import Prompt
+from decoding import canonical_json
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from fingerprint import fingerprint
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+
+from . import duplicates, idempotency, session_backend, views
+from .idempotency import SingleFlight, idempotent
+from .models import (
+    DailyUsage,
+    GenerationRun,
+    HourlyUsage,
+    SharedStepResult,
+    UsageRecord,
+    UsageWatermark,
+)
+from .session_backend import SessionStore, WriteBehindBuffer
+from .usage import ROLLUP_DELAY, rollup_usage, tokens_used
+
+
+def schema(field: str) -> Dict[str, Any]:
+    return {
+        "type": "object",
+        "properties": {field: {"type": "string"}},
+        "required": [field],
+        "additionalProperties": False,
+    }
+
+
+PROMPTS = [
+    Prompt("find_company", "", "<job_description>", schema("company")),
+    Prompt("write_cover_letter", "", "<experience> <find_company.company>", schema("cover_letter")),
+]
+INPUTS = {"experience": "Built pipelines"}
+
+
+class FakeSteps:
+    """
+    Stands in for ``execute_step``: every call of a step returns a new output.
+    """
+
+    def __init__(self) -> None:
+        self.calls: List[str] = []
+
+    def __call__(self, step, prompts, replacements, shared_cache=None, usage=None, cancel=None):
+        name = prompts[step].name
+        self.calls.append(name)
+        field = next(iter(prompts[step].output_schema["properties"]))
+        replacements[name] = {field: f"{name} {self.calls.count(name)}"}
+        if usage is not None:
+            usage.update(prompt_tokens=100, completion_tokens=20, cached_tokens=0)
+        return canonical_json(replacements[name])
+
+
+class StepViewTestCase(TestCase):
+    """
+    Runs the step views against a two-step pipeline and fake step calls.
+    """
+
+    def setUp(self) -> None:
+        self.steps = FakeSteps()
+        patches = [
+            mock.patch.object(views, "load_pipeline", return_value=(INPUTS, PROMPTS)),
+            mock.patch.object(views, "execute_step", self.steps),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.client.get("/")
+
+    def post(self, url: str, data: Dict[str, Any] = None, **extra: Any):
+        return self.client.post(
+            url, json.dumps(data or {}), content_type="application/json", **extra
+        )
+
+
+class StepApiTests(StepViewTestCase):
+    def test_step_payload(self):
+        response = self.post("/generate-step/", {"job_description": "Acme hires"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {
+                "step": "find_company",
+                "option_idx": 0,
+                "option_count": 1,
+                "next_step": "write_cover_letter",
+                "usage": {"prompt_tokens": 100, "completion_tokens": 20, "cached_tokens": 0},
+                "output": {"company": "find_company 1"},
+            },
+        )
+        last = self.post("/generate-step/").json()
+        self.assertEqual((last["step"], last["next_step"]), ("write_cover_letter", None))
+        self.assertEqual(last["output"], {"cover_letter": "write_cover_letter 1"})
+
+    def test_select_option(self):
+        self.post("/generate-step/", {"job_description": "Acme hires"})
+        retried = self.post("/generate-step/", {"retry": True}).json()
+        self.assertEqual((retried["option_idx"], retried["option_count"]), (1, 2))
+
+        # The page already has the output, the selection only returns the metadata
+        selected = self.post("/select-option/", {"option_idx": 0})
+        self.assertEqual(selected.status_code, 200)
+        self.assertEqual(selected.json()["option_idx"], 0)
+        self.assertNotIn("output", selected.json())
+        self.assertEqual(self.post("/right-step/").json()["output"], {"company": "find_company 2"})
+
+        for option_idx in (2, -1, "first"):
+            response = self.post("/select-option/", {"option_idx": option_idx})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post("/select-option/").status_code, 400)
+
+        # The next step is built from the selected option, whatever the failed selections
+        self.post("/select-option/", {"option_idx": 0})
+        self.post("/generate-step/")
+        self.assertEqual(
+            self.client.session["results"]["find_company"].parsed, {"company": "find_company 1"}
+        )
+
+    def test_select_option_without_session(self):
+        self.client.cookies.clear()
+        response = self.post("/select-option/", {"option_idx": 0})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "Session expired."})
+
+
+class WriteBehindSessionTests(TestCase):
+    def setUp(self) -> None:
+        # No background flush during a test, the tests flush the buffer themselves
+        self.buffer = WriteBehindBuffer(capacity=2, flush_interval=3600)
+        patch = mock.patch.object(session_backend, "BUFFER", self.buffer)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def saved_session(self, **data: Any) -> SessionStore:
+        store = SessionStore()
+        store.update(data)
+        store.save()
+        return store
+
+    def test_save_is_written_on_flush(self):
+        store = self.saved_session(step=1)
+        self.assertFalse(Session.objects.filter(session_key=store.session_key).exists())
+        self.assertEqual(SessionStore(store.session_key).load(), {"step": 1})
+
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.buffer.flush(), 0)
+        row = Session.objects.get(session_key=store.session_key)
+        self.assertEqual(store.decode(row.session_data), {"step": 1})
+
+    def test_load_reads_sessions_not_cached(self):
+        store = self.saved_session(step=2)
+        self.buffer.flush()
+        self.buffer.entries.clear()
+        self.assertEqual(SessionStore(store.session_key).load(), {"step": 2})
+        self.assertIn(store.session_key, self.buffer.entries)
+        self.assertEqual(SessionStore("unknown-session-key").load(), {})
+
+    def test_dirty_sessions_are_not_evicted(self):
+        stores = [self.saved_session(step=step) for step in range(3)]
+        self.assertEqual(len(self.buffer.entries), 3)
+        self.buffer.flush()
+        self.saved_session(step=3)
+        self.assertEqual(len(self.buffer.entries), 2)
+        self.assertNotIn(stores[0].session_key, self.buffer.entries)
+        self.assertEqual(SessionStore(stores[0].session_key).load(), {"step": 0})
+
+    def test_expired_session_is_empty(self):
+        store = SessionStore()
+        store["step"] = 1
+        store.set_expiry(timezone.now() - timedelta(seconds=1))
+        store.save()
+        self.assertEqual(SessionStore(store.session_key).load(), {})
+
+    def test_delete_waits_for_running_flush(self):
+        store = self.saved_session(step=1)
+        writing, release = threading.Event(), threading.Event()
+        written = []
+
+        def slow_bulk_create(objs, **kwargs):
+            writing.set()
+            release.wait(5)
+            written.extend(obj.session_key for obj in objs)
+
+        flush = threading.Thread(target=self.buffer.flush)
+        with mock.patch.object(Session.objects, "bulk_create", slow_bulk_create):
+            flush.start()
+            self.assertTrue(writing.wait(5))
+            threading.Timer(0.1, release.set).start()
+            # Deleted after the flush wrote the session, not before
+            store.delete()
+            self.assertEqual(written, [store.session_key])
+            flush.join()
+
+        self.assertNotIn(store.session_key, self.buffer.entries)
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(SessionStore(store.session_key).load(), {})
+
+
+class SharedStepResultAdminTests(TestCase):
+    def test_purge_expired_only_purges_selected_entries(self):
+        now = timezone.now()
+        for key, expires_at in (("old-1", -60), ("old-2", -60), ("fresh", 60)):
+            SharedStepResult.objects.create(
+                key=key,
+                prompt_name="find_company",
+                output={},
+                expires_at=now + timedelta(seconds=expires_at),
+            )
+        admin_user = get_user_model().objects.create_superuser("admin", "admin@example.com", "pw")
+        self.client.force_login(admin_user)
+        response = self.client.post(
+            "/admin/jda/sharedstepresult/",
+            {"action": "purge_expired", "_selected_action": ["old-1", "fresh"]},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            sorted(SharedStepResult.objects.values_list("key", flat=True)), ["fresh", "old-2"]
+        )
+
+
+class MemorySession(dict):
+    """
+    The part of a session the ``idempotent`` decorator uses, without a database.
+    """
+
+    def __init__(self, session_key: str):
+        super().__init__()
+        self.session_key = session_key
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self) -> None:
+        self.flights = SingleFlight(ttl=30)
+        patch = mock.patch.object(idempotency, "flights", self.flights)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.calls = 0
+
+    def view(self, respond):
+        @api_view(["POST"])
+        @idempotent
+        def view(request):
+            self.calls += 1
+            return respond()
+
+        return view
+
+    def request(self, view, session, key="next"):
+        request = APIRequestFactory().post("/", {}, format="json", HTTP_IDEMPOTENCY_KEY=key)
+        request.session = session
+        return view(request)
+
+    def test_concurrent_duplicates_share_one_call(self):
+        release = threading.Event()
+
+        def respond():
+            release.wait(5)
+            return Response({"step": self.calls}, status=200)
+
+        view = self.view(respond)
+        session = MemorySession("session-1")
+        responses = []
+        threads = [
+            threading.Thread(target=lambda: responses.append(self.request(view, session)))
+            for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while self.flights.shared < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual([response.data for response in responses], [{"step": 1}] * 3)
+        replayed = [response.get("Idempotent-Replayed") for response in responses]
+        self.assertEqual(sorted(replayed, key=str), [None, "true", "true"])
+
+    def test_duplicates_stop_waiting(self):
+        self.flights.wait = 0.05
+        release = threading.Event()
+
+        def respond():
+            release.wait(5)
+            return Response({"step": self.calls})
+
+        view = self.view(respond)
+        session = MemorySession("session-1")
+        leader = threading.Thread(target=self.request, args=(view, session))
+        leader.start()
+        deadline = time.monotonic() + 5
+        while self.calls == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        duplicate = self.request(view, session)
+        release.set()
+        leader.join()
+        self.assertEqual(duplicate.status_code, 409)
+        self.assertEqual(duplicate.data, {"error": "Request in progress."})
+        self.assertEqual(self.calls, 1)
+
+    def test_failed_calls_can_be_retried(self):
+        outcomes = [
+            RuntimeError("connection reset"),
+            Response({"error": "Completion failed."}, status=502),
+            Response({"step": 1}, status=200),
+        ]
+
+        def respond():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        view = self.view(respond)
+        session = MemorySession("session-1")
+        with self.assertRaises(RuntimeError):
+            self.request(view, session)
+        self.assertEqual(self.request(view, session).status_code, 502)
+        self.assertEqual(self.request(view, session).data, {"step": 1})
+        self.assertEqual(self.request(view, session).data, {"step": 1})
+        self.assertEqual(self.calls, 3)
+
+    def test_keys_are_isolated_per_session(self):
+        view = self.view(lambda: Response({"step": self.calls}))
+        first = self.request(view, MemorySession("session-1"))
+        second = self.request(view, MemorySession("session-2"))
+        self.assertEqual((first.data, second.data), ({"step": 1}, {"step": 2}))
+        self.assertEqual(
+            self.request(view, MemorySession("session-1"), key="other").data, {"step": 3}
+        )
+
+
+class IdempotentStepTests(StepViewTestCase):
+    def test_replay_after_completion_comes_from_the_session(self):
+        # Nothing is kept in memory, the response can only come from the session
+        with mock.patch.object(idempotency, "flights", SingleFlight(ttl=0)):
+            first = self.post(
+                "/generate-step/", {"job_description": "Acme"}, HTTP_IDEMPOTENCY_KEY="a"
+            )
+            again = self.post(
+                "/generate-step/", {"job_description": "Acme"}, HTTP_IDEMPOTENCY_KEY="a"
+            )
+        self.assertEqual(self.steps.calls, ["find_company"])
+        self.assertEqual(again.json(), first.json())
+        self.assertEqual(again["Idempotent-Replayed"], "true")
+        self.assertEqual(self.client.session["current_step"], 1)
+
+        # A new key is a new action
+        self.post("/generate-step/", HTTP_IDEMPOTENCY_KEY="b")
+        self.assertEqual(self.steps.calls, ["find_company", "write_cover_letter"])
+
+
+NOW = datetime(2026, 3, 2, 10, 30, tzinfo=dt_timezone.utc)
+
+
+class UsageTests(TestCase):
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user("ana")
+
+    def record(self, seconds_ago: float, prompt_tokens: int = 100, model: str = "gpt"):
+        record = UsageRecord.objects.create(
+            user=self.user,
+            prompt_name="find_company",
+            model=model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=10,
+            cached_tokens=0,
+            latency=1.0,
+        )
+        created_at = NOW - timedelta(seconds=seconds_ago)
+        UsageRecord.objects.filter(id=record.id).update(created_at=created_at)
+        return record
+
+    def rollup_rows(self, model):
+        return list(
+            model.objects.order_by("period", "model").values_list(
+                "model", "period", "calls", "prompt_tokens", "completion_tokens"
+            )
+        )
+
+    def test_records_are_rolled_up_once(self):
+        self.record(3600 + 60)
+        self.record(1200)
+        self.record(600, model="mini")
+        self.assertEqual(rollup_usage(batch_size=2, now=NOW), 2)
+        self.assertEqual(rollup_usage(batch_size=2, now=NOW), 1)
+        self.assertEqual(rollup_usage(now=NOW), 0)
+
+        hour = NOW.replace(minute=0)
+        self.assertEqual(
+            self.rollup_rows(HourlyUsage),
+            [
+                ("gpt", hour - timedelta(hours=1), 1, 100, 10),
+                ("gpt", hour, 1, 100, 10),
+                ("mini", hour, 1, 100, 10),
+            ],
+        )
+        day = NOW.replace(hour=0, minute=0)
+        self.assertEqual(
+            self.rollup_rows(DailyUsage), [("gpt", day, 2, 200, 20), ("mini", day, 1, 100, 10)]
+        )
+
+        # A later record adds to the existing rows
+        self.record(60)
+        self.assertEqual(rollup_usage(now=NOW), 1)
+        self.assertEqual(DailyUsage.objects.get(model="gpt").calls, 3)
+
+    def test_recent_records_are_deferred(self):
+        recent = self.record(ROLLUP_DELAY.total_seconds() / 2)
+        self.assertEqual(rollup_usage(now=NOW), 0)
+        self.assertEqual(UsageWatermark.objects.get().last_record_id, 0)
+        self.assertEqual(rollup_usage(now=NOW + ROLLUP_DELAY), 1)
+        self.assertEqual(UsageWatermark.objects.get().last_record_id, recent.id)
+
+    def test_tokens_used_counts_each_record_once(self):
+        self.record(7200, prompt_tokens=1000)
+        self.record(600)
+        rolled_up = self.record(300)
+        self.assertEqual(tokens_used(self.user, "day", NOW), 1010 + 110 + 110)
+        self.assertEqual(tokens_used(self.user, "hour", NOW), 220)
+
+        rollup_usage(now=NOW)
+        self.assertEqual(UsageWatermark.objects.get().last_record_id, rolled_up.id)
+        self.record(60)
+        self.assertEqual(tokens_used(self.user, "day", NOW), 1010 + 110 + 110 + 110)
+        self.assertEqual(tokens_used(self.user, "hour", NOW), 330)
+        other = get_user_model().objects.create_user("ben")
+        self.assertEqual(tokens_used(other, "day", NOW), 0)
+
+    def test_deleted_users_fold_into_the_anonymous_rows(self):
+        other = get_user_model().objects.create_user("ben")
+        self.record(600)
+        UsageRecord.objects.filter(id=self.record(600).id).update(user=other)
+        rollup_usage(now=NOW)
+        self.assertEqual(DailyUsage.objects.count(), 2)
+
+        self.user.delete()
+        other.delete()
+        day = NOW.replace(hour=0, minute=0)
+        self.assertEqual(self.rollup_rows(DailyUsage), [("gpt", day, 2, 200, 20)])
+        self.assertEqual(
+            self.rollup_rows(HourlyUsage), [("gpt", NOW.replace(minute=0), 2, 200, 20)]
+        )
+        self.assertFalse(DailyUsage.objects.filter(user__isnull=False).exists())
+
+    def test_one_rollup_row_per_key(self):
+        period = NOW.replace(minute=0)
+        for user in (self.user, None):
+            DailyUsage.objects.create(user=user, model="gpt", period=period)
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                DailyUsage.objects.create(user=user, model="gpt", period=period)
+
+
+@override_settings(JDA_HOURLY_TOKEN_QUOTA=0, JDA_DAILY_TOKEN_QUOTA=200)
+class QuotaTests(StepViewTestCase):
+    def test_step_is_refused_once_the_quota_is_used(self):
+        self.client.force_login(get_user_model().objects.create_user("ana"))
+        self.client.get("/")
+        description = {"job_description": "Acme hires", "ignore_duplicates": True}
+        self.assertEqual(self.post("/generate-step/", description).status_code, 200)
+        self.assertEqual(self.post("/generate-step/", {"retry": True}).status_code, 200)
+
+        # Two calls of 120 tokens used the 200 of the day
+        response = self.post("/generate-step/")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json(), {"error": "Daily token quota exceeded."})
+        self.assertEqual(len(self.steps.calls), 2)
+        self.assertEqual(UsageRecord.objects.count(), 2)
+
+
+class DuplicateRunTests(StepViewTestCase):
+    def test_abandoned_runs_do_not_hide_completed_ones(self):
+        patch = mock.patch.dict(duplicates._indexes, clear=True)
+        patch.start()
+        self.addCleanup(patch.stop)
+        user = get_user_model().objects.create_user("ana")
+        self.client.force_login(user)
+        self.client.get("/")
+        posting = "Acme hires a data engineer to build pipelines in Python and SQL"
+        completed = GenerationRun.objects.create(
+            user=user,
+            job_description=posting,
+            fingerprint=fingerprint(posting),
+            outputs={"find_company": {"company": "Acme"}},
+        )
+        # A later attempt on the same posting failed before its first step was saved
+        GenerationRun.objects.create(
+            user=user, job_description=posting, fingerprint=fingerprint(posting)
+        )
+
+        offer = self.post("/generate-step/", {"job_description": posting}).json()["reuse_offer"]
+        self.assertEqual((offer["run_id"], offer["steps"]), (completed.id, ["find_company"]))
+        self.assertEqual(self.steps.calls, [])
@@ -0,0 +1,228 @@
+"""
+Usage ledger of the LLM calls, its hourly and daily rollups and the token quotas.
+
+Every call made by a step is appended to :class:`UsageRecord`. ``rollup_usage``, run
+periodically by the ``rollup_usage`` management command, sums the records after the
+watermark into :class:`HourlyUsage` and :class:`DailyUsage` and moves the watermark past
+them. Quota checks read the rollup rows of the current period plus the records of the user
+after the watermark, so their cost depends on the rollup interval, not on the size of the
+ledger.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from typing import Any, Optional
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+from step_result import StepResult
+
+from .models import DailyUsage, HourlyUsage, UsageRecord, UsageWatermark
+
+_logger = logging.getLogger(__name__)
+
+WATERMARK = "usage"
+# Records younger than this may be committed after records with higher ids, the next
+# rollup takes them
+ROLLUP_DELAY = timedelta(seconds=5)
+ROLLUPS = {"hour": (HourlyUsage, TruncHour), "day": (DailyUsage, TruncDay)}
+
+
+def record_call(user: Any, run_id: Optional[int], result: StepResult) -> None:
+    """
+    Appends the call that produced a step result to the ledger.
+
+    Outputs served without a call, e.g. from the shared cache, cost nothing and are skipped.
+
+    Parameters
+    ----------
+    user : Any
+        The user of the request, anonymous calls are recorded without a user.
+    run_id : Optional[int]
+        The generation run of the step, if any.
+    result : StepResult
+        The result of the step.
+    """
+    if not result.usage:
+        return
+    try:
+        UsageRecord.objects.create(
+            user=user if user is not None and user.is_authenticated else None,
+            run_id=run_id,
+            prompt_name=result.prompt,
+            model=result.model,
+            prompt_tokens=result.usage.get("prompt_tokens", 0),
+            completion_tokens=result.usage.get("completion_tokens", 0),
+            cached_tokens=result.usage.get("cached_tokens", 0),
+            latency=result.latency,
+        )
+    except DatabaseError:
+        # The user already has the output, a lost record only undercounts the usage
+        _logger.exception("Failed to record the usage of prompt %s", result.prompt)
+
+
+def rollup_usage(batch_size: int = 10000, now: Optional[datetime] = None) -> int:
+    """
+    Adds the oldest ledger records after the watermark to the hourly and daily rollups.
+
+    Parameters
+    ----------
+    batch_size : int, optional
+        The maximum number of records rolled up, by default 10000.
+    now : Optional[datetime], optional
+        The current time, by default ``timezone.now()``.
+
+    Returns
+    -------
+    int
+        The number of records rolled up, ``batch_size`` if more are waiting.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        watermark, _ = UsageWatermark.objects.select_for_update().get_or_create(name=WATERMARK)
+        ids = list(
+            UsageRecord.objects.filter(
+                id__gt=watermark.last_record_id, created_at__lt=now - ROLLUP_DELAY
+            )
+            .order_by("id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+        records = UsageRecord.objects.filter(id__gt=watermark.last_record_id, id__lte=ids[-1])
+        for model, trunc in ROLLUPS.values():
+            rows = (
+                records.values(
+                    "user_id", "model", start=trunc("created_at", tzinfo=dt_timezone.utc)
+                )
+                .annotate(
+                    total_calls=Count("id"),
+                    total_prompt=Sum("prompt_tokens"),
+                    total_completion=Sum("completion_tokens"),
+                    total_cached=Sum("cached_tokens"),
+                    total_latency=Sum("latency"),
+                )
+                .order_by()
+            )
+            for row in rows:
+                key = {"user_id": row["user_id"], "model": row["model"], "period": row["start"]}
+                updated = model.objects.filter(**key).update(
+                    calls=F("calls") + row["total_calls"],
+                    prompt_tokens=F("prompt_tokens") + row["total_prompt"],
+                    completion_tokens=F("completion_tokens") + row["total_completion"],
+                    cached_tokens=F("cached_tokens") + row["total_cached"],
+                    latency=F("latency") + row["total_latency"],
+                )
+                if not updated:
+                    model.objects.create(
+                        **key,
+                        calls=row["total_calls"],
+                        prompt_tokens=row["total_prompt"],
+                        completion_tokens=row["total_completion"],
+                        cached_tokens=row["total_cached"],
+                        latency=row["total_latency"],
+                    )
+        watermark.last_record_id = ids[-1]
+        watermark.save(update_fields=["last_record_id"])
+    return len(ids)
+
+
+def release_user_usage(user: Any) -> None:
+    """
+    Moves the rollups of a user about to be deleted to the anonymous rows.
+
+    The rollup rows of the user would otherwise be set to no user by the deletion and clash
+    with the anonymous row of the same model and period. Their totals are added to that row
+    instead, like the ledger records of the user, which are kept without a user.
+
+    Parameters
+    ----------
+    user : Any
+        The user being deleted.
+    """
+    with transaction.atomic():
+        # Taken by rollup_usage too, so no rollup adds rows for the user meanwhile
+        UsageWatermark.objects.select_for_update().get_or_create(name=WATERMARK)
+        for model, _ in ROLLUPS.values():
+            for row in model.objects.filter(user=user):
+                updated = model.objects.filter(
+                    user__isnull=True, model=row.model, period=row.period
+                ).update(
+                    calls=F("calls") + row.calls,
+                    prompt_tokens=F("prompt_tokens") + row.prompt_tokens,
+                    completion_tokens=F("completion_tokens") + row.completion_tokens,
+                    cached_tokens=F("cached_tokens") + row.cached_tokens,
+                    latency=F("latency") + row.latency,
+                )
+                if updated:
+                    row.delete()
+                else:
+                    row.user = None
+                    row.save(update_fields=["user"])
+
+
+def period_start(period: str, now: datetime) -> datetime:
+    """
+    Returns the start of the hour or day containing ``now``, in UTC like the rollups.
+    """
+    start = now.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return start.replace(hour=0) if period == "day" else start
+
+
+def tokens_used(user: Any, period: str = "day", now: Optional[datetime] = None) -> int:
+    """
+    Returns the prompt and completion tokens of a user in the current hour or day.
+
+    Parameters
+    ----------
+    user : Any
+        The user.
+    period : str, optional
+        ``hour`` or ``day``, by default ``day``.
+    now : Optional[datetime], optional
+        The current time, by default ``timezone.now()``.
+
+    Returns
+    -------
+    int
+        The tokens of the rollup of the period plus those of the records not rolled up yet.
+    """
+    start = period_start(period, now or timezone.now())
+    model = ROLLUPS[period][0]
+    tokens = Sum(F("prompt_tokens") + F("completion_tokens"))
+    rolled_up = model.objects.filter(user=user, period=start).aggregate(total=tokens)["total"]
+    last_record_id = (
+        UsageWatermark.objects.filter(name=WATERMARK)
+        .values_list("last_record_id", flat=True)
+        .first()
+    )
+    pending = UsageRecord.objects.filter(
+        user=user, id__gt=last_record_id or 0, created_at__gte=start
+    ).aggregate(total=tokens)["total"]
+    return (rolled_up or 0) + (pending or 0)
+
+
+def quota_exceeded(user: Any) -> Optional[str]:
+    """
+    Checks the token quotas of a user, see ``JDA_HOURLY_TOKEN_QUOTA`` and
+    ``JDA_DAILY_TOKEN_QUOTA``. Anonymous users are not limited.
+
+    Returns
+    -------
+    Optional[str]
+        The error message if a quota is used up, None otherwise.
+    """
+    if user is None or not user.is_authenticated:
+        return None
+    quotas = (
+        ("hour", "Hourly", settings.JDA_HOURLY_TOKEN_QUOTA),
+        ("day", "Daily", settings.JDA_DAILY_TOKEN_QUOTA),
+    )
+    for period, label, quota in quotas:
+        if quota > 0 and tokens_used(user, period) >= quota:
+            return f"{label} token quota exceeded."
+    return None
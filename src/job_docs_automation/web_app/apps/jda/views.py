@@ -1,38 +1,110 @@
 import copy
-import json
-from typing import Dict, List, Optional, Tuple
-
-from backend import Prompt, execute_step, read_files, save_to_docx
+import functools
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from backend import Prompt, execute_step, save_to_docx
+from cancellation import Cancelled
+from cancellation import registry as in_flight_steps
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.http import HttpRequest
+from django.http import HttpRequest, HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.template.loader import render_to_string
+from fingerprint import fingerprint
+from manifest import load_configured_pipeline
+from metrics import REGISTRY, track
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from scheduler import INTERACTIVE, work
+from step_result import StepResult, step_input_hash
+from tracing import end_trace, new_trace, span, use_trace
+
+from .duplicates import find_duplicate_runs, register_run
+from .idempotency import idempotent
+from .models import PROFILE_FIELDS, CoverLetter, GenerationRun, Profile
+from .shared_cache import DatabaseSharedCache
+from .usage import quota_exceeded, record_call
+
+shared_cache = DatabaseSharedCache()
+
+
+@functools.lru_cache(maxsize=None)
+def load_pipeline() -> Tuple[Dict[str, str], List[Prompt]]:
+    """
+    Loads the inputs and prompts on first use, so that importing the views, e.g. for
+    ``manage.py`` commands, reads no pipeline files.
+    """
+    return load_configured_pipeline(settings.JDA_PIPELINE)
 
-from .models import CoverLetter, Profile
 
-inputs: Dict[str, str] = {}
-prompts: List[Prompt] = []
-inputs, prompts= read_files(input_filenames="inputs.txt", prompt_filenames="prompts_2.txt")
+def get_inputs() -> Dict[str, str]:
+    return load_pipeline()[0]
+
+
+def get_prompts() -> List[Prompt]:
+    return load_pipeline()[1]
+
+
+def profile_inputs(request) -> Dict[str, str]:
+    """
+    Returns the non-empty fields of the user's profile, which override the default inputs.
+    """
+    if not request.user.is_authenticated:
+        return {}
+    profile = Profile.objects.filter(user=request.user).first()
+    if profile is None:
+        return {}
+    return {field: getattr(profile, field) for field in PROFILE_FIELDS if getattr(profile, field)}
 
 
 def create_session(request) -> None:
     request.session["current_step"] = 0
-    request.session["replacements"] = copy.copy(inputs)
+    request.session["replacements"] = {**copy.copy(get_inputs()), **profile_inputs(request)}
+    # The selected StepResult of each completed step, by prompt name
+    request.session["results"] = {}
     request.session["last_step_options"] = []
     request.session["current_option_idx"] = 0
+    request.session["run_id"] = None
+    # One generation run is one trace, each step request is a span in it
+    request.session["trace"] = new_trace()
+
+
+def traced_view(view: Callable[..., Response]) -> Callable[..., Response]:
+    """
+    Runs the view inside a span of the generation run stored in the session.
+    """
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs) -> Response:
+        with use_trace(request.session.get("trace")), span(
+            f"view {view.__name__}", **{"http.route": request.path}
+        ):
+            return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def step_replacements(request) -> Dict[str, Any]:
+    """
+    Returns the inputs of the session and the outputs of its completed steps.
+    """
+    results = request.session["results"]
+    return {
+        **request.session["replacements"],
+        **{name: result.parsed for name, result in results.items()},
+    }
 
 
 def check_session_expired(request) -> Optional[Response]:
     if (
         "current_step" not in request.session
         or "replacements" not in request.session
+        or "results" not in request.session
         or "last_step_options" not in request.session
         or "current_option_idx" not in request.session
     ):
         # Return a error response according to rest framework
-        return Response(data={"content": "Error: Session expired."}, status=400)
+        return Response(data={"error": "Session expired."}, status=400)
 
 
 # @login_required
@@ -82,18 +154,22 @@ def login_page(request):
 
 # @login_required
 @api_view(["POST"])
+@traced_view
+@idempotent
 def generate_step_cover_letter(request) -> Response:
     return handle_cover_letter_step(request)
 
 
 # @login_required
 @api_view(["POST"])
+@traced_view
 def left_step(request) -> Response:
     return change_step_option(request, left=True)
 
 
 # @login_required
 @api_view(["POST"])
+@traced_view
 def right_step(request) -> Response:
     return change_step_option(request, left=False)
 
@@ -102,112 +178,350 @@ def handle_cover_letter_step(request) -> Response:
     session_expired = check_session_expired(request)
     if session_expired:
         return session_expired
+    exceeded = quota_exceeded(request.user)
+    if exceeded:
+        return Response({"error": exceeded}, status=429)
+    prompts = get_prompts()
     if "retry" in request.data:
         if "job_description" in request.data or request.session["current_step"] <= 0:
-            return Response({"content": "Error: How did you get here?"})
+            return Response({"error": "How did you get here?"}, status=400)
         request.session["current_step"] -= 1
     if "job_description" in request.data:
         if request.session["current_step"] > 0:
-            return Response({"content": "Error: How did you get here?"})
+            return Response({"error": "How did you get here?"}, status=400)
 
         request.session["replacements"]["job_description"] = request.data["job_description"]
-
-    replacements = request.session["replacements"]
+        request.session.modified = True
+        if request.user.is_authenticated:
+            signature = fingerprint(request.data["job_description"])
+            if not request.data.get("ignore_duplicates"):
+                offer = duplicate_run_offer(request, signature)
+                if offer is not None:
+                    # Let the user choose before paying for any step
+                    return Response({"reuse_offer": offer})
+            start_run(request, signature)
+
+    replacements = step_replacements(request)
     current_step = request.session["current_step"]
 
-    generated_text = execute_step(step=current_step, prompts=prompts, replacements=replacements)
+    usage: Dict[str, int] = {}
+    # Starting a step cancels the one of the session still in flight, e.g. before a retry
+    owner = step_owner(request)
+    token = in_flight_steps.start(
+        owner,
+        prompts[current_step].name if current_step < len(prompts) else "",
+        settings.JDA_STEP_LEASE,
+    )
+    start = time.perf_counter()
+    try:
+        # The user waits for the step, its calls go before prefetch and batch work
+        with work(owner, INTERACTIVE):
+            generated_text = execute_step(
+                step=current_step,
+                prompts=prompts,
+                replacements=replacements,
+                # A retry asks for a different output, so it must not be served from the cache
+                shared_cache=None if "retry" in request.data else shared_cache,
+                usage=usage,
+                cancel=token,
+            )
+    except Cancelled as error:
+        # Nobody waits for this step anymore, keep the session as the newer request left it
+        request.session.modified = False
+        return Response({"error": "Step cancelled.", "cancelled": error.reason}, status=409)
+    finally:
+        in_flight_steps.finish(owner, token)
+
+    latency = time.perf_counter() - start
 
+    if generated_text is None:
+        # Return an error message if the completion fails
+        return Response({"error": "Completion failed."}, status=502)
+
+    prompt = prompts[current_step]
+    result = StepResult(
+        prompt.name,
+        generated_text.encode("utf-8"),
+        usage,
+        latency,
+        prompt.model,
+        step_input_hash(prompt, replacements),
+        parsed=replacements[prompt.name],
+    )
+    record_call(request.user, request.session.get("run_id"), result)
     if not "retry" in request.data:
         request.session["last_step_options"] = []
     request.session["current_option_idx"] = len(request.session["last_step_options"])
-    request.session["last_step_options"].append(generated_text)
-
-    if generated_text is None:
-        # Return an error message if the completion fails
-        return Response({"content": "Error: Completion failed."})
+    request.session["last_step_options"].append(result)
+    request.session["results"][prompt.name] = result
 
     # Check if all steps are completed
     if current_step >= len(prompts):
-        return Response({"content": "All steps are completed!"})
+        return Response({"error": "All steps are completed!"}, status=400)
 
     request.session["current_step"] += 1
+    save_run_outputs(request)
+
+    return Response(step_payload(request, include_output=True))
+
+
+def step_owner(request) -> str:
+    """
+    Returns the key of the session, the owner of its steps in flight.
+    """
+    if request.session.session_key is None:
+        request.session.save()
+    return request.session.session_key
+
+
+@api_view(["POST"])
+def abort_step(request) -> Response:
+    """
+    Cancels the step of the session in flight, called by the page when the user leaves it.
+
+    Only steps in flight in the process serving the request are found, see
+    ``JDA_STEP_LEASE``.
+    """
+    session_key = request.session.session_key
+    cancelled = session_key is not None and in_flight_steps.cancel(session_key)
+    return Response({"cancelled": cancelled})
+
+
+@api_view(["POST"])
+def heartbeat_step(request) -> Response:
+    """
+    Renews the lease of the step of the session in flight.
+
+    The page sends one every few seconds while it waits for a step. Steps without
+    heartbeats for ``JDA_STEP_LEASE`` seconds are cancelled, the page is gone. Only steps
+    in flight in the process serving the request are found, so the lease is off by default.
+    """
+    session_key = request.session.session_key
+    in_flight = session_key is not None and in_flight_steps.heartbeat(session_key)
+    return Response({"in_flight": in_flight})
 
-    response = render_step_html(
-        request=request,
-        content=generated_text,
+
+def start_run(request, signature: bytes) -> GenerationRun:
+    run = GenerationRun.objects.create(
+        user=request.user,
+        job_description=request.session["replacements"]["job_description"],
+        fingerprint=signature,
     )
+    register_run(run)
+    request.session["run_id"] = run.id
+    return run
 
-    return Response({"content": response})
+
+def save_run_outputs(request) -> None:
+    """
+    Stores the outputs of the completed steps in the current run, if any.
+    """
+    prompts = get_prompts()
+    if not request.session.get("run_id"):
+        return
+    results = request.session["results"]
+    outputs = {
+        prompt.name: results[prompt.name].parsed
+        for prompt in prompts[: request.session["current_step"]]
+        if prompt.name in results
+    }
+    GenerationRun.objects.filter(id=request.session["run_id"]).update(outputs=outputs)
+
+
+def reusable_steps(outputs: Dict[str, Any]) -> List[str]:
+    """
+    Lists the leading steps of a previous run whose outputs can be reused.
+
+    The last step, which writes the document itself, is always generated again.
+    """
+    prompts = get_prompts()
+    names = []
+    for prompt in prompts[:-1]:
+        if prompt.name not in outputs:
+            break
+        names.append(prompt.name)
+    return names
+
+
+def duplicate_run_offer(request, signature: bytes) -> Optional[Dict[str, Any]]:
+    matches = find_duplicate_runs(request.user.id, signature)
+    if not matches:
+        return None
+    run_ids = [run_id for run_id, _ in matches]
+    runs = GenerationRun.objects.filter(user=request.user).in_bulk(run_ids)
+    # Runs abandoned before their first step are indexed too, offer the best with outputs
+    for run_id, score in matches:
+        run = runs.get(run_id)
+        steps = reusable_steps(run.outputs) if run is not None else []
+        if steps:
+            return {
+                "run_id": run.id,
+                "similarity": round(score, 3),
+                "created_at": run.created_at.isoformat(),
+                "steps": steps,
+            }
+    return None
+
+
+# @login_required
+@api_view(["POST"])
+@traced_view
+@idempotent
+def reuse_run(request) -> Response:
+    session_expired = check_session_expired(request)
+    if session_expired:
+        return session_expired
+    if (
+        not request.user.is_authenticated
+        or request.session["current_step"] > 0
+        or "job_description" not in request.session["replacements"]
+    ):
+        return Response({"error": "How did you get here?"}, status=400)
+    previous = GenerationRun.objects.filter(
+        id=request.data.get("run_id"), user=request.user
+    ).first()
+    if previous is None:
+        return Response({"error": "Run not found."}, status=404)
+    steps = reusable_steps(previous.outputs)
+    if not steps:
+        return Response({"error": "Nothing to reuse."}, status=400)
+
+    start_run(request, fingerprint(request.session["replacements"]["job_description"]))
+    models = {prompt.name: prompt.model for prompt in get_prompts()}
+    results = {
+        name: StepResult.from_output(name, previous.outputs[name], model=models[name])
+        for name in steps
+    }
+    request.session["results"] = results
+    request.session["current_step"] = len(steps)
+    request.session["last_step_options"] = [results[steps[-1]]]
+    request.session["current_option_idx"] = 0
+    save_run_outputs(request)
+
+    payload = step_payload(request, include_output=True)
+    payload["reused"] = [{"step": name, "output": previous.outputs[name]} for name in steps[:-1]]
+    return Response(payload)
 
 
 def change_step_option(request, left: bool = False) -> Response:
     session_expired = check_session_expired(request)
     if session_expired:
         return session_expired
-    if left:
-        if request.session["current_option_idx"] > 0:
-            request.session["current_option_idx"] -= 1
-        else:
-            return Response({"content": "Error: How did you get here?"})
-    else:
-        if request.session["current_option_idx"] < len(request.session["last_step_options"]) - 1:
-            request.session["current_option_idx"] += 1
-        else:
-            return Response({"content": "Error: How did you get here?"})
-    prev_step = request.session["current_step"] - 1
-    prev_step_name = prompts[prev_step].name
-    content = request.session["last_step_options"][request.session["current_option_idx"]]
-    request.session["replacements"][prev_step_name] = json.loads(content)
-
-    response = render_step_html(
-        request=request,
-        content=content,
-    )
+    option_idx = request.session["current_option_idx"] + (-1 if left else 1)
+    if not select_option(request, option_idx):
+        return Response({"error": "How did you get here?"}, status=400)
 
-    return Response({"content": response})
+    return Response(step_payload(request, include_output=True))
 
 
-def render_step_html(request: HttpRequest, content: str):
+def select_option(request, option_idx: int) -> bool:
     """
-    Renders the step HTML using the provided data.
+    Makes one of the stored options of the last step the current one.
 
     Parameters
     ----------
     request : HttpRequest
         The request object.
-    content : str
-        The content for the current step.
+    option_idx : int
+        The index of the option in ``last_step_options``.
 
     Returns
     -------
-    str
-        The rendered HTML as a string.
-    """
-
-    context = {
-        "prev_step": prompts[request.session["current_step"] - 1].name,
-        "content": content,
-        "left_button": request.session["current_option_idx"] > 0,
-        "right_button": request.session["current_option_idx"]
-        < len(request.session["last_step_options"]) - 1,
-        "next_step": (
-            prompts[request.session["current_step"]].name
-            if request.session["current_step"] < len(prompts)
-            else None
-        ),
-    }
-    return render_to_string("jda/dynamic_section_template.html", context)
+    bool
+        False if the index is out of range or there is no step to choose from.
+    """
+    prompts = get_prompts()
+    options = request.session["last_step_options"]
+    if request.session["current_step"] <= 0 or not 0 <= option_idx < len(options):
+        return False
+    request.session["current_option_idx"] = option_idx
+    prev_step_name = prompts[request.session["current_step"] - 1].name
+    request.session["results"][prev_step_name] = options[option_idx]
+    request.session.modified = True
+    return True
+
+
+def step_payload(request: HttpRequest, include_output: bool = False) -> Dict[str, Any]:
+    """
+    Builds the JSON payload describing the current step.
+
+    Parameters
+    ----------
+    request : HttpRequest
+        The request object.
+    include_output : bool, optional
+        Whether to include the structured output of the selected option, by default False.
+        The client caches the options it has already seen, so option switches omit it.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The step name, option index and count, the next step name, the token usage of the
+        call that produced the selected option and optionally the output.
+    """
+    prompts = get_prompts()
+    with track("step_payload"):
+        payload: Dict[str, Any] = {
+            "step": prompts[request.session["current_step"] - 1].name,
+            "option_idx": request.session["current_option_idx"],
+            "option_count": len(request.session["last_step_options"]),
+            "next_step": (
+                prompts[request.session["current_step"]].name
+                if request.session["current_step"] < len(prompts)
+                else None
+            ),
+        }
+        option = request.session["last_step_options"][request.session["current_option_idx"]]
+        payload["usage"] = option.usage
+        if include_output:
+            payload["output"] = option.parsed
+        return payload
+
+
+# @login_required
+@api_view(["POST"])
+@traced_view
+def select_step_option(request) -> Response:
+    session_expired = check_session_expired(request)
+    if session_expired:
+        return session_expired
+    try:
+        option_idx = int(request.data["option_idx"])
+    except (KeyError, TypeError, ValueError):
+        return Response({"error": "Missing or invalid option_idx."}, status=400)
+    if not select_option(request, option_idx):
+        return Response({"error": "How did you get here?"}, status=400)
+
+    return Response(step_payload(request))
 
 
 # @login_required
 @api_view(["POST"])
+@traced_view
 def save_step(request):
     session_expired = check_session_expired(request)
     if session_expired:
         return session_expired
+    prompts = get_prompts()
     last_prompt_name = prompts[request.session["current_step"] - 1].name
     save_to_docx(
-        content=request.session["replacements"][last_prompt_name]["cover_letter"],
+        content=request.session["results"][last_prompt_name].parsed["cover_letter"],
         output_file="cover_letter.docx",
     )
-    return Response({}, status=200)
+    end_trace(request.session.get("trace"), "generation_run", **{"jda.steps": len(prompts)})
+    return Response({"success": True}, status=200)
+
+
+def metrics_view(request) -> HttpResponse:
+    """
+    Exposes the pipeline metrics in the Prometheus text format.
+
+    The metrics are only rendered here, so scraping is the only cost on top of the
+    counters updated on the hot paths.
+
+    The registry lives in the process, so under a pre-forking server each scrape reports
+    only the worker that answers it. Scrape every worker, e.g. one port per worker, and
+    sum the series in Prometheus. The endpoint is not authenticated: keep ``/metrics``
+    off the public proxy or restrict it to the scraper there.
+    """
+    return HttpResponse(REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
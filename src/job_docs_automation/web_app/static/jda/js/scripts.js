@@ -1,26 +1,148 @@
 
 document.addEventListener('DOMContentLoaded', () => {
 
+    // Options of the last step that the browser has already received. Switching
+    // between them is done locally, only the selected index is sent back.
+    let stepOptions = [];
+    let currentStep = null;
+    let jobDescription = null;
+    // The step request in flight. While it waits the page sends heartbeats, without them
+    // the server cancels the step (see JDA_STEP_LEASE)
+    let pendingRequest = null;
+    const HEARTBEAT_MS = 5000;
+
     function createDynamicSection(data) {
         hideLoadingAnimation();
-        if (data.content) {
+        if (data.reuse_offer) {
+            offerReuse(data.reuse_offer);
+        } else if (data.output !== undefined) {
+            (data.reused || []).forEach(step => appendStaticStep(step));
             // Remove previous buttons and text
             document.querySelectorAll('.action-buttons-next, .action-buttons-line, .next-step-name').forEach(el => el.remove());
 
+            if (data.step !== currentStep || data.option_count === 1) {
+                stepOptions = [];
+                currentStep = data.step;
+            }
+            stepOptions[data.option_idx] = data.output;
+
             // Create a new section dynamically
             const dynamicSteps = document.getElementById('dynamic-steps');
             const newSection = document.createElement('section');
             newSection.classList.add('step-block');
-
-            newSection.innerHTML = data.content;
+            renderStep(newSection, data);
 
             dynamicSteps.appendChild(newSection);
         } else {
             showErrorMessage();
-            alert('Failed to generate content.');
+            alert(data.error || 'Failed to generate content.');
         }
     };
 
+    function offerReuse(offer) {
+        const similarity = Math.round(offer.similarity * 100);
+        const question = `This posting is ${similarity}% similar to one you used on ` +
+            `${new Date(offer.created_at).toLocaleDateString()}. ` +
+            `Reuse its results for: ${offer.steps.join(', ')}?`;
+        if (confirm(question)) {
+            callBackendForContent(null, '/reuse-run/', { run_id: offer.run_id }, actionKey('reuse'));
+        } else {
+            callBackendForContent(null, '/generate-step/', { job_description: jobDescription, ignore_duplicates: true });
+        }
+    }
+
+    function appendStaticStep(step) {
+        const section = document.createElement('section');
+        section.classList.add('step-block');
+        const title = document.createElement('h2');
+        title.classList.add('step-title');
+        title.textContent = step.step;
+        section.appendChild(title);
+        const content = document.createElement('div');
+        content.classList.add('step-content');
+        content.appendChild(renderOutput(step.output));
+        section.appendChild(content);
+        document.getElementById('dynamic-steps').appendChild(section);
+    }
+
+    function renderStep(section, data) {
+        section.replaceChildren();
+        // A new answer is a new state to act on, the next action gets a new key
+        section.dataset.actionKey = newId();
+
+        const title = document.createElement('h2');
+        title.classList.add('step-title');
+        title.textContent = data.step;
+        section.appendChild(title);
+
+        const content = document.createElement('div');
+        content.classList.add('step-content');
+        content.appendChild(renderOutput(stepOptions[data.option_idx]));
+        section.appendChild(content);
+
+        const buttonsLine = document.createElement('div');
+        buttonsLine.classList.add('action-buttons-line');
+        if (data.option_idx > 0) {
+            buttonsLine.appendChild(createButton('Left', ['left-btn', 'same-step-btn']));
+        }
+        buttonsLine.appendChild(createButton('Retry', ['retry-btn', 'same-step-btn']));
+        if (data.option_idx < data.option_count - 1) {
+            buttonsLine.appendChild(createButton('Right', ['right-btn', 'same-step-btn']));
+        }
+        section.appendChild(buttonsLine);
+
+        const nextStepName = document.createElement('h2');
+        nextStepName.classList.add('next-step-name');
+        nextStepName.textContent = data.next_step ? data.next_step : 'Save to .docx';
+        section.appendChild(nextStepName);
+
+        const buttonsNext = document.createElement('div');
+        buttonsNext.classList.add('action-buttons-next');
+        buttonsNext.appendChild(data.next_step ? createButton('Next', ['next-btn']) : createButton('Save', ['save-btn']));
+        section.appendChild(buttonsNext);
+
+        section.dataset.step = data.step;
+        section.dataset.optionIdx = data.option_idx;
+        section.dataset.optionCount = data.option_count;
+        section.dataset.nextStep = data.next_step || '';
+    }
+
+    function renderOutput(value) {
+        // Build the DOM with textContent so the model output is never parsed as HTML
+        if (Array.isArray(value)) {
+            const list = document.createElement('ul');
+            value.forEach(item => {
+                const li = document.createElement('li');
+                li.appendChild(renderOutput(item));
+                list.appendChild(li);
+            });
+            return list;
+        }
+        if (value !== null && typeof value === 'object') {
+            const container = document.createElement('div');
+            Object.entries(value).forEach(([key, item]) => {
+                const field = document.createElement('div');
+                field.classList.add('step-field');
+                const label = document.createElement('strong');
+                label.textContent = key.replace(/_/g, ' ');
+                field.appendChild(label);
+                field.appendChild(renderOutput(item));
+                container.appendChild(field);
+            });
+            return container;
+        }
+        const paragraph = document.createElement('p');
+        paragraph.textContent = value === null ? '' : String(value);
+        return paragraph;
+    }
+
+    function createButton(label, classes) {
+        const button = document.createElement('button');
+        button.classList.add('btn', ...classes);
+        button.textContent = label;
+        return button;
+    }
+
     function showLoadingAnimation() {
         const loadingAnimation = document.createElement('div');
         loadingAnimation.classList.add('loading-animation');
@@ -59,29 +181,86 @@ document.addEventListener('DOMContentLoaded', () => {
         const firstStep = dynamicSteps.length === 1;
         let bodyData = {};
         if (firstStep) {
-            bodyData['job_description'] = setJobDescription();
+            jobDescription = setJobDescription();
+            bodyData['job_description'] = jobDescription;
         }
-        callBackendForContent(event, '/generate-step/', bodyData);
+        callBackendForContent(event, '/generate-step/', bodyData, actionKey('next'));
     }
 
     function retryStep(event) {
+        const idempotencyKey = actionKey('retry');
         const dynamicSteps = document.querySelectorAll('.step-block');
         dynamicSteps[dynamicSteps.length - 1].remove();
         let bodyData = {};
         bodyData['retry'] = true;
-        callBackendForContent(event, '/generate-step/', bodyData);
+        callBackendForContent(event, '/generate-step/', bodyData, idempotencyKey);
+    }
+
+    function newId() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+    }
+
+    function actionKey(action) {
+        // The same action on the same step is sent with the same key, the server runs it once
+        const stepBlocks = document.querySelectorAll('.step-block');
+        const section = stepBlocks[stepBlocks.length - 1];
+        if (!section.dataset.actionKey) {
+            section.dataset.actionKey = newId();
+        }
+        return `${section.dataset.actionKey}:${action}`;
     }
 
     function leftStep(event) {
-        const dynamicSteps = document.querySelectorAll('.step-block');
-        dynamicSteps[dynamicSteps.length - 1].remove();
-        callBackendForContent(event, '/left-step/', {});
+        selectOption(-1);
     }
 
     function rightStep(event) {
-        const dynamicSteps = document.querySelectorAll('.step-block');
-        dynamicSteps[dynamicSteps.length - 1].remove();
-        callBackendForContent(event, '/right-step/', {});
+        selectOption(1);
+    }
+
+    function selectOption(offset) {
+        const stepBlocks = document.querySelectorAll('.step-block');
+        const section = stepBlocks[stepBlocks.length - 1];
+        const optionIdx = Number(section.dataset.optionIdx) + offset;
+        const data = {
+            step: section.dataset.step,
+            option_idx: optionIdx,
+            option_count: Number(section.dataset.optionCount),
+            next_step: section.dataset.nextStep || null,
+        };
+        if (stepOptions[optionIdx] === undefined) {
+            // Not seen by this page yet (e.g. after a reload), ask the server for it
+            section.remove();
+            callBackendForContent(null, offset < 0 ? '/left-step/' : '/right-step/', {});
+            return;
+        }
+        const previous = { ...data, option_idx: Number(section.dataset.optionIdx) };
+        renderStep(section, data);
+        fetch('/select-option/', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': getCookie('csrftoken') // Include CSRF token for POST request
+            },
+            body: JSON.stringify({ option_idx: optionIdx })
+        })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`Selecting option ${optionIdx} failed with ${response.status}`);
+            }
+        })
+        .catch(error => {
+            // The server kept the previous option and builds the next step from it, so the
+            // page shows it again, unless another switch has been rendered since
+            if (section.isConnected && Number(section.dataset.optionIdx) === optionIdx) {
+                renderStep(section, previous);
+            }
+            showErrorMessage();
+            console.error('Error:', error);
+        });
     }
 
     function saveStep(event) {
@@ -112,28 +291,71 @@ document.addEventListener('DOMContentLoaded', () => {
         );
     }
 
-    function callBackendForContent(event, endPoint, bodyData){
+    function callBackendForContent(event, endPoint, bodyData, idempotencyKey){
         // Remove previous buttons and text
         document.querySelectorAll('.action-buttons-next, .action-buttons-line, .next-step-name').forEach(el => el.remove());
         // Show loading animation
         showLoadingAnimation();
+        // The server cancels the step this one replaces, only its late answer is dropped here
+        if (pendingRequest) {
+            pendingRequest.controller.abort();
+        }
+        const request = {
+            controller: new AbortController(),
+            heartbeat: setInterval(() => postBeacon('/heartbeat-step/'), HEARTBEAT_MS),
+        };
+        pendingRequest = request;
+        const headers = {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': getCookie('csrftoken') // Include CSRF token for POST request
+        };
+        if (idempotencyKey) {
+            headers['Idempotency-Key'] = idempotencyKey;
+        }
         fetch(endPoint, {
             method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-                'X-CSRFToken': getCookie('csrftoken') // Include CSRF token for POST request
-            },
-            body: JSON.stringify(bodyData)
+            headers: headers,
+            body: JSON.stringify(bodyData),
+            signal: request.controller.signal,
         })
         .then(response => response.json())
-        .then(data => createDynamicSection(data))
+        .then(data => {
+            // A cancelled step was replaced by a newer request, which renders its own answer
+            if (!data.cancelled) {
+                createDynamicSection(data);
+            }
+        })
         .catch(error => {
+            if (error.name === 'AbortError') {
+                return;
+            }
             hideLoadingAnimation();
             showErrorMessage();
             console.error('Error:', error);
+        })
+        .finally(() => {
+            clearInterval(request.heartbeat);
+            if (pendingRequest === request) {
+                pendingRequest = null;
+            }
         });
     }
 
+    function postBeacon(endPoint) {
+        // sendBeacon cannot set headers, Django also reads the CSRF token from the form
+        const form = new FormData();
+        form.append('csrfmiddlewaretoken', getCookie('csrftoken') || '');
+        navigator.sendBeacon(endPoint, form);
+    }
+
+    // Closing the tab or navigating away cancels the step at once instead of at the end
+    // of its lease
+    window.addEventListener('pagehide', () => {
+        if (pendingRequest) {
+            postBeacon('/abort-step/');
+        }
+    });
+
     const dynamicSteps = document.getElementById('dynamic-steps');
 
     // Event delegation for dynamically created buttons
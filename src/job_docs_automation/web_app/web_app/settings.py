@@ -80,9 +80,49 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Reuse each thread's connection instead of reconnecting per request
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # WAL lets readers run concurrently with the single writer
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA temp_store=MEMORY;'
+                'PRAGMA cache_size=-20000;'
+            ),
+            # Take the write lock at BEGIN so concurrent writers wait instead of failing
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
+# Sessions are stored in the database. With a single server process, or sticky sessions,
+# JDA_WRITE_BEHIND_SESSIONS=1 serves active sessions from an in-process LRU written to the
+# database in batches, see apps/jda/session_backend.py
+SESSION_ENGINE = (
+    'apps.jda.session_backend'
+    if os.getenv("JDA_WRITE_BEHIND_SESSIONS") == "1"
+    else 'django.contrib.sessions.backends.db'
+)
+JDA_SESSION_CACHE_SIZE = 2000
+JDA_SESSION_FLUSH_INTERVAL = 0.5
+# Step results are stored in their binary form, see apps/jda/session_serializer.py
+SESSION_SERIALIZER = 'apps.jda.session_serializer.StepResultSerializer'
+# Steps in flight without a heartbeat of their page for this many seconds are cancelled,
+# the page sends one every 5 seconds, see apps/jda/views.py:heartbeat_step. 0 disables
+# the lease. Steps in flight are tracked per process, so only set it, e.g. to 15, with a
+# single server process or sticky sessions: a heartbeat or an abort served by another
+# process does not reach the step
+JDA_STEP_LEASE = float(os.getenv("JDA_STEP_LEASE", "0"))
+# Seconds the response of a request with an Idempotency-Key is shared with its duplicates
+# in memory, after that they are answered from the session, see apps/jda/idempotency.py
+JDA_IDEMPOTENCY_TTL = 30
+# Seconds a duplicate waits for the request in flight before getting a 409, about the
+# longest a step call can take
+JDA_IDEMPOTENCY_WAIT = float(os.getenv("JDA_LLM_TIMEOUT", "120"))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -143,4 +183,16 @@ AUTHENTICATION_BACKENDS = (
     'allauth.account.auth_backends.AuthenticationBackend',
 )
 LOGIN_REDIRECT_URL = '/profile/'
-LOGOUT_REDIRECT_URL = '/'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/'
+
+# Prompt and completion tokens a user may use per hour and per day, 0 for no limit. The
+# usage ledger is summed by `manage.py rollup_usage --every 60`, see apps/jda/usage.py
+JDA_HOURLY_TOKEN_QUOTA = int(os.getenv("JDA_HOURLY_TOKEN_QUOTA", "0"))
+JDA_DAILY_TOKEN_QUOTA = int(os.getenv("JDA_DAILY_TOKEN_QUOTA", "0"))
+
+# Minimum estimated similarity for a posting to count as a near-duplicate of an earlier run
+JDA_DUPLICATE_THRESHOLD = 0.8
+
+# Pipeline manifest (see core/manifest.py), by default the legacy inputs/ and prompts/
+# directories of the working directory are read
+JDA_PIPELINE = os.getenv("JDA_PIPELINE")
@@ -15,15 +15,20 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from apps.jda.views import (
+    abort_step,
     edit_cover_letter,
     generate_cover_letter,
     generate_step_cover_letter,
+    heartbeat_step,
     left_step,
     list_cover_letters,
     login_page,
+    metrics_view,
     profile_view,
+    reuse_run,
     right_step,
     save_step,
+    select_step_option,
 )
 from django.contrib import admin
 from django.urls import include, path
@@ -38,7 +43,12 @@ urlpatterns = [
     path('generate-step/', generate_step_cover_letter, name='generate_step_cover_letter'),
     path('left-step/', left_step, name='left_step'),
     path('right-step/', right_step, name='right_step'),
+    path('reuse-run/', reuse_run, name='reuse_run'),
+    path('select-option/', select_step_option, name='select_step_option'),
     path('save-step/', save_step, name='save_step'),
+    path('abort-step/', abort_step, name='abort_step'),
+    path('heartbeat-step/', heartbeat_step, name='heartbeat_step'),
     path('cover-letters/edit/<int:pk>/', edit_cover_letter, name='edit_cover_letter'),
     path('login_page/', login_page, name='login_page'),
+    path('metrics', metrics_view, name='metrics'),
 ]
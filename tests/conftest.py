@@ -7,4 +7,10 @@
     - https://docs.pytest.org/en/stable/writing_plugins.html
 """
 
-# import pytest
+import os
+import sys
+
+# The core modules import each other as top-level modules, the same way the
+# Django app sees them (see ``CORE_DIR`` in web_app/settings.py)
+CORE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../src/job_docs_automation/core"))
+sys.path.append(CORE_DIR)
@@ -0,0 +1,95 @@
+import pytest
+from backend import Prompt, check_user_independent, execute_step, replace_placeholders
+from step_cache import MemorySharedCache
+
+__author__ = "Javier Moralejo Piñas"
+__copyright__ = "Javier Moralejo Piñas"
+__license__ = "MIT"
+
+SCHEMA = {
+    "type": "object",
+    "properties": {"reason": {"type": "string"}, "company": {"type": "string"}},
+    "required": ["reason", "company"],
+    "additionalProperties": False,
+}
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "fake")
+    monkeypatch.setenv("JDA_FAKE_LLM", "1")
+    monkeypatch.setenv("JDA_FAKE_LLM_LATENCY", "0")
+
+
+def test_replace_placeholders():
+    replacements = {"company": {"name": "Acme", "tags": ["a", "b"]}, "job": "Engineer"}
+    text = "<job> at <company.name> (<company.tags.1>)"
+    assert replace_placeholders(text, replacements) == "Engineer at Acme (b)"
+
+
+def test_check_user_independent():
+    find_company = Prompt("find_company", "", "<job_description>", SCHEMA, user_independent=True)
+    summary = Prompt("summary", "", "<find_company.company>", SCHEMA, user_independent=True)
+    check_user_independent([find_company, summary])
+
+    letter = Prompt("letter", "", "<experience> <find_company.company>", SCHEMA)
+    uses_letter = Prompt("uses_letter", "", "<letter.company>", SCHEMA, user_independent=True)
+    with pytest.raises(ValueError, match="uses_letter"):
+        check_user_independent([find_company, letter, uses_letter])
+
+
+def test_shared_cache_across_users(fake_llm):
+    prompts = [Prompt("find_company", "", "Posting: <job_description>", SCHEMA, True)]
+    cache = MemorySharedCache()
+    first = {"job_description": "Acme is hiring"}
+    second = {"job_description": "  ACME is\nhiring "}
+    execute_step(0, prompts, first, shared_cache=cache)
+    assert "reason" not in first["find_company"]
+    # Same posting with different formatting is served from the cache
+    cache.set = None  # type: ignore[assignment]
+    execute_step(0, prompts, second, shared_cache=cache)
+    assert second["find_company"] == first["find_company"]
+
+
+def test_relevant_placeholder_keeps_top_chunks():
+    experience = "\n".join(
+        [
+            "- Built Spark and Airflow pipelines",
+            "- Organised a photography club",
+            "- Designed Snowflake warehouse models",
+            "- Sang in a choir",
+        ]
+    )
+    replacements = {"experience": experience, "job_description": "Airflow, Spark and Snowflake"}
+    text = replace_placeholders("<experience|relevant:2>", replacements)
+    assert text == "- Built Spark and Airflow pipelines\n\n- Designed Snowflake warehouse models"
+    assert replace_placeholders("<experience|relevant:4>", replacements) == experience
+    with pytest.raises(ValueError, match="Unknown placeholder filter"):
+        replace_placeholders("<experience|shortest>", replacements)
+
+
+def test_prefix_stable_layout_hits_prompt_cache(fake_llm):
+    prompt = Prompt(
+        "write_cover_letter",
+        "Write a cover letter.",
+        "Job:\n<job_description>\n\nExperience:\n<experience>\n\nCompany: <find_company.company>",
+        SCHEMA,
+    )
+    assert prompt.split_input({"job_description", "find_company"}) == (
+        "Experience:\n<experience>",
+        "Job:\n<job_description>\n\nCompany: <find_company.company>",
+    )
+    experience = "- Built data pipelines with Airflow and Spark\n" * 200
+    usages = []
+    for job in ("Data engineer at Acme", "Analytics engineer at Initech"):
+        replacements = {
+            "job_description": job,
+            "experience": experience,
+            "find_company": {"company": job.split()[-1]},
+        }
+        usage = {}
+        execute_step(1, [Prompt("find_company", "", "", SCHEMA), prompt], replacements, usage=usage)
+        usages.append(usage)
+    assert usages[0]["cached_tokens"] == 0
+    # Only the job-specific tail differs, so the profile is served from the cache
+    assert usages[1]["cached_tokens"] >= len(experience) // 4 - 128
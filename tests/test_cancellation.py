@@ -0,0 +1,65 @@
+import threading
+import time
+
+import pytest
+
+from backend import Prompt, execute_step
+from cancellation import CancelRegistry, Cancelled, CancelToken
+from metrics import LLM_CANCELLATIONS
+
+__author__ = "Javier Moralejo Piñas"
+__copyright__ = "Javier Moralejo Piñas"
+__license__ = "MIT"
+
+SCHEMA = {
+    "type": "object",
+    "properties": {"text": {"type": "string"}},
+    "required": ["text"],
+    "additionalProperties": False,
+}
+
+
+def test_token_lease_and_registry():
+    now = [0.0]
+    token = CancelToken("letter", lease=15, clock=lambda: now[0])
+    now[0] = 10.0
+    token.renew()
+    now[0] = 20.0
+    assert not token.cancelled
+    now[0] = 40.0
+    assert token.cancelled and token.reason == "disconnected"
+    with pytest.raises(Cancelled):
+        token.raise_if_cancelled()
+
+    registry = CancelRegistry()
+    first = registry.start("session", "letter")
+    second = registry.start("session", "letter")
+    assert first.reason == "superseded" and not second.cancelled
+    registry.finish("session", first)
+    assert registry.heartbeat("session")
+    assert registry.cancel("session") and second.reason == "aborted"
+    assert not registry.cancel("session") and len(registry) == 0
+
+
+def test_cancel_stops_the_call(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "fake")
+    monkeypatch.setenv("JDA_FAKE_LLM", "1")
+    monkeypatch.setenv("JDA_FAKE_LLM_LATENCY", "2")
+    prompts = [Prompt("letter", "Write a letter.", "<job_description>", SCHEMA)]
+    replacements = {"job_description": "Engineer at Acme"}
+    token = CancelToken("letter")
+    before = LLM_CANCELLATIONS.value(prompt="letter", reason="aborted")
+    threading.Timer(0.1, token.cancel).start()
+
+    start = time.perf_counter()
+    with pytest.raises(Cancelled):
+        execute_step(0, prompts, replacements, cancel=token)
+    assert time.perf_counter() - start < 1
+    assert "letter" not in replacements
+    assert LLM_CANCELLATIONS.value(prompt="letter", reason="aborted") == before + 1
+
+    # Without cancellation the streamed output is the same as the plain one
+    monkeypatch.setenv("JDA_FAKE_LLM_LATENCY", "0")
+    usage = {}
+    assert execute_step(0, prompts, replacements, usage=usage, cancel=CancelToken()) is not None
+    assert replacements["letter"]["text"] and usage["prompt_tokens"] > 0
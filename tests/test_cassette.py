@@ -0,0 +1,44 @@
+import pytest
+
+from backend import Prompt
+from cassette import CassetteMiss
+from runner import run_pipeline
+
+__author__ = "Javier Moralejo Piñas"
+__copyright__ = "Javier Moralejo Piñas"
+__license__ = "MIT"
+
+
+def schema(field):
+    return {
+        "type": "object",
+        "properties": {field: {"type": "string"}},
+        "required": [field],
+        "additionalProperties": False,
+    }
+
+
+PROMPTS = [
+    Prompt("find_company", "Find the company.", "<job_description>", schema("company")),
+    Prompt("letter", "Write a letter.", "<find_company.company>", schema("text")),
+]
+
+
+def test_record_then_replay_offline(tmp_path, monkeypatch):
+    path = str(tmp_path / "calls.jsonl.gz")
+    monkeypatch.setenv("OPENAI_API_KEY", "fake")
+    monkeypatch.setenv("JDA_CASSETTE", path)
+    monkeypatch.setenv("JDA_CASSETTE_MODE", "record")
+    monkeypatch.setenv("JDA_FAKE_LLM", "1")
+    monkeypatch.setenv("JDA_FAKE_LLM_LATENCY", "0")
+    recorded = run_pipeline(PROMPTS, {"job_description": "Engineer at Acme"}, parallel=2)
+
+    # Replays need neither the API nor the fake LLM
+    monkeypatch.setenv("JDA_CASSETTE_MODE", "replay")
+    monkeypatch.delenv("JDA_FAKE_LLM")
+    replayed = run_pipeline(PROMPTS, {"job_description": "Engineer at Acme"}, parallel=2)
+    assert replayed.outputs == recorded.outputs
+    assert replayed.usage == recorded.usage
+
+    with pytest.raises(CassetteMiss, match="not in cassette"):
+        run_pipeline(PROMPTS, {"job_description": "Analyst at Initech"})
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+import runner
+from backend import Prompt
+from checkpoint import MAGIC, Checkpoint, checkpoint_path, read_checkpoint
+from runner import run_pipeline
+from step_result import StepResult
+
+__author__ = "Javier Moralejo Piñas"
+__copyright__ = "Javier Moralejo Piñas"
+__license__ = "MIT"
+
+
+def schema(field):
+    return {
+        "type": "object",
+        "properties": {field: {"type": "string"}},
+        "required": [field],
+        "additionalProperties": False,
+    }
+
+
+PROMPTS = [
+    Prompt("find_company", "", "<job_description>", schema("company")),
+    Prompt("cover_letter", "", "<experience> <find_company.company>", schema("text")),
+]
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+
+    def fake_execute_step(step, prompts, replacements, shared_cache, usage):
+        name = prompts[step].name
+        calls.append(name)
+        replacements[name] = {"company": "Acme"} if name == "find_company" else {"text": "Hi"}
+        usage["prompt_tokens"] = 10
+        return json.dumps(replacements[name])
+
+    monkeypatch.setattr(runner, "execute_step", fake_execute_step)
+    return calls
+
+
+def test_checkpoint_save_is_atomic(tmp_path):
+    checkpoint = Checkpoint.open("acme/posting", directory=str(tmp_path))
+    assert checkpoint.path == str(tmp_path / "acme_posting.ckpt")
+    checkpoint.save(StepResult.from_output("find_company", {"company": "Acme"}))
+    checkpoint.save(StepResult.from_output("cover_letter", {"text": "Hi " * 200}))
+    # Only the checkpoint is left, the temporary files were renamed over it
+    assert [path.name for path in tmp_path.iterdir()] == ["acme_posting.ckpt"]
+
+    results = read_checkpoint(checkpoint.path)
+    assert results == checkpoint.results
+    assert results["cover_letter"].parsed == {"text": "Hi " * 200}
+
+
+def test_resume_skips_unchanged_steps(tmp_path, calls):
+    inputs = {"job_description": "Acme hires", "experience": "Python"}
+    first = run_pipeline(
+        PROMPTS, dict(inputs), checkpoint=Checkpoint.open("run", directory=str(tmp_path))
+    )
+    assert calls == ["find_company", "cover_letter"] and first.resumed == []
+
+    # A run started without resume overwrites the checkpoint instead of restoring it
+    assert len(Checkpoint.open("run", directory=str(tmp_path))) == 0
+    resumed = run_pipeline(
+        PROMPTS, dict(inputs), checkpoint=Checkpoint.open("run", True, str(tmp_path))
+    )
+    assert calls == ["find_company", "cover_letter"]
+    assert resumed.resumed == ["find_company", "cover_letter"]
+    assert resumed.outputs == first.outputs
+
+    # Only the step whose input changed runs again
+    replacements = {**inputs, "experience": "Go"}
+    changed = run_pipeline(
+        PROMPTS, replacements, checkpoint=Checkpoint.open("run", True, str(tmp_path))
+    )
+    assert calls[2:] == ["cover_letter"] and changed.resumed == ["find_company"]
+
+
+def test_unreadable_checkpoint_starts_empty(tmp_path):
+    path = checkpoint_path("run", str(tmp_path))
+    with open(path, "wb") as file:
+        file.write(MAGIC + b"\xff\xff\x00\x00")
+    with pytest.warns(UserWarning, match="unreadable checkpoint"):
+        checkpoint = Checkpoint.open("run", True, str(tmp_path))
+    assert len(checkpoint) == 0
@@ -0,0 +1,99 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import clients
+import pytest
+from metrics import HTTP_CONNECTIONS, HTTP_REQUESTS
+
+__author__ = "Javier Moralejo Piñas"
+__copyright__ = "Javier Moralejo Piñas"
+__license__ = "MIT"
+
+COMPLETION = {
+    "id": "chatcmpl-1",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4o",
+    "choices": [
+        {
+            "index": 0,
+            "message": {"role": "assistant", "content": "{}"},
+            "finish_reason": "stop",
+        }
+    ],
+    "usage": {"prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4},
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.dumps(COMPLETION).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}/v1"
+    httpd.shutdown()
+    clients.close_clients()
+
+
+def test_clients_share_connections(server, monkeypatch):
+    monkeypatch.delenv("JDA_FAKE_LLM", raising=False)
+    client = clients.get_client("key", base_url=server)
+    assert clients.get_client("key", base_url=server) is client
+    requests = HTTP_REQUESTS.value(status="200")
+    connections = HTTP_CONNECTIONS.value()
+    for _ in range(3):
+        response = client.chat.completions.create(model="gpt-4o", messages=[])
+        assert response.choices[0].message.content == "{}"
+    # A call with its own timeout still goes through the pool of the shared client
+    clients.get_client("key", timeout=5, base_url=server).chat.completions.create(
+        model="gpt-4o", messages=[]
+    )
+    assert HTTP_REQUESTS.value(status="200") - requests == 4
+    assert HTTP_CONNECTIONS.value() - connections == 1
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_clients_are_not_inherited_by_forks(monkeypatch):
+    monkeypatch.setenv("JDA_FAKE_LLM", "1")
+    client = clients.get_client("key")
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.write(write, b"1" if clients.get_client("key") is not client else b"0")
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert os.read(read, 1) == b"1"
+    assert clients.get_client("key") is client
+
+
+def test_http_client_uses_the_types_of_openai():
+    from openai import DefaultHttpxClient, Timeout
+
+    client = clients._create_http_client()
+    try:
+        assert isinstance(client, DefaultHttpxClient)
+        assert isinstance(client.timeout, Timeout)
+        assert (client.timeout.read, client.timeout.connect) == (
+            clients.TIMEOUT,
+            clients.CONNECT_TIMEOUT,
+        )
+    finally:
+        client.close()
@@ -0,0 +1,38 @@
+import json
+
+from decoding import ResponseDecoder, canonical_json
+
+__author__ = "Javier Moralejo Piñas"
+__copyright__ = "Javier Moralejo Piñas"
+__license__ = "MIT"
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "reason": {"type": "string"},
+        "items": {"type": "array", "items": {"$ref": "#/$defs/item"}},
+    },
+    "$defs": {
+        "item": {
+            "type": "object",
+            "properties": {"reason": {"type": "string"}, "name": {"type": "string"}},
+        }
+    },
+}
+
+
+def test_decoder_drops_fields_at_every_level():
+    text = json.dumps({"reason": "r", "items": [{"reason": "r", "name": "ñ"}]})
+    decoded = ResponseDecoder(SCHEMA).decode(text)
+    assert decoded == {"items": [{"name": "ñ"}]}
+    assert canonical_json(decoded) == '{"items":[{"name":"ñ"}]}'
+
+
+def test_decoder_keeps_undeclared_fields():
+    schema = {"type": "object", "properties": {"name": {"type": "string"}}}
+    decoder = ResponseDecoder(schema)
+    assert not decoder.drop
+    assert decoder.decode('{"name": "a", "reason": "b"}') == {"name": "a", "reason": "b"}
+    assert ResponseDecoder(SCHEMA, drop_fields=("name",)).decode(
+        '{"items": [{"name": "a", "reason": "b"}]}'
+    ) == {"items": [{"reason": "b"}]}
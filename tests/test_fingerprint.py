@@ -0,0 +1,40 @@
+from fingerprint import PostingIndex, fingerprint, similarity
+
+__author__ = "Javier Moralejo Piñas"
+__copyright__ = "Javier Moralejo Piñas"
+__license__ = "MIT"
+
+POSTING = """Acme is hiring a Data Engineer, apply at https://acme.com/jobs/42?utm_source=linkedin
+Requirements:
+- Five years of Python and SQL experience
+- Building Airflow and Spark pipelines in production
+- Clear written and spoken communication in English
+We offer remote work, a yearly learning budget and a friendly team."""
+
+REPASTED = """Acme is hiring a  Data Engineer, apply at https://acme.com/jobs/42?utm_source=mail&gclid=x
+Requirements:
+1. Building Airflow and Spark pipelines in production
+2. Clear written and spoken communication in English
+3. Five years of Python and SQL experience
+We offer remote work, a yearly learning budget and a friendly team."""
+
+OTHER = """Globex is looking for a Frontend Developer with React and TypeScript.
+Experience with design systems is a plus. Hybrid position in Berlin."""
+
+
+def test_formatting_changes_keep_the_fingerprint():
+    assert similarity(fingerprint(POSTING), fingerprint(REPASTED)) == 1.0
+    assert similarity(fingerprint(POSTING), fingerprint(OTHER)) < 0.2
+
+
+def test_index_query():
+    index = PostingIndex()
+    index.add(1, fingerprint(POSTING))
+    index.add(2, fingerprint(OTHER))
+    edited = POSTING + "\nVisa sponsorship is available."
+    index.add(3, fingerprint(POSTING))
+    matches = index.query(fingerprint(edited), threshold=0.7)
+    # The same posting indexed twice, the most recent run first
+    assert [run_id for run_id, _ in matches] == [3, 1]
+    assert matches[0][1] == matches[1][1] >= 0.7
+    assert index.query(fingerprint("Completely unrelated text about cooking pasta"), 0.7) == []
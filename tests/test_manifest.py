@@ -0,0 +1,68 @@
+import json
+import os
+
+import pytest
+
+import manifest
+from manifest import ManifestError, load_pipeline
+
+__author__ = "Javier Moralejo Piñas"
+__copyright__ = "Javier Moralejo Piñas"
+__license__ = "MIT"
+
+SCHEMA = {
+    "type": "object",
+    "properties": {"company": {"type": "string"}},
+    "required": ["company"],
+    "additionalProperties": False,
+}
+
+
+def write_manifest(directory, prompts, inputs=None):
+    (directory / "experience.txt").write_text("- Built pipelines", encoding="utf-8")
+    path = directory / "pipeline.json"
+    path.write_text(
+        json.dumps({"inputs": inputs or {"experience": "experience.txt"}, "prompts": prompts}),
+        encoding="utf-8",
+    )
+    return str(path)
+
+
+def test_load_pipeline_orders_and_caches(tmp_path, monkeypatch):
+    (tmp_path / "letter.txt").write_text("<experience> <find_company.company>", encoding="utf-8")
+    path = write_manifest(
+        tmp_path,
+        [
+            {"name": "letter", "input_file": "letter.txt", "schema": SCHEMA, "model": "small"},
+            {"name": "find_company", "input": "<job_description>", "schema": SCHEMA},
+        ],
+    )
+    monkeypatch.chdir("/")
+    inputs, prompts = load_pipeline(path)
+    assert inputs == {"experience": "- Built pipelines"}
+    assert [prompt.name for prompt in prompts] == ["find_company", "letter"]
+    assert prompts[1].model == "small"
+    assert os.path.exists(manifest.bundle_path(path))
+
+    monkeypatch.setattr(manifest, "compile_manifest", None)
+    assert [prompt.name for prompt in load_pipeline(path)[1]] == ["find_company", "letter"]
+    # A changed source file invalidates the bundle
+    (tmp_path / "letter.txt").write_text("<experience> changed", encoding="utf-8")
+    with pytest.raises(TypeError):
+        load_pipeline(path)
+
+
+def test_invalid_manifest_lists_every_error(tmp_path):
+    path = write_manifest(
+        tmp_path,
+        [
+            {"name": "a", "input": "<b.x> <salary>", "schema": SCHEMA},
+            {"name": "b", "input": "<a.x>", "schema": {"type": "object"}},
+        ],
+    )
+    with pytest.raises(ManifestError) as error:
+        load_pipeline(path)
+    messages = "\n".join(error.value.errors)
+    assert "undefined placeholders ['salary']" in messages
+    assert "dependency cycle between prompts ['a', 'b']" in messages
+    assert "prompt 'b': #: object must declare properties" in messages
@@ -0,0 +1,64 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from job_docs_automation.utils import meta_prompt
+
+__author__ = "Javier Moralejo Piñas"
+__copyright__ = "Javier Moralejo Piñas"
+__license__ = "MIT"
+
+
+class StubClient:
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, model, messages):
+        with self.lock:
+            self.calls += 1
+        prompt = messages[1]["content"].split("\n", 1)[1]
+        message = SimpleNamespace(content=prompt.upper())
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def test_improve_prompts_skips_unchanged(tmp_path):
+    for name in ("find_company", "write_letter"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "prompt.txt").write_text(f"find {name}\n", encoding="utf-8")
+    client = StubClient()
+    status = meta_prompt.improve_prompts(str(tmp_path), parallel=2, client=client)
+    assert status == {"find_company": "generated", "write_letter": "generated"}
+    assert (tmp_path / "write_letter" / "prompt.proposed.txt").read_text() == "FIND WRITE_LETTER\n"
+    assert "+FIND WRITE_LETTER" in (tmp_path / "write_letter" / "prompt.diff").read_text()
+
+    (tmp_path / "write_letter" / "prompt.txt").write_text("write a letter\n", encoding="utf-8")
+    status = meta_prompt.improve_prompts(str(tmp_path), client=client)
+    assert status == {"find_company": "cached", "write_letter": "generated"}
+    assert client.calls == 3
+
+
+def test_improve_prompts_keeps_proposals_of_a_failed_batch(tmp_path):
+    for name in ("find_company", "write_letter"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "prompt.txt").write_text(f"find {name}\n", encoding="utf-8")
+
+    class FailingClient(StubClient):
+        def create(self, model, messages):
+            if "find_company" in messages[1]["content"]:
+                raise ConnectionError("connection reset")
+            return super().create(model, messages)
+
+    with pytest.warns(UserWarning, match="find_company: connection reset"):
+        status = meta_prompt.improve_prompts(str(tmp_path), client=FailingClient())
+    assert status == {"find_company": "failed", "write_letter": "generated"}
+    assert not (tmp_path / "find_company" / "prompt.proposed.txt").exists()
+    assert (tmp_path / "write_letter" / "prompt.proposed.txt").read_text() == "FIND WRITE_LETTER\n"
+
+    # The next run only pays for the prompt that failed
+    client = StubClient()
+    status = meta_prompt.improve_prompts(str(tmp_path), client=client)
+    assert status == {"find_company": "generated", "write_letter": "cached"}
+    assert client.calls == 1
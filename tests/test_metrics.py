@@ -0,0 +1,42 @@
+import pytest
+from metrics import Counter, Histogram, Registry, track
+
+__author__ = "Javier Moralejo Piñas"
+__copyright__ = "Javier Moralejo Piñas"
+__license__ = "MIT"
+
+
+def test_histogram_render():
+    """Buckets are cumulative and end with +Inf, _sum and _count"""
+    registry = Registry()
+    histogram = registry.register(Histogram("latency_seconds", "Latency.", ("prompt",), (0.1, 1.0)))
+    histogram.observe(0.05, prompt="a")
+    histogram.observe(0.5, prompt="a")
+    histogram.observe(5, prompt="a")
+    text = registry.render()
+    assert 'latency_seconds_bucket{prompt="a",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{prompt="a",le="1"} 2' in text
+    assert 'latency_seconds_bucket{prompt="a",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{prompt="a"} 3' in text
+    assert "# TYPE latency_seconds histogram" in text
+
+
+def test_counter_label_escaping():
+    registry = Registry()
+    counter = registry.register(Counter("calls_total", "Calls.", ("prompt",)))
+    counter.inc(prompt='say "hi"\n')
+    counter.inc(2, prompt='say "hi"\n')
+    assert counter.value(prompt='say "hi"\n') == 3
+    assert 'calls_total{prompt="say \\"hi\\"\\n"} 3' in registry.render()
+
+
+def test_track_counts_errors():
+    from metrics import IN_FLIGHT, OPERATION_DURATION, OPERATION_ERRORS
+
+    before = OPERATION_DURATION.count(operation="test_op", prompt="p")
+    with pytest.raises(ValueError):
+        with track("test_op", prompt="p"):
+            raise ValueError
+    assert OPERATION_ERRORS.value(operation="test_op", prompt="p") == 1
+    assert OPERATION_DURATION.count(operation="test_op", prompt="p") == before + 1
+    assert IN_FLIGHT.value(operation="test_op") == 0
@@ -0,0 +1,126 @@
+import json
+
+import pytest
+from runner import RunResult
+
+from job_docs_automation.utils import prompt_eval
+
+__author__ = "Javier Moralejo Piñas"
+__copyright__ = "Javier Moralejo Piñas"
+__license__ = "MIT"
+
+
+def schema(field):
+    return {
+        "type": "object",
+        "properties": {field: {"type": "string"}},
+        "required": [field],
+        "additionalProperties": False,
+    }
+
+
+def write_variant(directory, name, letter_input):
+    path = directory / f"{name}.json"
+    path.write_text(
+        json.dumps(
+            {
+                "inputs": {"experience": {"text": "- Built pipelines"}},
+                "prompts": [
+                    {
+                        "name": "find_company",
+                        "input": "<job_description>",
+                        "schema": schema("company"),
+                    },
+                    {"name": "letter", "input": letter_input, "schema": schema("text")},
+                ],
+            }
+        ),
+        encoding="utf-8",
+    )
+    return prompt_eval.Variant(name, str(path))
+
+
+def test_evaluate_variants(tmp_path, monkeypatch):
+    monkeypatch.setenv("JDA_FAKE_LLM", "1")
+    monkeypatch.setenv("JDA_FAKE_LLM_LATENCY", "0")
+    monkeypatch.setenv("OPENAI_API_KEY", "fake")
+    monkeypatch.setenv("JDA_BUNDLE_DIR", str(tmp_path))
+    variants = [
+        write_variant(tmp_path, "short", "<find_company.company>"),
+        write_variant(tmp_path, "long", "<experience>\n\n<find_company.company>"),
+    ]
+    corpus = {"acme": "Data engineer at Acme", "initech": "Analyst at Initech"}
+    cache_path = str(tmp_path / "eval_cache.json")
+
+    records = prompt_eval.evaluate(
+        variants, corpus, parallel=4, cache_path=cache_path, min_words=1, max_words=100
+    )
+    assert set(records["long"]) == {"acme", "initech"}
+    run = records["short"]["acme"]
+    assert run["status"] == "ok" and run["violations"] == []
+    assert run["checks"] == {"no_empty_fields": True, "no_placeholders": True, "length": True}
+    assert run["usage"]["prompt_tokens"] > 0
+
+    summary = prompt_eval.summarize(records)
+    assert summary["short"]["schema_failure_rate"] == 0.0
+    assert summary["long"]["prompt_tokens"] > summary["short"]["prompt_tokens"]
+    report = prompt_eval.format_report(summary)
+    assert report.splitlines()[0] == "| metric | short | long |"
+
+    # Unchanged runs come from the cache
+    again = prompt_eval.evaluate(variants, corpus, cache_path=cache_path)
+    assert all(run.get("cached") for runs in again.values() for run in runs.values())
+
+
+def test_schema_violations():
+    output_schema = {
+        "type": "object",
+        "properties": {
+            "reason": {"type": "string"},
+            "items": {"type": "array", "items": {"$ref": "#/$defs/item"}},
+        },
+        "required": ["reason", "items"],
+        "additionalProperties": False,
+        "$defs": {
+            "item": {"type": "object", "properties": {"n": {"type": "integer"}}, "required": ["n"]}
+        },
+    }
+    defs = {**output_schema["$defs"], "#": output_schema}
+    drop = frozenset({"reason"})
+    assert prompt_eval.schema_violations({"items": [{"n": 1}]}, output_schema, defs, drop) == []
+    assert prompt_eval.schema_violations(
+        {"items": [{"n": "1"}, {}], "extra": 1}, output_schema, defs, drop
+    ) == ["#/items/0/n: expected integer", "#/items/1: missing 'n'", "#: unexpected 'extra'"]
+
+
+def test_failed_runs_keep_the_others(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "fake")
+    monkeypatch.setenv("JDA_BUNDLE_DIR", str(tmp_path))
+    variants = [write_variant(tmp_path, "short", "<find_company.company>")]
+    corpus = {"acme": "Acme", "initech": "Initech", "globex": "Globex"}
+    cache_path = tmp_path / "eval_cache.json"
+
+    class RateLimitError(Exception):
+        pass
+
+    def fake_run_pipeline(prompts, replacements, **kwargs):
+        if replacements["job_description"] == "Initech":
+            raise RateLimitError("slow down")
+        if replacements["job_description"] == "Globex":
+            raise KeyboardInterrupt
+        result = RunResult()
+        result.outputs = {"find_company": {"company": "Acme"}, "letter": {"text": "Dear Acme"}}
+        return result
+
+    monkeypatch.setattr(prompt_eval, "run_pipeline", fake_run_pipeline)
+    with pytest.raises(KeyboardInterrupt):
+        prompt_eval.evaluate(variants, corpus, parallel=1, cache_path=str(cache_path))
+    # The run that completed before the interruption is cached, the failed one is not
+    cached = json.loads(cache_path.read_text(encoding="utf-8"))
+    assert [record["status"] for record in cached.values()] == ["ok"]
+
+    del corpus["globex"]
+    records = prompt_eval.evaluate(variants, corpus, parallel=1, cache_path=str(cache_path))
+    assert records["short"]["acme"]["cached"]
+    assert records["short"]["initech"]["status"] == "error"
+    assert records["short"]["initech"]["error"] == "RateLimitError: slow down"
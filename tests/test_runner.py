@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+import runner
+from backend import Prompt
+from runner import OutputDocument, StepError, required_steps, run_documents
+
+__author__ = "Javier Moralejo Piñas"
+__copyright__ = "Javier Moralejo Piñas"
+__license__ = "MIT"
+
+
+def schema(field):
+    return {
+        "type": "object",
+        "properties": {field: {"type": "string"}},
+        "required": [field],
+        "additionalProperties": False,
+    }
+
+
+PROMPTS = [
+    Prompt("find_company", "", "<job_description>", schema("company")),
+    Prompt("analyze_job", "", "<job_description>", schema("requirements")),
+    Prompt("cover_letter", "", "<find_company.company> <analyze_job.requirements>", schema("text")),
+    Prompt("email", "", "<find_company.company>", schema("text")),
+    Prompt("unused", "", "<job_description>", schema("text")),
+]
+
+
+def test_required_steps():
+    assert required_steps(PROMPTS, ["email"]) == ["find_company", "email"]
+    with pytest.raises(KeyError):
+        required_steps(PROMPTS, ["salary"])
+
+
+def test_documents_share_upstream_steps(tmp_path, monkeypatch):
+    calls = []
+    active = []
+    overlap = threading.Event()
+
+    def fake_execute_step(step, prompts, replacements, shared_cache, usage):
+        name = prompts[step].name
+        calls.append(name)
+        active.append(name)
+        if {"cover_letter", "email"} <= set(active):
+            overlap.set()
+        time.sleep(0.05)
+        active.remove(name)
+        replacements[name] = {"text": f"{name} text"}
+        return "{}"
+
+    monkeypatch.setattr(runner, "execute_step", fake_execute_step)
+    documents = [
+        OutputDocument("cover_letter", "cover_letter", "text"),
+        OutputDocument("email", "email", "json"),
+    ]
+    result = run_documents(PROMPTS, {}, documents, str(tmp_path), "acme", parallel=4)
+    assert sorted(calls) == ["analyze_job", "cover_letter", "email", "find_company"]
+    # The email only waits for the company, so it runs while the letter is generated or earlier
+    assert calls.index("email") < calls.index("cover_letter") or overlap.is_set()
+    assert result.documents == {
+        "cover_letter": str(tmp_path / "acme-cover_letter.txt"),
+        "email": str(tmp_path / "acme-email.json"),
+    }
+    assert (tmp_path / "acme-cover_letter.txt").read_text(encoding="utf-8") == "cover_letter text"
+
+
+def test_failed_step_raises(monkeypatch):
+    monkeypatch.setattr(runner, "execute_step", lambda *args: None)
+    with pytest.raises(StepError, match="find_company"):
+        run_documents(PROMPTS, {}, [OutputDocument("email", "email")], ".", "acme")
+
+
+def test_parallel_zero_runs_in_calling_thread(monkeypatch):
+    threads = set()
+
+    def fake_execute_step(step, prompts, replacements, shared_cache, usage):
+        threads.add(threading.current_thread())
+        replacements[prompts[step].name] = {"text": "ok"}
+        return "{}"
+
+    monkeypatch.setattr(runner, "execute_step", fake_execute_step)
+    result = runner.run_pipeline(PROMPTS, {}, parallel=0, targets=["cover_letter"])
+    assert threads == {threading.current_thread()}
+    assert list(result.outputs) == ["find_company", "analyze_job", "cover_letter"]
+
+
+def test_threads_get_their_own_replacements(monkeypatch):
+    seen = {}
+
+    def fake_execute_step(step, prompts, replacements, shared_cache, usage):
+        name = prompts[step].name
+        seen[name] = replacements
+        time.sleep(0.01)
+        replacements[name] = {"text": name}
+        return "{}"
+
+    monkeypatch.setattr(runner, "execute_step", fake_execute_step)
+    replacements = {"job_description": "Acme"}
+    runner.run_pipeline(PROMPTS, replacements, parallel=4, targets=["cover_letter", "email"])
+    # Sibling steps never see each other's outputs being added, only those they depend on
+    assert all(inputs is not replacements for inputs in seen.values())
+    assert "analyze_job" not in seen["find_company"]
+    assert {"find_company", "analyze_job"} <= set(seen["cover_letter"])
+    assert set(replacements) == {"job_description", *seen}
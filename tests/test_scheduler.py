@@ -0,0 +1,153 @@
+import threading
+import time
+
+import pytest
+from cancellation import Cancelled, CancelToken
+from metrics import QUEUE_WAIT
+from scheduler import BATCH, INTERACTIVE, PREFETCH, FairScheduler, RateLimiter, current_work, work
+
+__author__ = "Javier Moralejo Piñas"
+__copyright__ = "Javier Moralejo Piñas"
+__license__ = "MIT"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_rate_limiter_spreads_requests():
+    clock = Clock()
+    limiter = RateLimiter(requests_per_minute=60, clock=clock, sleep=clock.sleep)
+    # The bucket starts full, then each request waits for one second of refill
+    assert [limiter.reserve() for _ in range(60)] == [0.0] * 60
+    assert [limiter.reserve() for _ in range(3)] == [1.0, 2.0, 3.0]
+    clock.now = 10.0
+    assert limiter.reserve() == 0.0
+
+
+def test_rate_limiter_tokens():
+    clock = Clock()
+    limiter = RateLimiter(tokens_per_minute=6000, clock=clock, sleep=clock.sleep)
+    assert limiter.acquire(5000) == 0.0
+    assert limiter.acquire(2000) == 10.0
+    assert clock.now == 10.0
+    # Larger than the bucket, waits for a full bucket instead of forever
+    assert limiter.acquire(50000) == 60.0
+    assert RateLimiter().acquire(10**9) == 0.0
+
+
+def queue_calls(scheduler, calls):
+    # Queues the calls one after the other, each releases its slot once served
+    order = []
+    threads = []
+
+    def call(user, priority, cost):
+        scheduler.acquire(user, priority, cost)
+        order.append(user)
+        scheduler.release(user)
+
+    for idx, (user, priority, cost) in enumerate(calls):
+        thread = threading.Thread(target=call, args=(user, priority, cost))
+        thread.start()
+        threads.append(thread)
+        while scheduler.queued() < idx + 1:
+            time.sleep(0.001)
+    return order, threads
+
+
+def test_fair_scheduler_priorities():
+    scheduler = FairScheduler(concurrency=1)
+    before = QUEUE_WAIT.count(priority=BATCH)
+    scheduler.acquire("holder", INTERACTIVE)
+    order, threads = queue_calls(
+        scheduler, [("batch", BATCH, 1), ("prefetch", PREFETCH, 1), ("interactive", INTERACTIVE, 1)]
+    )
+    scheduler.release("holder")
+    for thread in threads:
+        thread.join()
+    assert order == ["interactive", "prefetch", "batch"]
+    assert QUEUE_WAIT.count(priority=BATCH) == before + 1
+    assert scheduler.running == 0
+
+
+def test_fair_scheduler_shares_between_users():
+    scheduler = FairScheduler(concurrency=1)
+    scheduler.acquire("holder", BATCH)
+    # The heavy user queued first, the light one still gets every other slot
+    order, threads = queue_calls(
+        scheduler, [("heavy", BATCH, 100)] * 4 + [("light", BATCH, 100)] * 2
+    )
+    scheduler.release("holder")
+    for thread in threads:
+        thread.join()
+    assert order == ["heavy", "light", "heavy", "light", "heavy", "heavy"]
+
+
+def test_fair_scheduler_weights():
+    scheduler = FairScheduler(concurrency=1)
+    scheduler.acquire("holder", BATCH)
+    # Half the weight is twice the cost
+    order, threads = queue_calls(scheduler, [("a", BATCH, 200)] * 2 + [("b", BATCH, 100)] * 4)
+    scheduler.release("holder")
+    for thread in threads:
+        thread.join()
+    assert order == ["b", "a", "b", "b", "a", "b"]
+
+
+def test_fair_scheduler_user_cap():
+    scheduler = FairScheduler(user_concurrency=1)
+    scheduler.acquire("a", INTERACTIVE)
+    assert scheduler.acquire("b", INTERACTIVE) == 0.0
+    order, threads = queue_calls(scheduler, [("a", INTERACTIVE, 1)])
+    assert scheduler.running == 2
+    scheduler.release("a")
+    threads[0].join()
+    assert order == ["a"]
+    scheduler.release("b")
+    assert scheduler.running == 0
+
+
+def test_fair_scheduler_cancelled_call_leaves_queue():
+    scheduler = FairScheduler(concurrency=1)
+    scheduler.acquire("holder", INTERACTIVE)
+    token = CancelToken()
+    errors = []
+
+    def call():
+        try:
+            scheduler.acquire("user", INTERACTIVE, cancel=token)
+        except Cancelled as error:
+            errors.append(error.reason)
+
+    thread = threading.Thread(target=call)
+    thread.start()
+    while scheduler.queued() < 1:
+        time.sleep(0.001)
+    token.cancel("aborted")
+    thread.join()
+    assert errors == ["aborted"]
+    assert scheduler.queued() == 0
+    scheduler.release("holder")
+    assert scheduler.running == 0
+
+
+def test_work_context():
+    assert current_work() == ("", INTERACTIVE, 1.0)
+    with work("eval", BATCH, 2.0):
+        assert current_work() == ("eval", BATCH, 2.0)
+        scheduler = FairScheduler(concurrency=1)
+        with scheduler.slot(10) as waited:
+            assert waited == 0.0
+            assert scheduler.running == 1
+        assert scheduler.running == 0
+    assert current_work() == ("", INTERACTIVE, 1.0)
+    with pytest.raises(ValueError):
+        with work("user", "urgent"):
+            pass
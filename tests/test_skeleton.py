@@ -1,25 +1,108 @@
+import json
+
 import pytest
 
-from job_docs_automation.skeleton import fib, main
+from job_docs_automation.skeleton import main, parse_args, posting_stems
 
 __author__ = "Javier Moralejo Piñas"
 __copyright__ = "Javier Moralejo Piñas"
 __license__ = "MIT"
 
 
-def test_fib():
-    """API Tests"""
-    assert fib(1) == 1
-    assert fib(2) == 1
-    assert fib(7) == 13
-    with pytest.raises(AssertionError):
-        fib(-10)
+def schema(field):
+    return {
+        "type": "object",
+        "properties": {field: {"type": "string"}},
+        "required": [field],
+        "additionalProperties": False,
+    }
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "fake")
+    monkeypatch.setenv("JDA_FAKE_LLM", "1")
+    monkeypatch.setenv("JDA_FAKE_LLM_LATENCY", "0")
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "posting.txt").write_text("Acme hires a data engineer", encoding="utf-8")
+    path = tmp_path / "pipeline.json"
+    path.write_text(
+        json.dumps(
+            {
+                "inputs": {"experience": {"text": "- Built pipelines"}},
+                "prompts": [
+                    {
+                        "name": "find_company",
+                        "input": "<job_description>",
+                        "schema": schema("company"),
+                    },
+                    {
+                        "name": "write_letter",
+                        "input": "<experience>\n\n<find_company.company>",
+                        "schema": schema("letter"),
+                    },
+                ],
+            }
+        ),
+        encoding="utf-8",
+    )
+    return str(path)
+
 
+def test_parse_args():
+    args = parse_args(
+        ["generate", "posting.txt", "--parallel", "2", "--no-cache", "--format", "json"]
+    )
+    assert (args.command, args.parallel, args.cache, args.format) == ("generate", 2, False, "json")
+    with pytest.raises(SystemExit):
+        parse_args(["generate", "posting.txt", "--format", "pdf"])
 
-def test_main(capsys):
+
+def test_generate(pipeline, tmp_path, capsys):
     """CLI Tests"""
-    # capsys is a pytest fixture that allows asserts against stdout/stderr
-    # https://docs.pytest.org/en/stable/capture.html
-    main(["7"])
-    captured = capsys.readouterr()
-    assert "The 7-th Fibonacci number is 13" in captured.out
+    main(["generate", "posting.txt", "--pipeline", pipeline, "--format", "json", "-o", "out"])
+    assert "Document saved to outputs/out.json" in capsys.readouterr().out
+    output = json.loads((tmp_path / "outputs" / "out.json").read_text(encoding="utf-8"))
+    assert list(output) == ["letter"]
+
+
+def test_batch_and_bench(pipeline, tmp_path, capsys):
+    main(
+        ["batch", "posting.txt", "--pipeline", pipeline, "--format", "text", "--output-dir", "docs"]
+    )
+    assert (tmp_path / "docs" / "posting.txt").read_text(encoding="utf-8")
+    main(["bench", "--pipeline", pipeline, "--runs", "2", "--model", "small"])
+    report = capsys.readouterr().out
+    assert "write_letter" in report and "2 runs in" in report
+
+
+def test_generate_resume(pipeline, tmp_path, capsys):
+    args = ["generate", "posting.txt", "--pipeline", pipeline, "--format", "json"]
+    main(args)
+    assert (tmp_path / ".jda_checkpoints" / "posting.ckpt").exists()
+    capsys.readouterr()
+    main(args + ["--resume"])
+    out = capsys.readouterr().out
+    assert "Restored from the checkpoint: find_company, write_letter" in out
+    assert "Document saved to outputs/posting.json" in out
+
+
+def test_posting_stems():
+    paths = ["a/acme.txt", "b/acme.txt", "acme-2.txt", "c/acme.md", "-"]
+    assert posting_stems(paths) == ["acme", "acme-2", "acme-2-2", "acme-3", "stdin"]
+
+
+def test_batch_postings_with_the_same_name(pipeline, tmp_path):
+    for directory in ("a", "b"):
+        (tmp_path / directory).mkdir()
+        (tmp_path / directory / "posting.txt").write_text(f"{directory} hires", encoding="utf-8")
+    main(["batch", "a/posting.txt", "b/posting.txt", "--pipeline", pipeline, "--format", "json"])
+    assert sorted(path.name for path in (tmp_path / "outputs").iterdir()) == [
+        "posting-2.json",
+        "posting.json",
+    ]
+
+
+def test_profile_sees_the_steps(pipeline, capsys):
+    main(["bench", "--pipeline", pipeline, "--runs", "1", "--profile"])
+    assert "(run_step)" in capsys.readouterr().err
@@ -0,0 +1,64 @@
+import pytest
+
+from backend import Prompt
+from step_result import StepResult, step_input_hash
+
+__author__ = "Javier Moralejo Piñas"
+__copyright__ = "Javier Moralejo Piñas"
+__license__ = "MIT"
+
+SCHEMA = {
+    "type": "object",
+    "properties": {"text": {"type": "string"}},
+    "required": ["text"],
+    "additionalProperties": False,
+}
+
+
+def test_step_result_round_trip():
+    usage = {"prompt_tokens": 120, "completion_tokens": 30, "cached_tokens": 64}
+    output = '{"text":"Dear señora"}'.encode("utf-8")
+    result = StepResult("letter", output, usage, 1.5, "gpt", b"\x01" * 16)
+
+    restored = StepResult.from_bytes(result.to_bytes())
+    assert restored == result
+    assert (restored.prompt, restored.model, restored.latency) == ("letter", "gpt", 1.5)
+    assert restored.usage == usage and restored.input_hash == b"\x01" * 16
+    assert restored.output_json == output
+    assert restored.parsed == {"text": "Dear señora"}
+
+    # Outputs served without a call keep an empty usage
+    cached = StepResult.from_output("letter", {"text": "Hi"})
+    assert cached.output_json == b'{"text":"Hi"}'
+    assert StepResult.from_bytes(cached.to_bytes()).usage == {}
+
+    with pytest.raises(ValueError):
+        StepResult.from_bytes(b"\x07" + result.to_bytes()[1:])
+
+
+def test_step_result_compresses_long_outputs():
+    letter = {"text": "I am writing to apply for the position. " * 50}
+    result = StepResult.from_output("letter", letter)
+    data = result.to_bytes()
+    assert len(data) < len(result.output_json) // 4
+
+    # Read back from a larger buffer, the output stays compressed until it is used
+    restored = StepResult.from_bytes(memoryview(b"padding" + data)[7:])
+    assert restored._output_json is None and restored._parsed is None
+    assert restored.parsed == letter
+    assert restored.to_bytes() == data
+
+
+def test_step_result_has_no_instance_dict():
+    with pytest.raises(AttributeError):
+        StepResult("letter", b"{}").extra = 1
+
+
+def test_step_input_hash():
+    prompt = Prompt("letter", "Write a letter.", "<job_description>", SCHEMA)
+    first = step_input_hash(prompt, {"job_description": "Python developer"})
+    assert len(first) == 16
+    assert first == step_input_hash(prompt, {"job_description": "Python developer", "other": 1})
+    assert first != step_input_hash(prompt, {"job_description": "Go developer"})
+    other_model = Prompt("letter", "Write a letter.", "<job_description>", SCHEMA, model="other")
+    assert first != step_input_hash(other_model, {"job_description": "Python developer"})
@@ -0,0 +1,110 @@
+import pytest
+from strict_schema import StrictSchemaError, lint_schema, normalize_schema, normalize_schemas
+
+__author__ = "Javier Moralejo Piñas"
+__copyright__ = "Javier Moralejo Piñas"
+__license__ = "MIT"
+
+
+def test_normalize_schema_fixes():
+    schema = {
+        "name": "letter",
+        "type": "object",
+        "properties": {
+            "body": {"type": "string", "maxLength": 900},
+            "skills": {
+                "type": "array",
+                "minItems": 1,
+                "items": {"$ref": "#/properties/skills/$defs/skill"},
+                "$defs": {"skill": {"type": "object", "properties": {"name": {"type": "string"}}}},
+            },
+        },
+        "required": ["body"],
+    }
+    normalized, fixes = normalize_schema(schema, mode="fix")
+    assert "name" not in normalized
+    assert normalized["required"] == ["body", "skills"]
+    assert normalized["additionalProperties"] is False
+    assert "maxLength" not in normalized["properties"]["body"]
+    skills = normalized["properties"]["skills"]
+    assert "minItems" not in skills and "$defs" not in skills
+    assert skills["items"] == {"$ref": "#/$defs/skill"}
+    assert normalized["$defs"]["skill"]["required"] == ["name"]
+    assert normalized["$defs"]["skill"]["additionalProperties"] is False
+    assert len(fixes) == 9
+    # The input is left untouched
+    assert schema["required"] == ["body"]
+
+
+def test_normalize_schema_errors():
+    with pytest.raises(StrictSchemaError) as error:
+        normalize_schema(
+            {
+                "type": "object",
+                "properties": {"a": {"$ref": "#/$defs/missing"}, "b": {"type": "object"}},
+            }
+        )
+    assert error.value.errors == [
+        "#/properties/a: unresolved $ref #/$defs/missing",
+        "#/properties/b: object must declare properties",
+    ]
+
+
+def test_normalize_schemas_reject_mode():
+    strict = {
+        "type": "object",
+        "properties": {"a": {"type": "string"}},
+        "required": ["a"],
+        "additionalProperties": False,
+    }
+    loose = {"type": "object", "properties": {"a": {"type": "string"}}}
+    schemas, fixes = normalize_schemas({"strict": strict}, mode="reject")
+    assert schemas == {"strict": strict} and fixes == {"strict": []}
+    with pytest.raises(StrictSchemaError) as error:
+        normalize_schemas({"strict": strict, "loose": loose}, mode="reject")
+    assert error.value.errors == [
+        "prompt 'loose': #: required all properties",
+        "prompt 'loose': #: set additionalProperties to false",
+    ]
+
+
+def test_normalize_schema_composition():
+    schema = {
+        "type": "object",
+        "properties": {
+            "contact": {
+                "oneOf": [
+                    {"type": "string", "format": "email"},
+                    {"type": "object", "properties": {"phone": {"type": "string"}}},
+                ]
+            },
+            "tone": {
+                "type": "string",
+                "if": {"const": "formal"},
+                "then": {"maxLength": 10},
+            },
+            "signature": {
+                "allOf": [
+                    {
+                        "type": "object",
+                        "properties": {"name": {"type": "string", "pattern": "^[A-Z]"}},
+                    }
+                ]
+            },
+        },
+    }
+    normalized, fixes, errors = lint_schema(schema)
+    contact = normalized["properties"]["contact"]
+    assert "oneOf" not in contact and "format" not in contact["anyOf"][0]
+    assert contact["anyOf"][1]["additionalProperties"] is False
+    assert "#/properties/contact: rewrote 'oneOf' to 'anyOf'" in fixes
+    branch = normalized["properties"]["signature"]["allOf"][0]
+    assert branch["additionalProperties"] is False and branch["required"] == ["name"]
+    assert branch["properties"]["name"] == {"type": "string"}
+    assert errors == [
+        "#/properties/tone: unsupported 'if'",
+        "#/properties/tone: unsupported 'then'",
+        "#/properties/signature: unsupported 'allOf'",
+    ]
+    with pytest.raises(StrictSchemaError):
+        normalize_schema(schema, mode="fix")
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+import tracing
+
+__author__ = "Javier Moralejo Piñas"
+__copyright__ = "Javier Moralejo Piñas"
+__license__ = "MIT"
+
+
+def read_spans(path):
+    spans = []
+    for line in path.read_text().splitlines():
+        request = json.loads(line)
+        for resource_spans in request["resourceSpans"]:
+            for scope_spans in resource_spans["scopeSpans"]:
+                spans.extend(scope_spans["spans"])
+    return spans
+
+
+def test_nested_spans_are_exported_once(tmp_path, monkeypatch):
+    trace_file = tmp_path / "trace.jsonl"
+    monkeypatch.setattr(tracing, "TRACE_FILE", str(trace_file))
+    monkeypatch.setattr(tracing, "SAMPLE_RATE", 1.0)
+    with tracing.span("run") as root:
+        with tracing.span("llm_call", **{"jda.prompt": "find_company"}):
+            tracing.set_attributes(**{"gen_ai.usage.input_tokens": 12})
+    lines = trace_file.read_text().splitlines()
+    assert len(lines) == 1
+    spans = {span["name"]: span for span in read_spans(trace_file)}
+    assert spans["llm_call"]["parentSpanId"] == root.span_id
+    assert spans["llm_call"]["traceId"] == spans["run"]["traceId"]
+    assert {"key": "gen_ai.usage.input_tokens", "value": {"intValue": "12"}} in spans["llm_call"][
+        "attributes"
+    ]
+
+
+def test_run_trace_across_requests(tmp_path, monkeypatch):
+    trace_file = tmp_path / "trace.jsonl"
+    monkeypatch.setattr(tracing, "TRACE_FILE", str(trace_file))
+    monkeypatch.setattr(tracing, "SAMPLE_RATE", 1.0)
+    trace = tracing.new_trace()
+    for _ in range(2):
+        with tracing.use_trace(trace), tracing.span("view"):
+            pass
+    tracing.end_trace(trace, "generation_run")
+    spans = read_spans(trace_file)
+    assert [span["name"] for span in spans] == ["view", "view", "generation_run"]
+    assert all(span["traceId"] == trace["trace_id"] for span in spans)
+    assert spans[0]["parentSpanId"] == spans[2]["spanId"]
+
+
+def test_errors_and_sampling(tmp_path, monkeypatch):
+    trace_file = tmp_path / "trace.jsonl"
+    monkeypatch.setattr(tracing, "TRACE_FILE", str(trace_file))
+    monkeypatch.setattr(tracing, "SAMPLE_RATE", 1.0)
+    with pytest.raises(ValueError):
+        with tracing.span("failing"):
+            raise ValueError("boom")
+    assert read_spans(trace_file)[0]["status"] == {"code": 2, "message": "ValueError: boom"}
+
+    monkeypatch.setattr(tracing, "SAMPLE_RATE", 0.0)
+    with tracing.span("dropped") as dropped:
+        assert dropped is None
+    assert len(read_spans(trace_file)) == 1